@@ -0,0 +1,70 @@
+"""
+Сравнение пропускной способности: N одиночных вызовов /api/planets против одного пакета.
+
+Оба варианта гоняются через ASGI-приложение в процессе (TestClient, нужен httpx),
+так что в замер входят маршрутизация, валидация и сериализация ответа.
+
+Запуск из корня репозитория:
+    python bench/bench_batch.py --n 500
+    python bench/bench_batch.py --n 500 --same-day   # импорт: много карт на одну дату
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+
+LOCATIONS = [
+    (55.7558, 37.6173, "Europe/Moscow"),
+    (54.3142, 48.4031, "Europe/Ulyanovsk"),
+    (43.2220, 76.8512, "Asia/Almaty"),
+    (28.6139, 77.2090, "Asia/Kolkata"),
+    (40.7128, -74.0060, "America/New_York"),
+]
+
+
+def make_items(n, same_day=False, seed=42):
+    rnd = random.Random(seed)
+    items = []
+    for _ in range(n):
+        lat, lon, tz = rnd.choice(LOCATIONS)
+        if same_day:
+            date = "1990-03-15"
+        else:
+            date = f"{rnd.randint(1960, 2005)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}"
+        time_str = f"{rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}"
+        items.append({"date": date, "time": time_str, "lat": lat, "lon": lon, "timezone": tz})
+    return items
+
+
+def run(n, same_day):
+    items = make_items(n, same_day)
+    client = TestClient(main.app)
+    t0 = time.perf_counter()
+    for it in items:
+        client.get("/api/planets", params=it).raise_for_status()
+    single = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    resp = client.post("/api/planets/batch", json=items)
+    resp.raise_for_status()
+    batch = time.perf_counter() - t0
+
+    print(f"N = {n}{' (одна дата)' if same_day else ''}")
+    print(f"одиночные запросы: {single:.3f} c, {n / single:.0f} карт/с")
+    print(f"пакет:             {batch:.3f} c, {n / batch:.0f} карт/с, ошибок: {resp.json()['errors']}")
+    print(f"ускорение:         x{single / batch:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=500)
+    parser.add_argument("--same-day", action="store_true")
+    args = parser.parse_args()
+    run(args.n, args.same_day)
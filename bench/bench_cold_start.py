@@ -0,0 +1,100 @@
+"""
+Время до первого ответа (TTFR) после холодного старта uvicorn — как после auto_start на Fly.
+
+Сервер запускается отдельным процессом; сразу после старта клиент шлёт /api/planets,
+повторяя попытку, пока порт не откроется. Меряются: открытие порта, первый ответ
+(с момента запуска процесса) и, если есть эндпоинт /ready, момент готовности.
+Каждый режим — несколько запусков, в отчёте медианы.
+
+Запуск из корня репозитория (сравнение с прогревом и без):
+    python bench/bench_cold_start.py --runs 5
+    python bench/bench_cold_start.py --cwd /path/to/old/checkout --modes cold
+"""
+import argparse
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIRST_REQUEST = "/api/planets?date=1990-03-15&time=10:30&lat=55.75&lon=37.62&timezone=Europe/Moscow"
+# Режим -> переменные окружения сервера
+MODES = {
+    "cold": {"WARMUP": "0"},
+    "warmup": {"WARMUP": "1"},
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def get(port: int, path: str, timeout: float = 30.0):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    try:
+        conn.request("GET", path)
+        resp = conn.getresponse()
+        resp.read()
+        return resp.status
+    finally:
+        conn.close()
+
+
+def measure(cwd: str, env: dict, timeout: float):
+    port = free_port()
+    env = {**os.environ, "CHART_CACHE_SIZE": "0", "CHART_CACHE_DB": "", **env}
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+                            cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    result = {}
+    try:
+        while time.perf_counter() - t0 < timeout:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1.0).close()
+                break
+            except OSError:
+                time.sleep(0.005)
+        result["listen_s"] = time.perf_counter() - t0
+        if get(port, FIRST_REQUEST) == 200:
+            result["first_response_s"] = time.perf_counter() - t0
+        while time.perf_counter() - t0 < timeout:
+            status = get(port, "/ready")
+            if status == 404:
+                break
+            if status == 200:
+                result["ready_s"] = time.perf_counter() - t0
+                break
+            time.sleep(0.01)
+        # Второй запрос с другой датой — уже тёплый путь
+        t1 = time.perf_counter()
+        if get(port, FIRST_REQUEST.replace("1990", "1991")) == 200:
+            result["second_response_s"] = time.perf_counter() - t1
+    finally:
+        proc.terminate()
+        proc.wait()
+    return result
+
+
+def run(args):
+    report = {}
+    for mode in args.modes.split(","):
+        env = {**MODES[mode], "CALC_WORKERS": str(args.workers)}
+        runs = [measure(args.cwd, env, args.timeout) for _ in range(args.runs)]
+        report[mode] = {key: statistics.median(r[key] for r in runs) for key in runs[0]}
+        print(f"{mode:<8} " + "  ".join(f"{key} {value * 1000:8.1f} мс" for key, value in report[mode].items()))
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cwd", default=ROOT, help="каталог с main.py (например, старая версия из git worktree)")
+    parser.add_argument("--modes", default="cold,warmup")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1, help="CALC_WORKERS; на Fly shared-cpu-1x — 1")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    run(parser.parse_args())
@@ -0,0 +1,56 @@
+"""
+Замер ленивой генерации Вимшоттари-даши на глубоких уровнях.
+
+Сравнивается запрос окна (periods) с полным построением дерева того же уровня,
+плюс цепочка текущих периодов (current). Эфемериды не нужны — долготы Луны случайные.
+
+Запуск из корня репозитория:
+    python bench/bench_dasha.py --n 2000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dasha  # noqa: E402
+
+BIRTH_JD = 2447965.5  # 1990-03-15
+
+
+def timed(fn, charts):
+    t0 = time.perf_counter()
+    count = 0
+    for vim in charts:
+        count += fn(vim)
+    elapsed = time.perf_counter() - t0
+    return elapsed / len(charts) * 1e6, count / len(charts)
+
+
+def run(n):
+    rnd = random.Random(42)
+    charts = [dasha.Vimshottari(rnd.uniform(0, 360), BIRTH_JD) for _ in range(n)]
+    cases = [
+        ("окно 1 месяц, уровень 5", lambda v: sum(1 for _ in v.periods(BIRTH_JD + 12000, BIRTH_JD + 12030, 5))),
+        ("окно 1 год, уровень 5", lambda v: sum(1 for _ in v.periods(BIRTH_JD + 12000, BIRTH_JD + 12365, 5))),
+        ("окно 10 лет, уровень 4", lambda v: sum(1 for _ in v.periods(BIRTH_JD + 12000, BIRTH_JD + 15652, 4))),
+        ("120 лет, уровень 3", lambda v: sum(1 for _ in v.periods(v.birth_jd, v.birth_jd + v.cycle_days, 3))),
+        ("текущие периоды, уровень 5", lambda v: len(v.current(BIRTH_JD + 12000, 5))),
+    ]
+    print(f"N = {n} карт")
+    for name, fn in cases:
+        us, count = timed(fn, charts)
+        print(f"{name:<28} {us:9.1f} мкс/карта, периодов: {count:.0f}")
+    # Полное дерево 5 уровней — то, чего ленивая генерация избегает
+    full = charts[: max(n // 100, 1)]
+    us, count = timed(lambda v: sum(1 for _ in v.periods(v.start, v.start + v.cycle_days, 5)), full)
+    print(f"{'полное дерево, уровень 5':<28} {us:9.1f} мкс/карта, периодов: {count:.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=2000)
+    args = parser.parse_args()
+    run(args.n)
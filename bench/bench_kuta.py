@@ -0,0 +1,62 @@
+"""
+Замер движка Ашта-кута (kuta.py): один профиль против 100k кандидатов и 1k × 1k.
+
+Сравнивается top-K через группы долей (без матрицы N × M) с наивным путём:
+полная матрица баллов и argpartition. Эфемериды не нужны — долготы Луны случайные.
+
+Запуск из корня репозитория:
+    python bench/bench_kuta.py --top 10
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import kuta  # noqa: E402
+
+
+def timed(fn, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def naive_top(brides, grooms, k: int):
+    scores = kuta.matrix(brides, grooms).ravel()
+    k = min(k, scores.size)
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best], kind="stable")]
+
+
+def run(top: int, repeat: int):
+    rng = np.random.default_rng(42)
+    cases = [
+        ("1 × 100k", 1, 100_000),
+        ("1k × 1k", 1_000, 1_000),
+        ("10k × 10k", 10_000, 10_000),
+    ]
+    for name, n, m in cases:
+        brides = kuta.units(rng.uniform(0, 360, n))
+        grooms = kuta.units(rng.uniform(0, 360, m))
+        print(f"{name}:")
+        print(f"  {'top_pairs':<22} {timed(lambda: kuta.top_pairs(brides, grooms, top), repeat):9.2f} мс")
+        if n * m <= 10_000_000:
+            print(f"  {'полная матрица':<22} {timed(lambda: naive_top(brides, grooms, top), repeat):9.2f} мс"
+                  f"  (матрица {n * m * 8 / 2**20:.1f} МБ)")
+        if n <= 1_000:
+            print(f"  {'top_per_bride':<22} {timed(lambda: kuta.top_per_bride(brides, grooms, top), repeat):9.2f} мс")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run(args.top, args.repeat)
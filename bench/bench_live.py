@@ -0,0 +1,136 @@
+"""
+Нагрузочный тест живого неба (/api/live, SSE): тысячи простаивающих подписчиков на одном инстансе.
+
+Поднимает uvicorn с main:app в отдельном процессе (CALC_WORKERS=0 — весь расчёт в этом же
+процессе, чтобы его CPU было видно целиком) и ступенями подключает подписчиков по сырому
+TCP: часть без места, часть с одним из --places мест (для них считается асцендент).
+На каждой ступени за --window секунд меряется CPU и память сервера (по /proc) и сколько
+кадров дошло до клиентов по сравнению с ожидаемым (подписчики × тики).
+
+Запуск из корня репозитория (нужен ulimit -n больше двух чисел подписчиков):
+    python bench/bench_live.py --steps 0,1000,5000,10000 --interval 1
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / CLK_TCK
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+class Client:
+    """Подписчик: держит соединение и считает пришедшие события sky."""
+
+    def __init__(self):
+        self.frames = 0
+        self.task = None
+
+    async def run(self, port: int, path: str):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: bench\r\nAccept: text/event-stream\r\n\r\n".encode())
+        await writer.drain()
+        try:
+            while True:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    break
+                self.frames += chunk.count(b"event: sky")
+        finally:
+            writer.close()
+
+
+async def wait_ready(port: int, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET /ready HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n")
+            status = (await reader.readline()).split()
+            writer.close()
+            if len(status) > 1 and status[1] == b"200":
+                return
+        except OSError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("сервер не поднялся")
+
+
+async def run(args):
+    port = free_port()
+    env = {**os.environ, "CALC_WORKERS": "0", "LIVE_INTERVAL": str(args.interval),
+           "LIVE_MAX_SUBSCRIBERS": str(max(args.steps) + 100)}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning",
+         "--backlog", "4096", "--timeout-graceful-shutdown", "5"],
+        cwd=ROOT, env=env)
+    clients = []
+    try:
+        await wait_ready(port)
+        print(f"интервал {args.interval} с, мест с асцендентом: {args.places}, окно {args.window} с")
+        print(f"{'подписчиков':>12} {'CPU сервера':>12} {'RSS, МБ':>9} {'кадров дошло':>14}")
+        for target in args.steps:
+            while len(clients) < target:
+                batch = min(500, target - len(clients))
+                for _ in range(batch):
+                    i = len(clients)
+                    place = i % (args.places + 1)
+                    path = "/api/live" if place == 0 else f"/api/live?lat={40 + place * 0.1:.2f}&lon={30 + place * 0.1:.2f}"
+                    client = Client()
+                    client.task = asyncio.create_task(client.run(port, path))
+                    clients.append(client)
+                await asyncio.sleep(0.05)
+            # Даём подключиться и получить первые кадры, затем меряем окно
+            await asyncio.sleep(args.interval * 2)
+            frames0 = sum(c.frames for c in clients)
+            cpu0, t0 = cpu_seconds(server.pid), time.perf_counter()
+            await asyncio.sleep(args.window)
+            cpu = (cpu_seconds(server.pid) - cpu0) / (time.perf_counter() - t0) * 100
+            got = sum(c.frames for c in clients) - frames0
+            expected = len(clients) * args.window / args.interval
+            delivered = f"{got / expected * 100:.0f}%" if expected else "—"
+            print(f"{len(clients):>12} {cpu:>11.1f}% {rss_mb(server.pid):>9.0f} {delivered:>14}")
+        failed = sum(1 for c in clients if c.task.done())
+        if failed:
+            print(f"оборвалось соединений: {failed}")
+    finally:
+        # Сначала закрываем потоки: uvicorn при остановке ждёт открытые соединения
+        for client in clients:
+            client.task.cancel()
+        await asyncio.gather(*(c.task for c in clients), return_exceptions=True)
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", default="0,1000,5000,10000", help="число подписчиков на ступенях")
+    parser.add_argument("--interval", type=float, default=1.0, help="LIVE_INTERVAL сервера, с")
+    parser.add_argument("--places", type=int, default=20, help="сколько разных мест с асцендентом")
+    parser.add_argument("--window", type=float, default=10.0, help="окно замера на ступени, с")
+    args = parser.parse_args()
+    args.steps = [int(x) for x in args.steps.split(",")]
+    asyncio.run(run(args))
@@ -0,0 +1,75 @@
+"""
+Замер движка силы планет (strength.py): Аштакаварга и Шадбала.
+
+1. strength.compute на случайных входах: одна карта и пакеты 1k / 10k / 100k;
+   для сравнения — те же 1k карт по одной (как было бы без векторизации по пакету).
+2. calc_batch (путь /api/planets/batch) в одном процессе: карт в минуту с fields=planets,
+   fields=strength и fields=planets,strength — сколько добавляет секция strength.
+
+Запуск из корня репозитория:
+    python bench/bench_strength.py --batch 1000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import strength  # noqa: E402
+
+
+def timed(fn, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def random_inputs(rng, n: int):
+    return (rng.uniform(0, 360, (n, 7)), rng.uniform(-0.5, 1.5, (n, 7)), rng.uniform(0, 360, n),
+            rng.uniform(2415020, 2488070, n), rng.uniform(-66, 66, n), rng.uniform(-180, 180, n), np.full(n, 24.0))
+
+
+def run_engine(repeat: int):
+    rng = np.random.default_rng(42)
+    print("strength.compute:")
+    for n in (1, 1_000, 10_000, 100_000):
+        inputs = random_inputs(rng, n)
+        seconds = timed(lambda: strength.compute(*inputs), repeat)
+        print(f"  {n:>7} карт  {seconds * 1000:9.2f} мс  {n / seconds * 60:>12,.0f} карт/мин")
+    inputs = random_inputs(rng, 1_000)
+    rows = [tuple(x[i:i + 1] for x in inputs) for i in range(1_000)]
+    seconds = timed(lambda: [strength.compute(*row) for row in rows], repeat)
+    print(f"  {'1000 по одной':>12} {seconds * 1000:9.2f} мс  {1_000 / seconds * 60:>12,.0f} карт/мин")
+
+
+def run_batch(size: int, repeat: int):
+    import main
+
+    rnd = random.Random(1)
+    zones = ("Europe/Moscow", "Asia/Kolkata", "America/New_York", "Europe/London", "Asia/Almaty")
+    items = [
+        main.ChartRequest(date=f"{rnd.randint(1950, 2030)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+                          time=f"{rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}",
+                          lat=rnd.uniform(-60, 65), lon=rnd.uniform(-180, 180), timezone=rnd.choice(zones))
+        for _ in range(size)
+    ]
+    print(f"calc_batch, {size} карт, один процесс:")
+    for fields in (("planets",), ("strength",), ("planets", "strength")):
+        seconds = timed(lambda: main.calc_batch(items, "lahiri", (), fields), repeat)
+        print(f"  fields={','.join(fields):<18} {seconds * 1000:9.1f} мс  {size / seconds * 60:>10,.0f} карт/мин")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run_engine(args.repeat)
+    run_batch(args.batch, args.repeat)
@@ -0,0 +1,326 @@
+"""
+Воспроизводимый набор замеров для API карт: микробенчмарки, нагрузка и сравнение с базовой линией.
+
+Всё работает офлайн: приложение гоняется в процессе через ASGI (httpx.ASGITransport),
+корпус запросов детерминирован (seed) и включает переходы на летнее время
+(несуществующее и неоднозначное местное время) и полярные широты.
+
+Кэш карт по умолчанию отключён (CHART_CACHE_SIZE=0), иначе повторные запросы меряют
+только кэш; расчёт идёт в процессе (CALC_WORKERS=0), если не задано --workers.
+
+Запуск из корня репозитория:
+    python bench/bench_suite.py run --out bench/results/base.json
+    python bench/bench_suite.py run --out bench/results/new.json --compare bench/results/base.json
+    python bench/bench_suite.py compare bench/results/base.json bench/results/new.json --threshold 0.1
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# (широта, долгота, зона)
+LOCATIONS = [
+    (55.7558, 37.6173, "Europe/Moscow"),
+    (54.3142, 48.4031, "Europe/Ulyanovsk"),
+    (43.2220, 76.8512, "Asia/Almaty"),
+    (28.6139, 77.2090, "Asia/Kolkata"),
+    (27.7172, 85.3240, "Asia/Kathmandu"),
+    (40.7128, -74.0060, "America/New_York"),
+    (-33.8688, 151.2093, "Australia/Sydney"),
+    (-43.9535, -176.5597, "Pacific/Chatham"),
+    (51.5074, -0.1278, "Europe/London"),
+]
+POLAR = [
+    (69.6492, 18.9553, "Europe/Oslo"),             # Тромсё: полярный день и ночь
+    (78.2232, 15.6267, "Arctic/Longyearbyen"),
+    (68.9585, 33.0827, "Europe/Moscow"),           # Мурманск
+    (-77.8463, 166.6683, "Antarctica/McMurdo"),
+]
+# Местное время на переходах DST: несуществующее (весна) и неоднозначное (осень)
+DST_EDGES = [
+    ("2010-03-28", "02:30", 55.7558, 37.6173, "Europe/Moscow"),
+    ("2010-10-31", "02:30", 55.7558, 37.6173, "Europe/Moscow"),
+    ("2021-03-14", "02:30", 40.7128, -74.0060, "America/New_York"),
+    ("2021-11-07", "01:30", 40.7128, -74.0060, "America/New_York"),
+    ("2021-03-28", "02:30", 69.6492, 18.9553, "Europe/Oslo"),
+    ("2021-10-31", "02:30", 51.5074, -0.1278, "Europe/London"),
+    ("2021-04-04", "02:30", -33.8688, 151.2093, "Australia/Sydney"),
+    ("2021-10-03", "02:30", -33.8688, 151.2093, "Australia/Sydney"),
+]
+
+# Для каких метрик рост — это регрессия (True) или улучшение (False)
+HIGHER_IS_WORSE = {"us_per_call": True, "p50_ms": True, "p95_ms": True, "p99_ms": True, "rps": False, "peak_rss_mb": True, "tz_index_mb": True}
+
+
+def make_corpus(n: int, seed: int = 42):
+    """n запросов: ~80% обычных дат 1950–2030, ~10% полярных широт, ~10% переходов DST."""
+    rnd = random.Random(seed)
+    corpus = []
+    for _ in range(n):
+        roll = rnd.random()
+        if roll < 0.1:
+            date, time_str, lat, lon, tz = rnd.choice(DST_EDGES)
+        else:
+            lat, lon, tz = rnd.choice(POLAR if roll < 0.2 else LOCATIONS)
+            day = datetime(1950, 1, 1) + timedelta(days=rnd.randrange(80 * 365))
+            date = day.strftime("%Y-%m-%d")
+            time_str = f"{rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}"
+        corpus.append({"date": date, "time": time_str, "lat": lat, "lon": lon, "timezone": tz})
+    return corpus
+
+
+def peak_rss_mb() -> float:
+    """Пиковый RSS процесса и завершённых дочерних процессов (ru_maxrss в Linux — КБ)."""
+    scale = 1 / 1024 / 1024 if sys.platform == "darwin" else 1 / 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return (own + children) * scale
+
+
+def bench(fn, args_list, min_time: float = 0.2, repeat: int = 5):
+    """Медиана времени одного вызова (мкс) по repeat прогонам; аргументы берутся по кругу из args_list."""
+    calls = 1
+    while True:
+        t0 = time.perf_counter()
+        for i in range(calls):
+            fn(*args_list[i % len(args_list)])
+        if time.perf_counter() - t0 >= min_time / 10 or calls >= 1 << 20:
+            break
+        calls *= 2
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for i in range(calls):
+            fn(*args_list[i % len(args_list)])
+        runs.append((time.perf_counter() - t0) / calls * 1e6)
+    return {"us_per_call": statistics.median(runs), "calls": calls, "runs": runs}
+
+
+def run_micro(main, corpus, min_time: float):
+    import pytz
+    import swisseph as swe
+
+    swe.set_sid_mode(swe.SIDM_LAHIRI, 0, 0)
+    charts = [main.compute_chart(**c) for c in corpus[:200]]
+    rnd = random.Random(1)
+    prepared = []
+    for c in corpus[:200]:
+        dt_utc = main.local_to_utc(c["date"], c["time"], c["timezone"])
+        jd = main.utc_to_jd(dt_utc)
+        sun = main.calc_sidereal(jd, swe.SUN)[0][0]
+        moon = main.calc_sidereal(jd, swe.MOON)[0][0]
+        prepared.append((jd, sun, moon))
+
+    def sunrise_cold(c):
+        main._riseset_cache.clear()
+        return main.calc_sunrise(c["date"], c["lat"], c["lon"], c["timezone"], tz=pytz.timezone(c["timezone"]))
+
+    def sunrise_warm(c):
+        return main.calc_sunrise(c["date"], c["lat"], c["lon"], c["timezone"], tz=pytz.timezone(c["timezone"]))
+
+    loop = asyncio.new_event_loop()
+
+    def planet_positions(c):
+        # Эндпоинт целиком без HTTP: ключ кэша, движок, сборка ответа
+        return loop.run_until_complete(main.get_planet_positions(
+            **c, accuracy=None, ayanamsa="lahiri", varga_spec=None, fields_spec="all", fmt=None, accept=None, if_none_match=None))
+
+    local_times = [(datetime.strptime(f"{c['date']} {c['time']}", "%Y-%m-%d %H:%M"), pytz.timezone(c["timezone"]))
+                   for c in corpus[:200]]
+
+    cases = {
+        "get_sign_deg": (main.get_sign_deg, [(rnd.uniform(0, 360),) for _ in range(1000)]),
+        "calc_navamsa": (main.calc_navamsa, [(ch,) for ch in charts]),
+        "calc_panchanga": (main.calc_panchanga, prepared),
+        "calc_sunrise_cold": (sunrise_cold, [(c,) for c in corpus[:200]]),
+        "calc_sunrise_warm": (sunrise_warm, [(c,) for c in corpus[:200]]),
+        "local_to_utc": (main.local_to_utc, [(c["date"], c["time"], c["timezone"]) for c in corpus[:200]]),
+        "localize_time": (main.localize_time, local_times),
+        "pytz_localize": (lambda dt, tz: tz.localize(dt, is_dst=False), local_times),
+        "compute_chart": (lambda c: main.compute_chart(**c), [(c,) for c in corpus[:200]]),
+        "compute_chart_planets": (lambda c: main.compute_chart(**c, fields=("planets",)), [(c,) for c in corpus[:200]]),
+        "compute_chart_panchanga": (lambda c: main.compute_chart(**c, fields=("panchanga",)), [(c,) for c in corpus[:200]]),
+        "get_planet_positions": (planet_positions, [(c,) for c in corpus[:200]]),
+    }
+    if main.timezone_index is not None:
+        cases["resolve_timezone"] = (main.resolve_timezone, [(None, c["lat"], c["lon"]) for c in corpus[:200]])
+    results = {}
+    for name, (fn, args_list) in cases.items():
+        results[name] = bench(fn, args_list, min_time)
+        print(f"  {name:<22} {results[name]['us_per_call']:10.1f} мкс")
+    loop.close()
+    return results
+
+
+async def _drive(app, corpus, requests: int, concurrency: int, path: str = "/api/planets"):
+    import httpx
+
+    latencies = []
+    errors = 0
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        counter = iter(range(requests))
+
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                t0 = time.perf_counter()
+                resp = await client.get(path, params=corpus[i % len(corpus)])
+                latencies.append(time.perf_counter() - t0)
+                if resp.status_code != 200:
+                    errors += 1
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - t0
+    return latencies, errors, elapsed
+
+
+def percentile(sorted_values, q: float) -> float:
+    index = min(int(round(q * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def run_load(main, corpus, requests: int, concurrency: int):
+    # Прогрев: загрузка зон pytz, запуск воркеров
+    asyncio.run(_drive(main.app, corpus, min(50, requests), 1))
+    latencies, errors, elapsed = asyncio.run(_drive(main.app, corpus, requests, concurrency))
+    latencies.sort()
+    result = {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "rps": requests / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+    print(f"  {requests} запросов, параллельно {concurrency}: {result['rps']:.0f} rps, "
+          f"p50 {result['p50_ms']:.2f} мс, p95 {result['p95_ms']:.2f} мс, p99 {result['p99_ms']:.2f} мс, ошибок {errors}")
+    return result
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def run(args):
+    if not args.with_cache:
+        os.environ["CHART_CACHE_SIZE"] = "0"
+    os.environ["CALC_WORKERS"] = str(args.workers)
+    import main
+
+    corpus = make_corpus(args.corpus, args.seed)
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+    }
+    if not args.skip_micro:
+        print("Микробенчмарки:")
+        report["micro"] = run_micro(main, corpus, args.min_time)
+    if not args.skip_load:
+        print("Нагрузка:")
+        report["load"] = run_load(main, corpus, args.requests, args.concurrency)
+        main.calc_engine.shutdown()
+    if main.timezone_index is not None:
+        report["tz_index_mb"] = main.timezone_index.nbytes / 2**20
+        print(f"  индекс зон: {report['tz_index_mb']:.1f} МБ")
+    report["peak_rss_mb"] = peak_rss_mb()
+    print(f"  пиковый RSS: {report['peak_rss_mb']:.1f} МБ")
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результат: {args.out}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            return compare(json.load(f), report, args.threshold)
+    return 0
+
+
+def _flatten(report):
+    """{имя: (значение, вид метрики)} для сравнения."""
+    values = {}
+    for name, result in report.get("micro", {}).items():
+        values[f"micro.{name}"] = (result["us_per_call"], "us_per_call")
+    for key in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+        if key in report.get("load", {}):
+            values[f"load.{key}"] = (report["load"][key], key)
+    if "peak_rss_mb" in report:
+        values["peak_rss_mb"] = (report["peak_rss_mb"], "peak_rss_mb")
+    if "tz_index_mb" in report:
+        values["tz_index_mb"] = (report["tz_index_mb"], "tz_index_mb")
+    return values
+
+
+def compare(base, new, threshold: float) -> int:
+    """Печатает изменения и возвращает 1, если хоть одна метрика ухудшилась больше чем на threshold."""
+    base_values, new_values = _flatten(base), _flatten(new)
+    regressions = 0
+    print(f"Сравнение с {base['meta'].get('revision') or 'базой'} (порог {threshold:.0%}):")
+    for name, (value, kind) in new_values.items():
+        if name not in base_values:
+            print(f"  {name:<28} {value:12.2f}  (нет в базе)")
+            continue
+        old = base_values[name][0]
+        change = (value - old) / old if old else 0.0
+        worse = change > threshold if HIGHER_IS_WORSE[kind] else change < -threshold
+        regressions += worse
+        mark = "РЕГРЕССИЯ" if worse else ""
+        print(f"  {name:<28} {old:12.2f} -> {value:12.2f}  {change:+7.1%}  {mark}")
+    if regressions:
+        print(f"Регрессий: {regressions}")
+    return 1 if regressions else 0
+
+
+def _main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_run = sub.add_parser("run")
+    p_run.add_argument("--out", default=None, help="куда сохранить JSON с результатом")
+    p_run.add_argument("--compare", default=None, help="базовый JSON для сравнения")
+    p_run.add_argument("--threshold", type=float, default=0.10, help="допустимое ухудшение, доля (0.1 = 10%%)")
+    p_run.add_argument("--corpus", type=int, default=2000)
+    p_run.add_argument("--seed", type=int, default=42)
+    p_run.add_argument("--requests", type=int, default=2000)
+    p_run.add_argument("--concurrency", type=int, default=16)
+    p_run.add_argument("--workers", type=int, default=0, help="CALC_WORKERS для нагрузки (0 — в процессе)")
+    p_run.add_argument("--min-time", type=float, default=0.2, help="секунд на один прогон микробенчмарка")
+    p_run.add_argument("--with-cache", action="store_true", help="не отключать кэш карт")
+    p_run.add_argument("--skip-micro", action="store_true")
+    p_run.add_argument("--skip-load", action="store_true")
+    p_cmp = sub.add_parser("compare")
+    p_cmp.add_argument("base")
+    p_cmp.add_argument("new")
+    p_cmp.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+    if args.cmd == "run":
+        return run(args)
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    return compare(base, new, args.threshold)
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
@@ -0,0 +1,154 @@
+"""
+Движок расчётов: пул процессов, у каждого своё состояние swisseph (режим аянамши, путь к эфемеридам).
+
+swisseph держит режим аянамши в глобальном состоянии C-библиотеки и не отпускает GIL,
+поэтому в пуле потоков расчёты идут последовательно и мешают друг другу при разных аянамшах.
+В процессе-воркере задачи выполняются по одной, так что set_sid_mode перед расчётом безопасен.
+
+Очередь ограничена: если занято workers + queue_size мест, submit сразу бросает
+EngineSaturated (эндпоинты отвечают 503), а не копит задержку.
+При workers=0 задачи выполняются в пуле потоков под общей блокировкой.
+
+Холодный старт: warm_up() запускает все воркеры сразу, в каждом после инициализации
+выполняется функция прогрева. Пока прогрев идёт, задачи считаются в основном процессе
+(как при workers=0), чтобы первый запрос не ждал запуска и импорта воркеров.
+Если воркер умер (например, его убил OOM killer), пул ломается целиком (BrokenProcessPool):
+он заменяется новым и прогревается так же, а до конца прогрева задачи считаются в основном
+процессе. Задачи, которые были в сломанном пуле, не повторяются (та, что убила воркер,
+убила бы и основной процесс) — submit бросает EngineRestarting, эндпоинты отвечают 503.
+Метрики этапов, собранные внутри задачи (metrics.py), возвращаются вместе с результатом
+и сливаются в реестр основного процесса.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import swisseph as swe
+from starlette.concurrency import run_in_threadpool
+
+import metrics
+
+
+class EngineSaturated(Exception):
+    pass
+
+
+class EngineRestarting(Exception):
+    """Пул воркеров сломался и заменяется новым; задачу можно повторить."""
+
+
+def _init_worker(ephe_path, warmup):
+    if ephe_path:
+        swe.set_ephe_path(ephe_path)
+    swe.set_sid_mode(swe.SIDM_LAHIRI, 0, 0)
+    if warmup is not None:
+        warmup()
+
+
+def _worker_pid():
+    return os.getpid()
+
+
+class CalcEngine:
+    def __init__(self, workers: int, queue_size: int, ephe_path: str = None, lock: threading.RLock = None, warmup=None):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.ephe_path = ephe_path
+        # Функция верхнего уровня модуля: выполняется в каждом воркере при запуске
+        self.warmup = warmup
+        self._warming = False
+        # Блокировка для режима без процессов: та же, что защищает swisseph в главном процессе
+        self.lock = lock or threading.RLock()
+        self._pool = None
+        self._restart_task = None
+        self._pending = 0
+        self.stats = {"submitted": 0, "rejected": 0, "restarts": 0}
+
+    @property
+    def capacity(self) -> int:
+        return max(self.workers, 1) + self.queue_size
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def start(self):
+        if self.workers > 0 and self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.ephe_path, self.warmup),
+            )
+
+    async def warm_up(self) -> int:
+        """Запускает и прогревает все воркеры; пока идёт, задачи считаются в основном процессе. Возвращает число воркеров."""
+        if self.workers <= 0:
+            return 0
+        self._warming = True
+        try:
+            self.start()
+            # Пул запускает процесс на задачу, пока нет свободных, — workers задач поднимают все воркеры
+            futures = [asyncio.wrap_future(self._pool.submit(_worker_pid)) for _ in range(self.workers)]
+            return len(set(await asyncio.gather(*futures)))
+        finally:
+            self._warming = False
+
+    def _restart(self, pool):
+        """Заменяет сломанный пул новым; прогрев в фоне, до его конца задачи идут в основном процессе."""
+        if self._pool is not pool:
+            return  # пул уже заменила другая задача, упавшая вместе с этой
+        self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+        self.stats["restarts"] += 1
+        self._warming = True
+        self._restart_task = asyncio.get_running_loop().create_task(self.warm_up())
+
+    def shutdown(self):
+        if self._restart_task is not None:
+            self._restart_task.cancel()
+            self._restart_task = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    def _run_locked(self, fn, args):
+        with self.lock:
+            return metrics.measured(fn, *args)
+
+    async def submit(self, fn, *args):
+        """fn должна быть функцией верхнего уровня модуля (её передаём в процесс через pickle)."""
+        if self._pending >= self.capacity:
+            self.stats["rejected"] += 1
+            raise EngineSaturated(f"очередь расчётов заполнена ({self._pending}/{self.capacity})")
+        self._pending += 1
+        self.stats["submitted"] += 1
+        try:
+            with metrics.stage("engine"):
+                if self.workers > 0 and not self._warming:
+                    self.start()
+                    pool = self._pool
+                    try:
+                        result, snapshot = await asyncio.wrap_future(pool.submit(metrics.measured, fn, *args))
+                    except BrokenProcessPool:
+                        self._restart(pool)
+                        raise EngineRestarting("воркер расчётов завершился аварийно, пул перезапускается")
+                else:
+                    result, snapshot = await run_in_threadpool(self._run_locked, fn, args)
+        finally:
+            self._pending -= 1
+        metrics.record(snapshot)
+        return result
+
+    def snapshot(self):
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "capacity": self.capacity,
+            "pending": self._pending,
+            "warming": self._warming,
+            **self.stats,
+        }
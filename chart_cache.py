@@ -0,0 +1,143 @@
+"""
+Кэш готовых карт: LRU в памяти (размер + TTL) и необязательный второй уровень в SQLite.
+
+Карта полностью определяется нормализованными входными данными (UTC-минута, координаты,
+зона, аянамша, система домов), поэтому ключ строится после перевода времени в UTC.
+Одновременные промахи по одному ключу схлопываются в один расчёт (single-flight):
+первая корутина считает, остальные ждут её результат.
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class ChartCache:
+    def __init__(self, max_size: int = 10000, ttl: float = 86400.0, db_path: str = None, db_max_rows: int = 1_000_000):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.db_max_rows = db_max_rows
+        self._items = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._db_writes = 0
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "disk_hits": 0,
+            "evictions": 0,
+            "expired": 0,
+            "coalesced": 0,
+        }
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS charts (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS charts_created ON charts (created)")
+
+    # --- уровень памяти ---
+    def _get_memory(self, key):
+        entry = self._items.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._items[key]
+            self.stats["expired"] += 1
+            return None
+        self._items.move_to_end(key)
+        return entry[1]
+
+    def _put_memory(self, key, value):
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    # --- уровень SQLite ---
+    def _get_disk(self, key):
+        if self._db is None:
+            return None
+        with self._db_lock:
+            row = self._db.execute("SELECT value, created FROM charts WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] + self.ttl < time.time():
+            return None
+        return json.loads(row[0])
+
+    def _put_disk(self, key, value):
+        if self._db is None:
+            return
+        with self._db_lock:
+            self._db.execute("INSERT OR REPLACE INTO charts (key, value, created) VALUES (?, ?, ?)",
+                             (key, json.dumps(value, ensure_ascii=False), time.time()))
+            self._db_writes += 1
+            # Время от времени чистим устаревшее и лишнее
+            if self._db_writes % 1000 == 0:
+                self._db.execute("DELETE FROM charts WHERE created < ?", (time.time() - self.ttl,))
+                self._db.execute("DELETE FROM charts WHERE key IN (SELECT key FROM charts ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                                 (self.db_max_rows,))
+
+    def get(self, key):
+        with self._lock:
+            value = self._get_memory(key)
+            if value is not None:
+                self.stats["hits"] += 1
+                return value
+        value = self._get_disk(key)
+        with self._lock:
+            if value is not None:
+                self.stats["disk_hits"] += 1
+                self._put_memory(key, value)
+            else:
+                self.stats["misses"] += 1
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._put_memory(key, value)
+        self._put_disk(key, value)
+
+    async def aget_or_compute(self, key, compute):
+        """Значение из кэша или результат await compute(); параллельные промахи по ключу считаются один раз."""
+        value = self.get(key)
+        if value is not None:
+            return value
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.get_running_loop().create_task(self._compute(key, compute))
+            # Ожидающих может не остаться — помечаем исключение как полученное
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        else:
+            with self._lock:
+                self.stats["coalesced"] += 1
+        # Расчёт идёт отдельной задачей: если клиент первого запроса ушёл, отменяется только
+        # его ожидание, а остальные запросы по этому ключу получают результат
+        return await asyncio.shield(task)
+
+    async def _compute(self, key, compute):
+        try:
+            value = await compute()
+            self.put(key, value)
+            return value
+        finally:
+            del self._inflight[key]
+
+    def snapshot(self):
+        with self._lock:
+            data = dict(self.stats)
+            data["size"] = len(self._items)
+            data["max_size"] = self.max_size
+            data["ttl"] = self.ttl
+            data["inflight"] = len(self._inflight)
+        lookups = data["hits"] + data["disk_hits"] + data["misses"]
+        data["hit_ratio"] = (data["hits"] + data["disk_hits"]) / lookups if lookups else 0.0
+        data["disk"] = self._db is not None
+        if self._db is not None:
+            with self._db_lock:
+                data["disk_rows"] = self._db.execute("SELECT COUNT(*) FROM charts").fetchone()[0]
+        return data
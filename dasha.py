@@ -0,0 +1,99 @@
+"""
+Вимшоттари-даша: периоды (маха, антар, пратьянтар, сукшма, прана) от накшатры Луны.
+
+Дерево периодов не строится целиком: на 5-м уровне в 120-летнем цикле 9^5 = 59049
+периодов, а клиенту обычно нужен отрезок в несколько лет. periods() спускается
+только в те ветви, которые пересекают запрошенное окно, current() — по одной
+ветви до нужного уровня.
+
+Все моменты — юлианские дни (UT). Год даши — YEAR_DAYS суток.
+"""
+
+# Порядок управителей начинается с Кету — управителя Ашвини (накшатра 0)
+LORDS = ("ketu", "venus", "sun", "moon", "mars", "rahu", "jupiter", "saturn", "mercury")
+YEARS = (7, 20, 6, 10, 7, 18, 16, 19, 17)
+TOTAL_YEARS = 120
+YEAR_DAYS = 365.25
+LEVELS = ("maha", "antar", "pratyantar", "sookshma", "prana")
+MAX_LEVEL = len(LEVELS)
+NAKSHATRA_SPAN = 360 / 27
+
+
+def birth_balance(moon_lon: float):
+    """Индекс накшатры Луны, индекс управителя первой даши и пройденная доля этой даши."""
+    moon_lon %= 360
+    nakshatra = int(moon_lon // NAKSHATRA_SPAN) % 27
+    elapsed = (moon_lon - nakshatra * NAKSHATRA_SPAN) / NAKSHATRA_SPAN
+    return nakshatra, nakshatra % 9, min(max(elapsed, 0.0), 1.0)
+
+
+def _children(lord: int, start: float, end: float):
+    """Подпериоды периода lord: (управитель, начало, конец). Последний кончается ровно в end."""
+    length = end - start
+    begin = start
+    for k in range(9):
+        sub = (lord + k) % 9
+        finish = end if k == 8 else begin + length * YEARS[sub] / TOTAL_YEARS
+        yield sub, begin, finish
+        begin = finish
+
+
+class Vimshottari:
+    def __init__(self, moon_lon: float, birth_jd: float, year_days: float = YEAR_DAYS):
+        self.nakshatra, self.first_lord, self.elapsed = birth_balance(moon_lon)
+        self.birth_jd = birth_jd
+        self.year_days = year_days
+        self.cycle_days = TOTAL_YEARS * year_days
+        # Начало первой махадаши — до рождения, на пройденную долю её длины
+        self.start = birth_jd - self.elapsed * YEARS[self.first_lord] * year_days
+
+    @property
+    def balance_years(self) -> float:
+        """Остаток первой махадаши на момент рождения, в годах."""
+        return (1.0 - self.elapsed) * YEARS[self.first_lord]
+
+    def _maha(self, jd_from: float):
+        """Махадаши подряд, начиная с той, что идёт в jd_from (циклы по 120 лет повторяются)."""
+        cycle = max(int((jd_from - self.start) // self.cycle_days), 0)
+        begin = self.start + cycle * self.cycle_days
+        k = 0
+        while True:
+            lord = (self.first_lord + k) % 9
+            end = begin + YEARS[lord] * self.year_days
+            yield lord, begin, end
+            begin = end
+            k += 1
+
+    def periods(self, jd_start: float, jd_end: float, depth: int = 1):
+        """
+        Периоды уровней 1..depth, пересекающие [jd_start, jd_end), в хронологическом порядке
+        (родитель перед детьми). Элемент — (уровень, управители от махадаши вниз, начало, конец).
+        """
+        def walk(level, path, start, end):
+            yield level, path, start, end
+            if level < depth:
+                for sub, begin, finish in _children(path[-1], start, end):
+                    if finish <= jd_start:
+                        continue
+                    if begin >= jd_end:
+                        break
+                    yield from walk(level + 1, path + (sub,), begin, finish)
+
+        for lord, begin, end in self._maha(jd_start):
+            if begin >= jd_end:
+                break
+            if end > jd_start:
+                yield from walk(1, (lord,), begin, end)
+
+    def current(self, jd: float, depth: int = MAX_LEVEL):
+        """Цепочка периодов, идущих в момент jd: [(управитель, начало, конец)] от махадаши до depth."""
+        for lord, start, end in self._maha(jd):
+            if jd < end:
+                break
+        chain = [(lord, start, end)]
+        for _ in range(depth - 1):
+            for lord, start, end in _children(lord, start, end):
+                if jd < end:
+                    break
+            chain.append((lord, start, end))
+        return chain
@@ -0,0 +1,222 @@
+"""
+Таблица чебышёвских коэффициентов для сидерических долгот (аянамша Лахири).
+
+Таблица строится один раз офлайн, сохраняется в бинарный файл и при старте
+сервиса отображается в память (np.memmap). Поиск позиции — это вычисление
+полинома Чебышёва для одного сегмента, скорость берётся из производной.
+
+Формат файла (little-endian):
+    заголовок  HEADER        — магия, версия, jd_start, jd_end, sid_mode, число тел
+    тела       BODY_DTYPE    — по записи на тело: id, длина сегмента, степень,
+                               число сегментов, смещение коэффициентов, макс. ошибка
+    данные     float64       — коэффициенты, [сегмент][степень + 1] для каждого тела
+
+Сборка и проверка (по файлам Swiss Ephemeris из SE_EPHE_PATH, если он задан):
+    python ephem_table.py build --start 1900 --end 2100 --out data/ephem_lahiri.bin
+    python ephem_table.py validate --table data/ephem_lahiri.bin
+"""
+import argparse
+import os
+import struct
+import time
+
+import numpy as np
+import swisseph as swe
+
+MAGIC = b"DHEPH\x00\x00\x01"
+HEADER = struct.Struct("<8sIddiI")  # magic, version, jd_start, jd_end, sid_mode, n_bodies
+VERSION = 1
+BODY_DTYPE = np.dtype([
+    ("body", "<i4"),
+    ("degree", "<i4"),
+    ("seg_days", "<f8"),
+    ("n_segments", "<i8"),
+    ("offset", "<i8"),
+    ("max_error_arcsec", "<f8"),
+])
+
+# (id swisseph, длина сегмента в днях, степень полинома)
+# Ошибка аппроксимации — доли угловой секунды; на встроенном Moshier (без файлов .se1)
+# у Марса и внешних планет сам ряд шумит на уровне ~1", поэтому гарантированная
+# ошибка не задаётся, а измеряется при сборке и записывается в файл.
+BODIES = [
+    (swe.SUN, 16.0, 10),
+    (swe.MOON, 8.0, 14),
+    (swe.MERCURY, 8.0, 12),
+    (swe.VENUS, 16.0, 12),
+    (swe.MARS, 16.0, 10),
+    (swe.JUPITER, 32.0, 10),
+    (swe.SATURN, 32.0, 10),
+    (swe.TRUE_NODE, 4.0, 13),
+]
+
+SIDEREAL_FLAG = swe.FLG_SIDEREAL | swe.FLG_SPEED
+
+
+def _year_to_jd(year: int) -> float:
+    return swe.julday(year, 1, 1, 0.0)
+
+
+def _cheb_nodes(n: int) -> np.ndarray:
+    return np.cos(np.pi * (np.arange(n) + 0.5) / n)
+
+
+def _fit_matrix(degree: int) -> np.ndarray:
+    """Матрица (degree+1) x n: коэффициенты = значения в узлах @ M.T (дискретное преобразование Чебышёва)."""
+    n = degree + 1
+    x = _cheb_nodes(n)
+    m = np.cos(np.outer(np.arange(n), np.arccos(x))) * (2.0 / n)
+    m[0] *= 0.5
+    return m
+
+
+def _sample(jds: np.ndarray, body: int) -> np.ndarray:
+    out = np.empty(jds.size)
+    flat = jds.ravel()
+    for i in range(flat.size):
+        out[i] = swe.calc_ut(flat[i], body, SIDEREAL_FLAG)[0][0]
+    return out.reshape(jds.shape)
+
+
+def _fit_body(body: int, seg_days: float, degree: int, jd_start: float, n_segments: int):
+    """Коэффициенты по сегментам и максимальная ошибка в угловых секундах."""
+    x = _cheb_nodes(degree + 1)
+    seg_starts = jd_start + np.arange(n_segments) * seg_days
+    jds = seg_starts[:, None] + (x[None, :] + 1.0) * 0.5 * seg_days
+    values = _sample(jds, body)
+    # Долгота непрерывна внутри сегмента — разворачиваем переход через 0°/360°
+    values = np.unwrap(values, period=360.0, axis=1)
+    coeffs = values @ _fit_matrix(degree).T
+    # Проверяем каждый сегмент посередине между узлами — там ошибка интерполяции максимальна
+    x_mid = np.concatenate(([1.0], 0.5 * (x[:-1] + x[1:]), [-1.0]))
+    t_mid = np.cos(np.outer(np.arccos(x_mid), np.arange(degree + 1)))
+    approx = coeffs @ t_mid.T
+    exact = _sample(seg_starts[:, None] + (x_mid[None, :] + 1.0) * 0.5 * seg_days, body)
+    err = np.abs((approx - exact + 180.0) % 360.0 - 180.0)
+    return coeffs, float(err.max()) * 3600.0
+
+
+def _cheb_eval(coeffs, x):
+    """Значение и производная по x ряда Чебышёва (обычная рекуррентность, без numpy — быстрее для одной точки)."""
+    t_prev, t_cur = 1.0, x
+    d_prev, d_cur = 0.0, 1.0
+    value = coeffs[0] + coeffs[1] * x
+    deriv = coeffs[1]
+    x2 = 2.0 * x
+    for c in coeffs[2:]:
+        t_prev, t_cur = t_cur, x2 * t_cur - t_prev
+        d_prev, d_cur = d_cur, 2.0 * t_prev + x2 * d_cur - d_prev
+        value += c * t_cur
+        deriv += c * d_cur
+    return value, deriv
+
+
+class EphemerisTable:
+    """Отображённая в память таблица коэффициентов. Потокобезопасна (только чтение)."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            magic, version, jd_start, jd_end, sid_mode, n_bodies = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path}: не таблица эфемерид или неподдерживаемая версия")
+            bodies = np.frombuffer(f.read(BODY_DTYPE.itemsize * n_bodies), dtype=BODY_DTYPE)
+        self.path = path
+        self.jd_start = jd_start
+        self.jd_end = jd_end
+        self.sid_mode = sid_mode
+        self.data = np.memmap(path, dtype="<f8", mode="r", offset=HEADER.size + BODY_DTYPE.itemsize * n_bodies)
+        self.bodies = {}
+        for rec in bodies:
+            n = int(rec["degree"]) + 1
+            coeffs = self.data[int(rec["offset"]):int(rec["offset"]) + int(rec["n_segments"]) * n].reshape(-1, n)
+            self.bodies[int(rec["body"])] = (float(rec["seg_days"]), coeffs, float(rec["max_error_arcsec"]))
+
+    def max_error_arcsec(self, body: int) -> float:
+        return self.bodies[body][2]
+
+    def covers(self, jd: float, body: int, accuracy_arcsec=None) -> bool:
+        """Можно ли отвечать из таблицы: тело есть, JD в диапазоне и гарантированная ошибка не хуже требуемой."""
+        entry = self.bodies.get(body)
+        if entry is None or not (self.jd_start <= jd < self.jd_end):
+            return False
+        return accuracy_arcsec is None or entry[2] <= accuracy_arcsec
+
+    def calc(self, jd: float, body: int):
+        """Сидерическая долгота (0..360) и скорость (град/сутки)."""
+        seg_days, coeffs, _ = self.bodies[body]
+        seg, frac = divmod((jd - self.jd_start) / seg_days, 1.0)
+        value, deriv = _cheb_eval(coeffs[int(seg)].tolist(), 2.0 * frac - 1.0)
+        return value % 360.0, deriv * 2.0 / seg_days
+
+
+def build(start_year: int, end_year: int, out: str, sid_mode: int = swe.SIDM_LAHIRI):
+    swe.set_sid_mode(sid_mode, 0, 0)
+    jd_start = _year_to_jd(start_year)
+    jd_end = _year_to_jd(end_year + 1)
+    records = np.zeros(len(BODIES), dtype=BODY_DTYPE)
+    blocks = []
+    offset = 0
+    for i, (body, seg_days, degree) in enumerate(BODIES):
+        t0 = time.perf_counter()
+        n_segments = int(np.ceil((jd_end - jd_start) / seg_days))
+        coeffs, max_error = _fit_body(body, seg_days, degree, jd_start, n_segments)
+        blocks.append(coeffs.astype("<f8").ravel())
+        # Гарантия с запасом 25% поверх ошибки, измеренной во всех сегментах
+        records[i] = (body, degree, seg_days, n_segments, offset, max_error * 1.25)
+        offset += coeffs.size
+        print(f"{swe.get_planet_name(body)}: {n_segments} сегментов, ошибка {max_error:.4f}\", "
+              f"{time.perf_counter() - t0:.1f} c")
+    with open(out, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, jd_start, jd_end, sid_mode, len(records)))
+        f.write(records.tobytes())
+        for block in blocks:
+            f.write(block.tobytes())
+
+
+def validate(path: str, samples: int = 20000, seed: int = 1, quiet: bool = False):
+    """Максимальная ошибка таблицы против swe.calc_ut по каждому телу на случайных моментах."""
+    table = EphemerisTable(path)
+    swe.set_sid_mode(table.sid_mode, 0, 0)
+    rnd = np.random.default_rng(seed)
+    jds = rnd.uniform(table.jd_start, table.jd_end, samples)
+    report = {}
+    for body in table.bodies:
+        lon_err = 0.0
+        speed_err = 0.0
+        for jd in jds:
+            ref = swe.calc_ut(jd, body, SIDEREAL_FLAG)[0]
+            lon, speed = table.calc(jd, body)
+            d = abs((lon - ref[0] + 180.0) % 360.0 - 180.0)
+            lon_err = max(lon_err, d)
+            speed_err = max(speed_err, abs(speed - ref[3]))
+        report[body] = {
+            "max_lon_error_arcsec": lon_err * 3600.0,
+            "max_speed_error_deg_per_day": speed_err,
+        }
+        if not quiet:
+            print(f"{swe.get_planet_name(body):<10} долгота: {lon_err * 3600.0:.4f}\"  скорость: {speed_err:.2e} °/сут"
+                  f"  (гарантия в файле: {table.max_error_arcsec(body):.4f}\")")
+    return report
+
+
+def _main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_build = sub.add_parser("build")
+    p_build.add_argument("--start", type=int, default=1900)
+    p_build.add_argument("--end", type=int, default=2100)
+    p_build.add_argument("--out", default="data/ephem_lahiri.bin")
+    p_val = sub.add_parser("validate")
+    p_val.add_argument("--table", default="data/ephem_lahiri.bin")
+    p_val.add_argument("--samples", type=int, default=20000)
+    args = parser.parse_args()
+    if os.environ.get("SE_EPHE_PATH"):
+        swe.set_ephe_path(os.environ["SE_EPHE_PATH"])
+    if args.cmd == "build":
+        build(args.start, args.end, args.out)
+    else:
+        validate(args.table, args.samples)
+
+
+if __name__ == "__main__":
+    _main()
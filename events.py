@@ -0,0 +1,280 @@
+"""
+Поиск астрономических событий: вход в знак, смена накшатры, станции (смена направления).
+
+Диапазон сканируется с шагом, подобранным под тело (STEP_DAYS): шаг меньше самой
+короткой ретроградной петли, поэтому между соседними отсчётами скорость меняет знак
+не больше одного раза. Сначала уточняются станции (корень скорости), между ними
+движение монотонно — все пересечённые границы знаков и накшатр находятся
+по долготам на концах отрезка и уточняются методом Ньютона с защитой бисекцией.
+Точность — TIME_TOL суток (~1 с).
+
+Найденные события складываются в EventIndex (SQLite) по календарным годам UTC,
+так что повторный запрос того же диапазона — один SELECT. Индекс можно заполнить заранее:
+    python events.py build --start 1950 --end 2050 --db data/events.sqlite
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+import swisseph as swe
+
+from ephem_table import SIDEREAL_FLAG, EphemerisTable
+
+# Тело -> (id swisseph, сдвиг долготы): Кету — точка напротив истинного узла
+BODIES = {
+    "sun": (swe.SUN, 0.0),
+    "moon": (swe.MOON, 0.0),
+    "mercury": (swe.MERCURY, 0.0),
+    "venus": (swe.VENUS, 0.0),
+    "mars": (swe.MARS, 0.0),
+    "jupiter": (swe.JUPITER, 0.0),
+    "saturn": (swe.SATURN, 0.0),
+    "rahu": (swe.TRUE_NODE, 0.0),
+    "ketu": (swe.TRUE_NODE, 180.0),
+}
+SIGN_SPAN = 30.0
+NAKSHATRA_SPAN = 360 / 27
+TIME_TOL = 1e-5
+MAX_ITER = 60
+
+# Шаг сканирования в сутках: Меркурий ретрограден ~3 недели, Венера ~6, Марс ~9,
+# Юпитер и Сатурн ~4 месяца. Истинный узел колеблется с периодом около двух недель.
+STEP_DAYS = {
+    "sun": 10.0,
+    "moon": 1.0,
+    "mercury": 2.0,
+    "venus": 4.0,
+    "mars": 5.0,
+    "jupiter": 10.0,
+    "saturn": 10.0,
+    "rahu": 0.5,
+    "ketu": 0.5,
+}
+# Станции сообщаем только для планет; у Солнца и Луны их нет, у узлов — мелкие колебания
+STATION_BODIES = ("mercury", "venus", "mars", "jupiter", "saturn")
+EVENT_TYPES = ("sign", "nakshatra", "station")
+# Направление движения (было/стало для станций)
+RETROGRADE, DIRECT = 1, 0
+
+
+def _wrap(angle: float) -> float:
+    return (angle + 180.0) % 360.0 - 180.0
+
+
+def _station(speed_of, a: float, b: float, va: float, vb: float) -> float:
+    """Корень скорости на [a, b] (знаки va и vb разные): метод хорд (Illinois) с гарантией сходимости."""
+    side = 0
+    for _ in range(MAX_ITER):
+        t = (a * vb - b * va) / (vb - va)
+        v = speed_of(t)
+        if (v > 0) == (vb > 0):
+            b, vb = t, v
+            if side == -1:
+                va *= 0.5
+            side = -1
+        else:
+            a, va = t, v
+            if side == 1:
+                vb *= 0.5
+            side = 1
+        if b - a < TIME_TOL or v == 0:
+            break
+    return t
+
+
+def _crossing(calc, a: float, b: float, target: float, direction: int) -> float:
+    """Момент на [a, b], когда долгота (монотонная на отрезке) проходит target: Ньютон внутри скобки."""
+    lo, hi = a, b
+    t = 0.5 * (a + b)
+    for _ in range(MAX_ITER):
+        lon, speed = calc(t)
+        diff = _wrap(lon - target)
+        if diff * direction < 0:
+            lo = t
+        else:
+            hi = t
+        step = -diff / speed if speed else 0.0
+        t_next = t + step
+        if not lo < t_next < hi:
+            t_next = 0.5 * (lo + hi)
+        if abs(t_next - t) < TIME_TOL or hi - lo < TIME_TOL:
+            return t_next
+        t = t_next
+    return t
+
+
+def _boundaries(lon: float, delta: float, span: float):
+    """Индексы границ (k * span), которые проходит долгота при движении от lon на delta."""
+    if delta > 0:
+        first, last = int(lon // span) + 1, int((lon + delta) // span)
+        return range(first, last + 1)
+    first, last = int(lon // span), int(-((-(lon + delta)) // span))
+    return range(first, last - 1, -1)
+
+
+def find_events(calc, jd_start: float, jd_end: float, step: float, types=EVENT_TYPES, stations: bool = True, precise_calc=None):
+    """
+    События на [jd_start, jd_end): список (jd, тип, было, стало), отсортированный по времени.
+    calc(jd) -> (долгота 0..360, скорость °/сут); precise_calc — то же для уточнения станций
+    (скорость из таблицы Чебышёва для медленных планет слишком груба), по умолчанию calc.
+    Для знака и накшатры было/стало — индексы, для станции — RETROGRADE/DIRECT.
+    """
+    precise_calc = precise_calc or calc
+    n = max(int((jd_end - jd_start) / step + 0.999999), 1)
+    grid = [jd_start + (jd_end - jd_start) * i / n for i in range(n + 1)]
+    samples = [calc(jd) for jd in grid]
+    spans = []
+    if "sign" in types:
+        spans.append(("sign", SIGN_SPAN))
+    if "nakshatra" in types:
+        spans.append(("nakshatra", NAKSHATRA_SPAN))
+    events = []
+
+    def monotonic(a, b, lon_a, lon_b):
+        delta = _wrap(lon_b - lon_a)
+        if delta == 0:
+            return
+        direction = 1 if delta > 0 else -1
+        for kind, span in spans:
+            count = round(360 / span)
+            for k in _boundaries(lon_a, delta, span):
+                t = _crossing(calc, a, b, (k * span) % 360, direction)
+                inside = k if direction > 0 else k - 1
+                outside = k - 1 if direction > 0 else k
+                events.append((t, kind, outside % count, inside % count))
+
+    for (a, (lon_a, v_a)), (b, (lon_b, v_b)) in zip(zip(grid, samples), zip(grid[1:], samples[1:])):
+        if (v_a < 0) != (v_b < 0):
+            t = _station(lambda jd: precise_calc(jd)[1], a, b, v_a, v_b)
+            lon_t = calc(t)[0]
+            if stations and "station" in types:
+                events.append((t, "station", RETROGRADE if v_a < 0 else DIRECT, DIRECT if v_a < 0 else RETROGRADE))
+            monotonic(a, t, lon_a, lon_t)
+            monotonic(t, b, lon_t, lon_b)
+        else:
+            monotonic(a, b, lon_a, lon_b)
+    events = [e for e in events if jd_start <= e[0] < jd_end]
+    events.sort()
+    return events
+
+
+def body_calc(body: str, sid_mode: int, table: EphemerisTable = None):
+    """
+    (calc, precise_calc) для find_events. calc берёт долготу из таблицы Чебышёва, если она
+    подходит по аянамше и диапазону, иначе из swisseph; precise_calc — всегда swisseph.
+    Режим аянамши в swisseph уже должен быть выставлен.
+    """
+    ipl, shift = BODIES[body]
+    use_table = table is not None and table.sid_mode == sid_mode and ipl in table.bodies
+
+    def precise_calc(jd):
+        xx = swe.calc_ut(jd, ipl, SIDEREAL_FLAG)[0]
+        return (xx[0] + shift) % 360.0, xx[3]
+
+    def calc(jd):
+        if use_table and table.covers(jd, ipl):
+            lon, speed = table.calc(jd, ipl)
+            return (lon + shift) % 360.0, speed
+        return precise_calc(jd)
+
+    return calc, precise_calc
+
+
+def year_events(body: str, year: int, sid_mode: int, table: EphemerisTable = None):
+    """Все события тела за календарный год UTC."""
+    calc, precise_calc = body_calc(body, sid_mode, table)
+    return find_events(calc, swe.julday(year, 1, 1, 0.0), swe.julday(year + 1, 1, 1, 0.0), STEP_DAYS[body],
+                       stations=body in STATION_BODIES, precise_calc=precise_calc)
+
+
+class EventIndex:
+    """
+    Индекс событий в SQLite по (аянамша, тело, год UTC). Год считается один раз целиком,
+    запрос диапазона — выборка по индексу (ayanamsa, body, jd). db_path=None — только в памяти.
+    """
+
+    def __init__(self, db_path: str = None):
+        self._db = sqlite3.connect(db_path or ":memory:", check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        if db_path:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS event_years (ayanamsa TEXT, body TEXT, year INTEGER, "
+                         "PRIMARY KEY (ayanamsa, body, year))")
+        self._db.execute("CREATE TABLE IF NOT EXISTS events (ayanamsa TEXT, body TEXT, jd REAL, type TEXT, "
+                         "from_idx INTEGER, to_idx INTEGER)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS events_lookup ON events (ayanamsa, body, jd)")
+
+    def missing_years(self, ayanamsa: str, body: str, years):
+        with self._lock:
+            have = {row[0] for row in self._db.execute(
+                "SELECT year FROM event_years WHERE ayanamsa = ? AND body = ? AND year BETWEEN ? AND ?",
+                (ayanamsa, body, min(years), max(years)))}
+        return [y for y in years if y not in have]
+
+    def add_year(self, ayanamsa: str, body: str, year: int, events):
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                # Год мог успеть записать параллельный запрос — тогда события не дублируем
+                added = self._db.execute("INSERT OR IGNORE INTO event_years VALUES (?, ?, ?)",
+                                         (ayanamsa, body, year)).rowcount
+                if added:
+                    self._db.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?)",
+                                         [(ayanamsa, body, jd, kind, a, b) for jd, kind, a, b in events])
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def query(self, ayanamsa: str, bodies, jd_start: float, jd_end: float, types=EVENT_TYPES):
+        """События тел bodies на [jd_start, jd_end): список (jd, тело, тип, было, стало) по времени."""
+        marks = ",".join("?" * len(bodies))
+        type_marks = ",".join("?" * len(types))
+        with self._lock:
+            return self._db.execute(
+                f"SELECT jd, body, type, from_idx, to_idx FROM events WHERE ayanamsa = ? AND body IN ({marks}) "
+                f"AND jd >= ? AND jd < ? AND type IN ({type_marks}) ORDER BY jd",
+                (ayanamsa, *bodies, jd_start, jd_end, *types)).fetchall()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "years": self._db.execute("SELECT COUNT(*) FROM event_years").fetchone()[0],
+                "events": self._db.execute("SELECT COUNT(*) FROM events").fetchone()[0],
+            }
+
+
+def build(start_year: int, end_year: int, db_path: str, table_path: str = None, bodies=tuple(BODIES)):
+    """Заполняет индекс годами start..end для аянамши Лахири (уже посчитанные годы пропускаются)."""
+    swe.set_sid_mode(swe.SIDM_LAHIRI, 0, 0)
+    table = EphemerisTable(table_path) if table_path else None
+    index = EventIndex(db_path)
+    years = list(range(start_year, end_year + 1))
+    for body in bodies:
+        t0 = time.perf_counter()
+        missing = index.missing_years("lahiri", body, years)
+        for year in missing:
+            index.add_year("lahiri", body, year, year_events(body, year, swe.SIDM_LAHIRI, table))
+        print(f"{body}: {len(missing)} лет, {time.perf_counter() - t0:.1f} c")
+    print(index.snapshot())
+
+
+def _main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_build = sub.add_parser("build")
+    p_build.add_argument("--start", type=int, default=1950)
+    p_build.add_argument("--end", type=int, default=2050)
+    p_build.add_argument("--db", default="data/events.sqlite")
+    p_build.add_argument("--table", default=None, help="таблица эфемерид (ephem_table.py) для ускорения")
+    args = parser.parse_args()
+    if os.environ.get("SE_EPHE_PATH"):
+        swe.set_ephe_path(os.environ["SE_EPHE_PATH"])
+    build(args.start, args.end, args.db, args.table)
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,227 @@
+"""
+Ашта-кута (Гуна Милан): совместимость по Луне невесты и жениха, 8 кут, максимум 36 баллов.
+
+Все куты зависят только от накшатры, знака и половины знака Луны. Круг делится на
+UNITS = 216 долей по 1°40': в доле целиком лежат и пада накшатры (2 доли), и половина
+знака (9 долей, нужна для Вашьи в Стрельце и Козероге). Для каждой куты заранее
+строится таблица 216 × 216 [невеста, жених] в полубаллах (uint8), плюс таблица суммы.
+
+Оценка N × M пар — индексация таблицы по долям. Для top-K полная матрица не нужна:
+людей с одной долей не больше 216 групп, поэтому сначала считается гистограмма баллов
+по парам групп (≤ 216 × 216), по ней — порог K-го результата, и разворачиваются
+только пары выше порога плюс нужное число пар на пороге.
+Порядок при равных баллах — по индексам (невеста, жених) по возрастанию.
+
+Правила отмены дош (Нади, Бхакут) не применяются — только табличные баллы.
+"""
+import numpy as np
+
+UNITS = 216
+UNIT_SPAN = 360 / UNITS
+KOOTAS = ("varna", "vashya", "tara", "yoni", "graha_maitri", "gana", "bhakoot", "nadi")
+KOOTA_MAX = (1, 2, 3, 4, 5, 6, 7, 8)
+MAX_SCORE = sum(KOOTA_MAX)
+
+# Варна по знаку: 3 — брахман, 2 — кшатрий, 1 — вайшья, 0 — шудра
+_VARNA = (2, 1, 0, 3, 2, 1, 0, 3, 2, 1, 0, 3)
+# Вашья по половинам знаков: 0 — четвероногие, 1 — люди, 2 — водные, 3 — лесные (Лев), 4 — насекомые (Скорпион)
+_VASHYA = (0, 0, 0, 0, 1, 1, 2, 2, 3, 3, 1, 1, 1, 1, 4, 4, 1, 0, 0, 2, 1, 1, 2, 2)
+_VASHYA_POINTS = (
+    (2, 1, 1, 0.5, 1),
+    (1, 2, 0.5, 0, 1),
+    (1, 0.5, 2, 1, 1),
+    (0.5, 0, 1, 2, 0),
+    (1, 1, 1, 0, 2),
+)
+# Йони накшатр: конь, слон, баран, змея, собака, кошка, крыса, корова, буйвол, тигр, олень, обезьяна, мангуст, лев
+_YONI = (0, 1, 2, 3, 3, 4, 5, 2, 5, 6, 6, 7, 8, 9, 8, 9, 10, 10, 4, 11, 12, 11, 13, 0, 13, 7, 1)
+_YONI_POINTS = (
+    (4, 2, 2, 3, 2, 2, 2, 1, 0, 1, 3, 3, 2, 1),
+    (2, 4, 3, 3, 2, 2, 2, 2, 3, 1, 2, 3, 2, 0),
+    (2, 3, 4, 2, 1, 2, 1, 3, 3, 1, 2, 0, 3, 1),
+    (3, 3, 2, 4, 2, 1, 1, 1, 1, 2, 2, 2, 0, 2),
+    (2, 2, 1, 2, 4, 2, 1, 2, 2, 1, 0, 2, 1, 1),
+    (2, 2, 2, 1, 2, 4, 0, 2, 2, 1, 3, 3, 2, 1),
+    (2, 2, 1, 1, 1, 0, 4, 2, 2, 2, 2, 2, 1, 2),
+    (1, 2, 3, 1, 2, 2, 2, 4, 3, 0, 3, 2, 2, 1),
+    (0, 3, 3, 1, 2, 2, 2, 3, 4, 1, 2, 2, 2, 1),
+    (1, 1, 1, 2, 1, 1, 2, 0, 1, 4, 1, 1, 2, 1),
+    (3, 2, 2, 2, 0, 3, 2, 3, 2, 1, 4, 2, 2, 1),
+    (3, 3, 0, 2, 2, 3, 2, 2, 2, 1, 2, 4, 3, 2),
+    (2, 2, 3, 0, 1, 2, 1, 2, 2, 2, 2, 3, 4, 2),
+    (1, 0, 1, 2, 1, 1, 2, 1, 1, 1, 1, 2, 2, 4),
+)
+# Управители знаков: 0 Солнце, 1 Луна, 2 Марс, 3 Меркурий, 4 Юпитер, 5 Венера, 6 Сатурн
+SIGN_LORD = (2, 5, 3, 1, 0, 3, 5, 2, 4, 6, 6, 4)
+# Естественная дружба [планета][другая]: 1 — друг, 0 — нейтрал, -1 — враг
+FRIENDSHIP = (
+    (0, 1, 1, 0, 1, -1, -1),
+    (1, 0, 0, 1, 0, 0, 0),
+    (1, 1, 0, -1, 1, 0, 0),
+    (1, -1, 0, 0, 0, 1, 0),
+    (1, 1, 1, -1, 0, -1, 0),
+    (-1, -1, 0, 1, 0, 0, 1),
+    (-1, -1, -1, 1, 0, 1, 0),
+)
+# Баллы Граха Майтри по паре отношений (сумма отношений двух управителей)
+_MAITRI_POINTS = {2: 5, 1: 4, 0: 3, -1: 0.5, -2: 0}
+# Гана накшатр: 0 — дэва, 1 — манушья, 2 — ракшаса; баллы [невеста][жених]
+_GANA = (0, 1, 2, 1, 0, 1, 0, 0, 2, 2, 1, 1, 0, 2, 0, 2, 0, 2, 2, 1, 1, 0, 2, 2, 1, 1, 0)
+_GANA_POINTS = ((6, 5, 1), (6, 6, 0), (0, 0, 6))
+# Бхакут: расстояние между знаками 2/12, 5/9, 6/8 — 0 баллов
+_BHAKOOT_BAD = (2, 12, 5, 9, 6, 8)
+# Нади накшатр: ади, мадхья, антья, антья, мадхья, ади, ...
+_NADI = tuple((0, 1, 2, 2, 1, 0)[i % 6] for i in range(27))
+
+
+def _maitri(a: int, b: int) -> float:
+    # Общий управитель — полный балл (в таблице дружбы планета сама себе нейтрал)
+    if a == b:
+        return 5
+    relation = FRIENDSHIP[a][b] + FRIENDSHIP[b][a]
+    if FRIENDSHIP[a][b] * FRIENDSHIP[b][a] == -1:
+        return 1  # друг с одной стороны, враг с другой
+    return _MAITRI_POINTS[relation]
+
+
+def _build_tables():
+    """(8, UNITS, UNITS) баллов кут в полубаллах, индексы [кута, доля невесты, доля жениха]."""
+    u = np.arange(UNITS)
+    nak, sign, half = u // 8, u // 18, u // 9
+    b, g = np.meshgrid(u, u, indexing="ij")
+    nb, ng, sb, sg = nak[b], nak[g], sign[b], sign[g]
+
+    varna = np.array(_VARNA)
+    vashya = np.array(_VASHYA)
+    yoni = np.array(_YONI)
+    gana = np.array(_GANA)
+    nadi = np.array(_NADI)
+    lord = np.array(SIGN_LORD)
+    maitri = np.array([[_maitri(x, y) for y in range(7)] for x in range(7)])
+
+    def tara_good(frm, to):
+        return ~np.isin(((to - frm) % 27 + 1) % 9, (3, 5, 7))
+
+    tables = np.stack([
+        varna[sg] >= varna[sb],
+        np.array(_VASHYA_POINTS)[vashya[half[b]], vashya[half[g]]],
+        1.5 * (tara_good(nb, ng).astype(int) + tara_good(ng, nb)),
+        np.array(_YONI_POINTS)[yoni[nb], yoni[ng]],
+        maitri[lord[sb], lord[sg]],
+        np.array(_GANA_POINTS)[gana[nb], gana[ng]],
+        7 * ~np.isin((sg - sb) % 12 + 1, _BHAKOOT_BAD),
+        8 * (nadi[nb] != nadi[ng]),
+    ]).astype(np.float64)
+    return np.rint(tables * 2).astype(np.uint8)
+
+
+KOOTA_TABLES = _build_tables()
+TOTAL_TABLE = KOOTA_TABLES.sum(axis=0, dtype=np.uint8)
+LEVELS = MAX_SCORE * 2 + 1
+
+
+def units(moon_longitudes):
+    """Долготы Луны (сидерические, градусы) -> индексы долей 0..UNITS-1."""
+    lon = np.asarray(moon_longitudes, dtype=np.float64) % 360.0
+    return np.minimum((lon // UNIT_SPAN).astype(np.intp), UNITS - 1)
+
+
+def matrix(brides, grooms):
+    """Полная матрица суммарных баллов (N, M) по долям; для небольших наборов."""
+    return TOTAL_TABLE[np.asarray(brides)[:, None], np.asarray(grooms)[None, :]] / 2
+
+
+def breakdown(brides, grooms):
+    """Баллы по кутам для пар (brides[i], grooms[i]): массив (len, 8)."""
+    return KOOTA_TABLES[:, np.asarray(brides), np.asarray(grooms)].T / 2
+
+
+def _groups(unit_idx):
+    """Группы по долям без сортировки: (занятые доли, номер группы каждого человека, размеры групп)."""
+    counts = np.bincount(unit_idx, minlength=UNITS)
+    present = np.flatnonzero(counts)
+    group_of = np.zeros(UNITS, dtype=np.intp)
+    group_of[present] = np.arange(len(present))
+    return present, group_of[unit_idx], counts[present]
+
+
+def _pairs(rows, cols_of):
+    """Все пары (i, j): i из rows, j из cols_of(i)."""
+    parts_i, parts_j = [], []
+    for i in rows:
+        cols = cols_of(i)
+        parts_i.append(np.full(len(cols), i, dtype=np.intp))
+        parts_j.append(cols)
+    if not parts_i:
+        return np.empty(0, np.intp), np.empty(0, np.intp)
+    return np.concatenate(parts_i), np.concatenate(parts_j)
+
+
+def top_pairs(brides, grooms, k: int):
+    """
+    K лучших пар из N × M без полной матрицы: (индексы невест, индексы женихов, суммы баллов),
+    по убыванию суммы, при равенстве — по (невеста, жених).
+    """
+    brides, grooms = np.asarray(brides), np.asarray(grooms)
+    ub, inv_b, count_b = _groups(brides)
+    ug, inv_g, count_g = _groups(grooms)
+    scores = TOTAL_TABLE[ub[:, None], ug[None, :]]
+    # Число пар на каждом уровне баллов, затем порог K-го места
+    pairs = np.outer(count_b, count_g)
+    hist = np.bincount(scores.ravel(), weights=pairs.ravel(), minlength=LEVELS)
+    above = np.cumsum(hist[::-1])[::-1]  # above[s] — пар с баллом >= s
+    k = min(k, len(brides) * len(grooms))
+    threshold = int(np.flatnonzero(above >= k).max()) if k else LEVELS
+    # Группы женихов выше порога и на пороге — для каждой группы невест
+    higher = scores > threshold
+    equal = scores == threshold
+    high_cols = [np.flatnonzero(higher[r][inv_g]) for r in range(len(ub))]
+    rows = np.flatnonzero(higher[inv_b].any(axis=1))
+    i_hi, j_hi = _pairs(rows, lambda i: high_cols[inv_b[i]])
+    # На пороге нужно ровно need пар с наименьшими (i, j): невесты по порядку, пока не наберётся
+    need = k - len(i_hi)
+    tie_counts = (equal * count_g[None, :]).sum(axis=1)[inv_b]
+    taken = np.cumsum(tie_counts)
+    last = int(np.searchsorted(taken, need)) if need > 0 else -1
+    tie_rows = [i for i in range(last + 1) if tie_counts[i]]
+    eq_cols = {}
+
+    def tie_cols(i):
+        r = inv_b[i]
+        if r not in eq_cols:
+            eq_cols[r] = np.flatnonzero(equal[r][inv_g])
+        return eq_cols[r]
+
+    i_eq, j_eq = _pairs(tie_rows, tie_cols)
+    i_all = np.concatenate([i_hi, i_eq[:max(need, 0)]])
+    j_all = np.concatenate([j_hi, j_eq[:max(need, 0)]])
+    total = TOTAL_TABLE[brides[i_all], grooms[j_all]]
+    order = np.lexsort((j_all, i_all, -total.astype(np.int16)))
+    return i_all[order], j_all[order], total[order] / 2
+
+
+def top_per_bride(brides, grooms, k: int):
+    """Для каждой невесты K лучших женихов: (индексы женихов (N, K), баллы (N, K)); при равенстве — по индексу."""
+    brides, grooms = np.asarray(brides), np.asarray(grooms)
+    k = min(k, len(grooms))
+    ub, inv_b, _ = _groups(brides)
+    best = np.empty((len(ub), k), dtype=np.intp)
+    for r, unit in enumerate(ub):
+        # Сортировка uint8 устойчивая и поразрядная — O(M) на группу невест
+        order = np.argsort(MAX_SCORE * 2 - TOTAL_TABLE[unit][grooms], kind="stable")
+        best[r] = order[:k]
+    cols = best[inv_b]
+    return cols, TOTAL_TABLE[brides[:, None], grooms[cols]] / 2
+
+
+def top_per_groom(brides, grooms, k: int):
+    """То же для каждого жениха: (индексы невест (M, K), баллы (M, K))."""
+    brides, grooms = np.asarray(brides), np.asarray(grooms)
+    k = min(k, len(brides))
+    ug, inv_g, _ = _groups(grooms)
+    best = np.empty((len(ug), k), dtype=np.intp)
+    for r, unit in enumerate(ug):
+        order = np.argsort(MAX_SCORE * 2 - TOTAL_TABLE[:, unit][brides], kind="stable")
+        best[r] = order[:k]
+    rows = best[inv_g]
+    return rows, TOTAL_TABLE[brides[rows], grooms[:, None]] / 2
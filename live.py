@@ -0,0 +1,123 @@
+"""
+Рассылка живого неба подписчикам (Server-Sent Events): один расчёт на тик, раздача всем.
+
+Подписчики сгруппированы по месту (None — без места, иначе округлённые (lat, lon)).
+Тикер раз в interval секунд вызывает compute(места) -> {место: кадр} для всех мест,
+у которых есть подписчики, и раздаёт каждый кадр (готовые байты события) подписчикам
+этого места. Расчёт и кодирование — один раз на место за тик, а не на подписчика;
+на подписчика приходится только put_nowait.
+
+У каждого подписчика своя ограниченная очередь кадров. Если клиент не успевает читать
+и очередь заполнена, выбрасывается самый старый кадр: клиенту нужно текущее небо,
+а не история, и медленный клиент не задерживает ни тикер, ни остальных.
+Новое место считается сразу, не дожидаясь тика; новый подписчик уже известного места
+сразу получает последний кадр.
+"""
+import asyncio
+
+
+class LiveFull(Exception):
+    """Достигнут предел подписчиков."""
+
+
+class Subscription:
+    __slots__ = ("place", "queue")
+
+    def __init__(self, place, queue_size: int):
+        self.place = place
+        self.queue = asyncio.Queue(queue_size)
+
+
+class LiveBroadcaster:
+    def __init__(self, compute, interval: float, queue_size: int = 2, max_subscribers: int = 20000):
+        self.compute = compute  # async (список мест) -> {место: bytes}
+        self.interval = interval
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.places = {}   # место -> {Subscription}
+        self.latest = {}   # место -> последний кадр
+        self.subscribers = 0
+        self.ticks = 0
+        self.skipped = 0   # тики, на которых расчёт не удался (например, движок занят)
+        self.dropped = 0   # кадры, выброшенные из переполненных очередей
+        self._wake = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def subscribe(self, place) -> Subscription:
+        if self.subscribers >= self.max_subscribers:
+            raise LiveFull(f"подписчиков уже {self.subscribers}, максимум {self.max_subscribers}")
+        sub = Subscription(place, self.queue_size)
+        self.places.setdefault(place, set()).add(sub)
+        self.subscribers += 1
+        frame = self.latest.get(place)
+        if frame is not None:
+            sub.queue.put_nowait(frame)
+        else:
+            self._wake.set()
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        subs = self.places.get(sub.place)
+        if subs is None or sub not in subs:
+            return
+        subs.discard(sub)
+        self.subscribers -= 1
+        if not subs:
+            del self.places[sub.place]
+            self.latest.pop(sub.place, None)
+
+    def publish(self, frames):
+        for place, frame in frames.items():
+            subs = self.places.get(place)
+            if not subs:
+                continue
+            self.latest[place] = frame
+            for sub in subs:
+                queue = sub.queue
+                if queue.full():
+                    queue.get_nowait()
+                    self.dropped += 1
+                queue.put_nowait(frame)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while True:
+            self._wake.clear()
+            if loop.time() >= deadline:
+                places = list(self.places)
+                deadline = loop.time() + self.interval
+            else:
+                places = [place for place in self.places if place not in self.latest]
+            if places:
+                try:
+                    frames = await self.compute(places)
+                except Exception:
+                    self.skipped += 1
+                else:
+                    self.publish(frames)
+                    self.ticks += 1
+            # Без подписчиков тикер спит до первой подписки
+            timeout = max(deadline - loop.time(), 0) if self.places else None
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def snapshot(self):
+        return {
+            "subscribers": self.subscribers,
+            "places": len(self.places),
+            "ticks": self.ticks,
+            "skipped": self.skipped,
+            "dropped": self.dropped,
+        }
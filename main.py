@@ -1,14 +1,50 @@
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, Header, HTTPException, Query
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional, Union
+import asyncio
+import os
+import threading
+from time import perf_counter
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from functools import cached_property
+import numpy as np
 import swisseph as swe
 from datetime import datetime, timedelta
 import pytz  # Добавлено для поддержки временных зон и DST
 from pytz.exceptions import AmbiguousTimeError, NonExistentTimeError
 
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 
-app = FastAPI()
+import dasha
+import ephem_table
+import events
+import kuta
+import live
+import metrics
+import response_format
+import strength
+import tz_index
+import vargas
+from calc_engine import CalcEngine, EngineRestarting, EngineSaturated
+from chart_cache import ChartCache
+
+@asynccontextmanager
+async def lifespan(app):
+    calc_engine.start()
+    live_sky.start()
+    # Прогрев в фоне: порт открыт сразу, первые запросы считаются в основном процессе
+    warmup = asyncio.create_task(warm_up()) if WARMUP else None
+    if warmup is None:
+        startup["ready"] = True
+    yield
+    if warmup is not None:
+        warmup.cancel()
+    live_sky.stop()
+    calc_engine.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 # --- Разрешаем CORS для локалки и продакшена ---
 app.add_middleware(
@@ -20,10 +56,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "ETag"],
 )
+# Время запросов в /metrics; с заголовком X-Server-Timing: 1 — разбивка по этапам в ответе
+app.add_middleware(metrics.TimingMiddleware)
 
 class PlanetInfo(BaseModel):
     longitude: float
+    speed: Optional[float] = None       # °/сутки, отрицательная — ретроградное движение
     retrograde: Optional[bool] = None  # <-- исправлено: теперь можно None
     sign: Optional[str] = None         # ДОБАВЛЕН знак
     deg_in_sign: Optional[float] = None # ДОБАВЛЕН градус в знаке
@@ -86,20 +126,88 @@ NAKSHATRAS = [
     ("Пурва Бхадрапада", 4), ("Уттара Бхадрапада", 4), ("Ревати", 4)
 ]
 
+# --- Файлы Swiss Ephemeris ---
+# SE_EPHE_PATH — каталог с sepl_18.se1 и semo_18.se1 (1800–2400); в образе — /app/ephe (см. Dockerfile).
+# Без файлов swisseph молча переходит на аналитическую теорию Моше; что реально используется — в /ready.
+SE_EPHE_PATH = os.environ.get("SE_EPHE_PATH") or None
+if SE_EPHE_PATH:
+    swe.set_ephe_path(SE_EPHE_PATH)
+# Вне 1800–2400 считается по Моше, а её таблицы кончаются в начале 3003 г. — дальше swisseph
+# бросает ошибку. Годы для календарей ограничены с запасом: элементы на краях периода
+# начинаются раньше первого дня и кончаются позже последнего (а datetime не знает года 0).
+MIN_YEAR, MAX_YEAR = 2, 3000
+
+def check_year_range(first: int, last: int):
+    """422, если годы first..last выходят за MIN_YEAR..MAX_YEAR."""
+    if first < MIN_YEAR or last > MAX_YEAR:
+        raise HTTPException(status_code=422, detail=f"Даты вне диапазона эфемерид: нужны годы {MIN_YEAR}–{MAX_YEAR}")
+
+# --- Необязательная таблица эфемерид (см. ephem_table.py) ---
+# Если файл есть, долготы и скорости в пределах его диапазона берутся из таблицы,
+# вне диапазона или при более строгом требовании к точности — из Swiss Ephemeris.
+EPHEM_TABLE_PATH = os.environ.get("EPHEM_TABLE_PATH", "data/ephem_lahiri.bin")
+SIDEREAL_FLAG = swe.FLG_SIDEREAL | swe.FLG_SPEED
+ephemeris_table = ephem_table.EphemerisTable(EPHEM_TABLE_PATH) if os.path.exists(EPHEM_TABLE_PATH) else None
+
+def calc_sidereal(jd: float, body: int, accuracy: Optional[float] = None, sid_mode: int = swe.SIDM_LAHIRI):
+    """
+    Сидерическая позиция тела в форме ответа swe.calc_ut(jd, body, FLG_SIDEREAL | FLG_SPEED).
+    accuracy — требуемая точность в угловых секундах; None — устраивает гарантия таблицы.
+    sid_mode должен совпадать с уже выставленным swe.set_sid_mode; таблица годится только для своей аянамши.
+    Из таблицы заполняются только долгота и скорость.
+    """
+    t0 = perf_counter()
+    if ephemeris_table is not None and ephemeris_table.sid_mode == sid_mode:
+        if ephemeris_table.covers(jd, body, accuracy):
+            longitude, speed = ephemeris_table.calc(jd, body)
+            metrics.observe("ephem_table", perf_counter() - t0)
+            return (longitude, 0.0, 0.0, speed, 0.0, 0.0), SIDEREAL_FLAG
+        metrics.count("ephem_table_miss")
+    result = swe.calc_ut(jd, body, SIDEREAL_FLAG)
+    metrics.observe("calc_ut", perf_counter() - t0)
+    return result
+
+# --- Аянамши и защита глобального состояния swisseph ---
+# swe.set_sid_mode меняет глобальное состояние библиотеки, поэтому в главном процессе
+# выставлять режим и считать нужно под swe_lock; в воркерах calc_engine каждый процесс свой.
+AYANAMSAS = {
+    "lahiri": swe.SIDM_LAHIRI,
+    "raman": swe.SIDM_RAMAN,
+    "krishnamurti": swe.SIDM_KRISHNAMURTI,
+    "fagan_bradley": swe.SIDM_FAGAN_BRADLEY,
+    "yukteshwar": swe.SIDM_YUKTESHWAR,
+    "true_citra": swe.SIDM_TRUE_CITRA,
+}
+swe_lock = threading.RLock()
+
+def get_sid_mode(ayanamsa: str) -> int:
+    sid_mode = AYANAMSAS.get(ayanamsa)
+    if sid_mode is None:
+        raise HTTPException(status_code=422, detail=f"Неизвестная аянамша '{ayanamsa}', доступны: {', '.join(AYANAMSAS)}")
+    return sid_mode
+
+# --- Локализация времени с учётом DST (общая для одиночных и пакетных расчётов) ---
+def localize_time(dt_local: datetime, tz) -> datetime:
+    # Однозначное время — бинарный поиск по кэшированной таблице переходов зоны (tz_index.py)
+    dt = tz_index.zone_table(tz).localize(dt_local)
+    if dt is not None:
+        return dt
+    try:
+        return tz.localize(dt_local, is_dst=None)
+    except AmbiguousTimeError:
+        # Неоднозначное время — берём DST-версию
+        metrics.count("ambiguous_time")
+        return tz.localize(dt_local, is_dst=True)
+    except NonExistentTimeError:
+        # Несуществующее время — сдвигаем на 1 час вперёд
+        metrics.count("nonexistent_time")
+        return tz.localize(dt_local + timedelta(hours=1), is_dst=True)
+
 # Новый вспомогательный метод для преобразования локального времени в UTC
 # date: 'YYYY-MM-DD', time: 'HH:MM', tz_name: 'Europe/Moscow' или 'Asia/Almaty'
 def local_to_utc(date: str, time: str, tz_name: str) -> datetime:
     dt_local = datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M")
-    tz = pytz.timezone(tz_name)
-    try:
-        dt_localized = tz.localize(dt_local, is_dst=None)
-    except AmbiguousTimeError:
-        # Неоднозначное время (например, переход на зимнее время) — пробуем DST-версию
-        dt_localized = tz.localize(dt_local, is_dst=True)
-    except NonExistentTimeError:
-        # Не существует (например, переход на летнее время) — сдвигаем на 1 час вперёд
-        dt_local += timedelta(hours=1)
-        dt_localized = tz.localize(dt_local, is_dst=True)
+    dt_localized = localize_time(dt_local, tz_index.get_timezone(tz_name))
     dt_utc = dt_localized.astimezone(pytz.utc)
     return dt_utc
 
@@ -133,102 +241,96 @@ def get_sign_deg(longitude: float):
     return sign, deg_in_sign, deg_in_sign_str
 
 # --- Вспомогательная функция для расчёта дробной карты D9 (Навамша) ---
+# Считается движком варг (vargas.py) одним проходом; формат ответа прежний.
 def calc_navamsa(planets):
-    d9 = {}
-    asc_navamsa_sign_idx = None
-    rahu_navamsa_sign_idx = None
-    rahu_navamsa_num = None
-    # Сначала вычисляем навамша-лагну (ascendant)
+    names = []
+    lons = []
     for key, p in planets.items():
         if key == "ascendant":
             lon = p if isinstance(p, (int, float)) else p.get("longitude")
-            sign_idx = int(lon // 30) % 12
-            deg_in_sign = lon % 30
-            navamsa_num = int(deg_in_sign // (30/9))  # 0..8
-            navamsa_sign_idx = (sign_idx * 9 + navamsa_num) % 12
-            navamsa_sign = SIGNS[navamsa_sign_idx]
-            d9[key] = {
-                "longitude": lon,
-                "navamsa_sign": navamsa_sign,
-                "navamsa_num": navamsa_num + 1,
-                "navamsa_deg": deg_in_sign,
-                "navamsa_sign_idx": navamsa_sign_idx
-            }
-            asc_navamsa_sign_idx = navamsa_sign_idx
-            break
-    # Сначала вычисляем Раху по обычной формуле, сохраняем индекс
-    for key, p in planets.items():
-        if key != "rahu":
-            continue
-        if not isinstance(p, dict) or "longitude" not in p:
-            continue
-        lon = p["longitude"]
-        sign_idx = int(lon // 30) % 12
-        deg_in_sign = lon % 30
-        navamsa_num = int(deg_in_sign // (30/9))  # 0..8
-        navamsa_sign_idx = (sign_idx * 9 + navamsa_num) % 12
-        navamsa_sign = SIGNS[navamsa_sign_idx]
-        if asc_navamsa_sign_idx is not None:
-            navamsa_house = (navamsa_sign_idx - asc_navamsa_sign_idx) % 12 + 1
+        elif isinstance(p, dict) and "longitude" in p:
+            lon = p["longitude"]
         else:
-            navamsa_house = None
-        d9[key] = {
-            "longitude": lon,
-            "navamsa_sign": navamsa_sign,
-            "navamsa_num": navamsa_num + 1,
-            "navamsa_deg": deg_in_sign,
-            "navamsa_sign_idx": navamsa_sign_idx,
-            "navamsa_house": navamsa_house
-        }
-        rahu_navamsa_sign_idx = navamsa_sign_idx
-        rahu_navamsa_num = navamsa_num
-    # Теперь Кету: строго напротив Раху
-    if rahu_navamsa_sign_idx is not None:
-        ketu_navamsa_sign_idx = (rahu_navamsa_sign_idx + 6) % 12
-        ketu_navamsa_sign = SIGNS[ketu_navamsa_sign_idx]
-        if asc_navamsa_sign_idx is not None:
-            ketu_navamsa_house = (ketu_navamsa_sign_idx - asc_navamsa_sign_idx) % 12 + 1
-        else:
-            ketu_navamsa_house = None
-        d9["ketu"] = {
-            "longitude": planets["ketu"]["longitude"] if isinstance(planets["ketu"], dict) else planets["ketu"],
-            "navamsa_sign": ketu_navamsa_sign,
-            "navamsa_num": (rahu_navamsa_num + 1) if rahu_navamsa_num is not None else None,
-            "navamsa_deg": d9["rahu"]["navamsa_deg"] if "rahu" in d9 else None,
-            "navamsa_sign_idx": ketu_navamsa_sign_idx,
-            "navamsa_house": ketu_navamsa_house
-        }
-    # Остальные планеты
-    for key, p in planets.items():
-        if key in ("ascendant", "rahu", "ketu"):
             continue
-        if not isinstance(p, dict) or "longitude" not in p:
-            continue
-        lon = p["longitude"]
-        sign_idx = int(lon // 30) % 12
-        deg_in_sign = lon % 30
-        navamsa_num = int(deg_in_sign // (30/9))  # 0..8
-        navamsa_sign_idx = (sign_idx * 9 + navamsa_num) % 12
-        navamsa_sign = SIGNS[navamsa_sign_idx]
-        if asc_navamsa_sign_idx is not None:
-            navamsa_house = (navamsa_sign_idx - asc_navamsa_sign_idx) % 12 + 1
-        else:
-            navamsa_house = None
-        d9[key] = {
-            "longitude": lon,
-            "navamsa_sign": navamsa_sign,
-            "navamsa_num": navamsa_num + 1,
-            "navamsa_deg": deg_in_sign,
+        names.append(key)
+        lons.append(lon)
+    signs, parts = vargas.varga_signs(lons, (9,))
+    asc_navamsa_sign_idx = int(signs[names.index("ascendant"), 0]) if "ascendant" in names else None
+
+    d9 = {}
+    # Порядок как раньше: лагна, Раху, Кету (его долгота — Раху + 180°, в D9 он напротив Раху), остальные планеты
+    order = [k for k in ("ascendant", "rahu") if k in names]
+    if "rahu" in names and "ketu" in names:
+        order.append("ketu")
+    order += [k for k in names if k not in ("ascendant", "rahu", "ketu")]
+    for key in order:
+        i = names.index(key)
+        navamsa_sign_idx = int(signs[i, 0])
+        entry = {
+            "longitude": lons[i],
+            "navamsa_sign": SIGNS[navamsa_sign_idx],
+            "navamsa_num": int(parts[i, 0]) + 1,
+            "navamsa_deg": lons[i] % 30,
             "navamsa_sign_idx": navamsa_sign_idx,
-            "navamsa_house": navamsa_house
         }
-    # Для диагностики: печать распределения планет по знакам и домам D9
-    print("[D9] Navamsa Ascendant:", d9.get("ascendant"))
-    for k, v in d9.items():
-        if k != "ascendant":
-            print(f"[D9] {k}: sign={v['navamsa_sign']} house={v['navamsa_house']} num={v['navamsa_num']}")
+        if key == "ketu":
+            entry["navamsa_deg"] = d9["rahu"]["navamsa_deg"]
+        if key != "ascendant":
+            entry["navamsa_house"] = (navamsa_sign_idx - asc_navamsa_sign_idx) % 12 + 1 if asc_navamsa_sign_idx is not None else None
+        d9[key] = entry
     return d9
 
+# --- Все дробные карты (варги) за один проход ---
+VARGA_BODIES = ("ascendant", "sun", "moon", "mars", "mercury", "jupiter", "venus", "saturn", "rahu", "ketu")
+
+def calc_vargas(chart, divisions):
+    """{"D2": {тело: {sign, sign_idx, house}}, ...} для тел карты; дома — от лагны той же варги."""
+    lons = [chart["ascendant"]] + [chart[k]["longitude"] for k in VARGA_BODIES[1:]]
+    signs, _ = vargas.varga_signs(lons, divisions)
+    signs = signs.tolist()
+    result = {}
+    for k, division in enumerate(divisions):
+        asc_sign = signs[0][k]
+        varga = {}
+        for i, key in enumerate(VARGA_BODIES):
+            sign_idx = signs[i][k]
+            varga[key] = {"sign": SIGNS[sign_idx], "sign_idx": sign_idx}
+            if i:
+                varga[key]["house"] = (sign_idx - asc_sign) % 12 + 1
+        result[f"D{division}"] = varga
+    return result
+
+# --- Углы и названия элементов Панчанги (общие для calc_panchanga и календаря) ---
+TITHI_SPAN = 12.0
+KARANA_SPAN = 6.0
+YOGA_SPAN = 360 / 27
+NAKSHATRA_SPAN = 360 / 27
+
+BASIC_TITHI_NAMES = [
+    "Пратипада", "Двитья", "Тритья", "Чатуртхи", "Панчами", "Шашти", "Саптами", "Аштами", "Навами", "Дашами",
+    "Экадаши", "Двадаши", "Трайодаши", "Чатурдаши", "Полнолуние"
+]
+
+def tithi_angle(sun_lon: float, moon_lon: float) -> float:
+    # Разность долгот Луны и Солнца; аянамша сокращается, так что годятся и тропические, и сидерические
+    return (moon_lon - sun_lon) % 360
+
+def yoga_angle(sun_lon: float, moon_lon: float) -> float:
+    # Сумма сидерических долгот Солнца и Луны
+    return (sun_lon + moon_lon) % 360
+
+def tithi_name(tithi_index: int) -> str:
+    # Для новолуния и полнолуния не добавляем фазу
+    if tithi_index == 0:
+        return "Новолуние"
+    if tithi_index == 15:
+        return "Полнолуние"
+    paksha = "Шукла" if tithi_index < 15 else "Кришна"
+    # Для второй половины лунного месяца используем те же названия
+    tithi_name_index = tithi_index - 15 if tithi_index >= 15 else tithi_index
+    tithi_name_index = min(tithi_name_index, len(BASIC_TITHI_NAMES) - 1)
+    return f"{paksha} {BASIC_TITHI_NAMES[tithi_name_index]}"
+
 # --- Функция для расчёта Панчанги ---
 def calc_panchanga(jd, sun_lon, moon_lon):
     """
@@ -244,69 +346,38 @@ def calc_panchanga(jd, sun_lon, moon_lon):
     panchanga["vara"] = VARAS[vara_index]
     
     # 2. ТИТХИ (лунный день) - разность долгот Луны и Солнца
-    # Используем тропические долготы для расчёта титхи (как в предыдущей версии)
-    sun_long_tropical = swe.calc_ut(jd, swe.SUN)[0][0]
-    moon_long_tropical = swe.calc_ut(jd, swe.MOON)[0][0]
-    tithi_angle = (moon_long_tropical - sun_long_tropical) % 360
-    tithi_index = int(tithi_angle // 12)
+    # Берём уже посчитанные сидерические долготы: аянамша в разности сокращается
+    tithi_deg = tithi_angle(sun_lon, moon_lon)
+    tithi_index = int(tithi_deg // TITHI_SPAN)
+    panchanga["tithi"] = tithi_name(tithi_index)
     
-    # Определяем фазу
-    paksha = "Шукла" if tithi_angle < 180 else "Кришна"
-    
-    # Названия титхи без фазы
-    basic_tithi_names = [
-        "Пратипада", "Двитья", "Тритья", "Чатуртхи", "Панчами", "Шашти", "Саптами", "Аштами", "Навами", "Дашами",
-        "Экадаши", "Двадаши", "Трайодаши", "Чатурдаши", "Полнолуние"
-    ]
-    
-    # Для второй половины лунного месяца используем те же названия
-    if tithi_index >= 15:
-        tithi_name_index = tithi_index - 15
-        if tithi_name_index >= len(basic_tithi_names):
-            tithi_name_index = len(basic_tithi_names) - 1
-    else:
-        tithi_name_index = tithi_index
-        
-    if tithi_name_index >= len(basic_tithi_names):
-        tithi_name_index = len(basic_tithi_names) - 1
-        
-    tithi_name = basic_tithi_names[tithi_name_index]
-    
-    # Для новолуния и полнолуния не добавляем фазу
-    if tithi_index == 0:
-        panchanga["tithi"] = "Новолуние"
-    elif tithi_index == 15:
-        panchanga["tithi"] = "Полнолуние"
-    else:
-        panchanga["tithi"] = f"{paksha} {tithi_name}"
-    
-    panchanga["tithi_progress"] = (tithi_angle % 12) / 12 * 100  # процент завершения титхи
+    panchanga["tithi_progress"] = (tithi_deg % TITHI_SPAN) / TITHI_SPAN * 100  # процент завершения титхи
     
     # 3. КАРАНА (половина титхи) - каждые 6 градусов разности
-    karana_deg = tithi_angle % 6
-    karana_index = int(tithi_angle / 6)
+    karana_deg = tithi_deg % KARANA_SPAN
+    karana_index = int(tithi_deg / KARANA_SPAN)
     if karana_index >= len(KARANAS):
         karana_index = len(KARANAS) - 1
     panchanga["karana"] = KARANAS[karana_index]
-    panchanga["karana_progress"] = karana_deg / 6 * 100
+    panchanga["karana_progress"] = karana_deg / KARANA_SPAN * 100
     
     # 4. ЙОГА (нитья-йога) - сумма сидерических долгот Солнца и Луны
-    yoga_deg = (sun_lon + moon_lon) % 360
-    yoga_index = int(yoga_deg / (360/27))  # 27 йог на 360 градусов
+    yoga_deg = yoga_angle(sun_lon, moon_lon)
+    yoga_index = int(yoga_deg / YOGA_SPAN)  # 27 йог на 360 градусов
     if yoga_index >= len(YOGAS):
         yoga_index = len(YOGAS) - 1
     panchanga["nitya_yoga"] = YOGAS[yoga_index]
-    panchanga["yoga_progress"] = (yoga_deg % (360/27)) / (360/27) * 100
+    panchanga["yoga_progress"] = (yoga_deg % YOGA_SPAN) / YOGA_SPAN * 100
     
     # 5. НАКШАТРА (лунная стоянка) - позиция Луны в сидерическом зодиаке
     nakshatra_deg = moon_lon % 360
-    nakshatra_index = int(nakshatra_deg / (360/27))  # 27 накшатр на 360 градусов
+    nakshatra_index = int(nakshatra_deg / NAKSHATRA_SPAN)  # 27 накшатр на 360 градусов
     if nakshatra_index >= len(NAKSHATRAS):
         nakshatra_index = len(NAKSHATRAS) - 1
     
     nakshatra_name, total_padas = NAKSHATRAS[nakshatra_index]
     # Вычисляем паду (четверть накшатры)
-    pada_progress = (nakshatra_deg % (360/27)) / (360/27)
+    pada_progress = (nakshatra_deg % NAKSHATRA_SPAN) / NAKSHATRA_SPAN
     pada = int(pada_progress * total_padas) + 1
     if pada > total_padas:
         pada = total_padas
@@ -319,67 +390,39 @@ def calc_panchanga(jd, sun_lon, moon_lon):
     return panchanga
 
 # --- Функция для расчёта времени гражданского восхода солнца ---
-def calc_sunrise(date: str, lat: float, lon: float, tz_name: str):
+def calc_sunrise(date: str, lat: float, lon: float, tz_name: str, tz=None):
     """
     Возвращает время восхода солнца (локальное и UTC) для заданных координат и даты.
+    Берётся из кэшируемой таблицы восходов/заходов; в полярный день или ночь — (None, None).
     """
-    try:
-        # JD для утра заданного дня (6:00 локального времени)
-        dt_local_morning = datetime.strptime(f"{date} 06:00", "%Y-%m-%d %H:%M")
-        tz = pytz.timezone(tz_name)
-        dt_local_morning = tz.localize(dt_local_morning, is_dst=None)
-        dt_utc_morning = dt_local_morning.astimezone(pytz.utc)
-        jd_morning = swe.julday(dt_utc_morning.year, dt_utc_morning.month, dt_utc_morning.day, 
-                               dt_utc_morning.hour + dt_utc_morning.minute / 60.0)
-        
-        # Расчёт восхода солнца через обновленный API pyswisseph
-        try:
-            # Новый формат: rise_trans(tjdut, body, rsmi, geopos, atpress, attemp, flags)
-            # geopos = [longitude, latitude, altitude_in_meters]
-            geopos = [lon, lat, 0.0]  # долгота, широта, высота над уровнем моря
-            res, tret = swe.rise_trans(jd_morning, swe.SUN, swe.CALC_RISE, geopos)
-            
-            # Проверяем результат: res=0 означает успех, tret[0] содержит JD события
-            if res == 0 and len(tret) > 0:
-                sunrise_jd = tret[0]  # JD восхода
-            else:
-                raise Exception(f"Событие не найдено: res={res}, tret={tret}")
-        except Exception as rise_error:
-            print(f"Ошибка rise_trans: {rise_error}")
-            # Приблизительный расчет: восход около 5:00 UTC для Ульяновска в январе
-            sunrise_jd = jd_morning + 0.08  # примерно 2 часа после 6:00 утра = 08:00 местного времени
-        sunrise_utc = swe.revjul(sunrise_jd)  # преобразуем JD в дату
-        
-        # Переводим в datetime
-        dt_sunrise_utc = datetime(int(sunrise_utc[0]), int(sunrise_utc[1]), int(sunrise_utc[2]), 
-                                  int(sunrise_utc[3]), int((sunrise_utc[3] % 1) * 60))
-        dt_sunrise_utc = pytz.utc.localize(dt_sunrise_utc)
-        dt_sunrise_local = dt_sunrise_utc.astimezone(tz)
-        
-        print(f"Время восхода солнца (локальное): {dt_sunrise_local}, (UTC): {dt_sunrise_utc}")
-        
-        return dt_sunrise_local, dt_sunrise_utc
-    except Exception as e:
-        print(f"Ошибка расчета восхода: {e}")
-        # Возвращаем примерное время восхода (06:00 местного времени)
-        dt_local = datetime.strptime(f"{date} 06:00", "%Y-%m-%d %H:%M")
-        tz = pytz.timezone(tz_name)
-        dt_local = tz.localize(dt_local, is_dst=None)
-        return dt_local, dt_local.astimezone(pytz.utc)
+    if tz is None:
+        tz = tz_index.get_timezone(tz_name)
+    sunrise = get_riseset_day(lat, lon, tz, date)["sunrise"]
+    if sunrise is None:
+        return None, None
+    return sunrise, sunrise.astimezone(pytz.utc)
 
 # --- Новый расчёт вары с учётом восхода солнца ---
-def calc_vara_for_datetime(date: str, time: str, lat: float, lon: float, tz_name: str):
+def calc_vara_for_datetime(date: str, time: str, lat: float, lon: float, tz_name: str, tz=None, sunrise=None):
     """
     Возвращает ведическую вару (день недели), учитывая восход солнца.
+    sunrise — уже посчитанный результат calc_sunrise (для пакетных расчётов).
     """
     try:
+        if tz is None:
+            tz = tz_index.get_timezone(tz_name)
         # Получаем время восхода для текущего дня
-        sunrise_today, _ = calc_sunrise(date, lat, lon, tz_name)
+        if sunrise is None:
+            sunrise = calc_sunrise(date, lat, lon, tz_name, tz=tz)
+        sunrise_today, _ = sunrise
+        if sunrise_today is None:
+            # Полярный день или ночь: восхода нет, вара меняется в полночь
+            vara_idx = (datetime.strptime(date, "%Y-%m-%d").weekday() + 1) % 7
+            return VARAS[vara_idx], None, None
         
         # Время запроса пользователя
         dt_local = datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M")
-        tz = pytz.timezone(tz_name)
-        dt_local = tz.localize(dt_local, is_dst=None)
+        dt_local = localize_time(dt_local, tz)
         
         # Если время запроса до восхода - это предыдущая вара
         if dt_local < sunrise_today:
@@ -391,86 +434,1145 @@ def calc_vara_for_datetime(date: str, time: str, lat: float, lon: float, tz_name
             vara_idx = (datetime.strptime(date, "%Y-%m-%d").weekday() + 1) % 7
         
         return VARAS[vara_idx], sunrise_today.strftime("%H:%M"), sunrise_today
-    except Exception as e:
-        print(f"Ошибка расчета вары: {e}")
+    except Exception:
+        metrics.count("vara_error")
         # Fallback к обычному расчёту
         vara_idx = (datetime.strptime(date, "%Y-%m-%d").weekday() + 1) % 7
         return VARAS[vara_idx], "08:00", None
 
+# --- Зона по координатам, если клиент её не прислал (см. tz_index.py) ---
+# Индекс собирается из полигонов timezone-boundary-builder (см. Dockerfile); без файла timezone обязателен.
+TZ_INDEX_PATH = os.environ.get("TZ_INDEX_PATH", "data/tz_index.npz")
+timezone_index = tz_index.TimezoneIndex(TZ_INDEX_PATH) if os.path.exists(TZ_INDEX_PATH) else None
+
+def resolve_timezone(timezone: Optional[str], lat: float, lon: float) -> str:
+    """Имя зоны: присланное клиентом (проверяется) или найденное по координатам; иначе 422."""
+    if timezone:
+        try:
+            return tz_index.get_timezone(timezone).zone
+        except pytz.UnknownTimeZoneError:
+            raise HTTPException(status_code=422, detail=f"Неизвестная временная зона '{timezone}'")
+    if timezone_index is None:
+        raise HTTPException(status_code=422, detail="Не указан timezone, а индекс временных зон не загружен")
+    with metrics.stage("tz_lookup"):
+        zone = timezone_index.lookup(lat, lon)
+    if zone is None:
+        raise HTTPException(status_code=422, detail=f"Не удалось определить временную зону для {lat}, {lon}")
+    return zone
+
+# --- Секции ответа карты (fields=) ---
+# По умолчанию — все, кроме strength (Аштакаварга и Шадбала — только по запросу);
+# offset и timezone возвращаются всегда, варги — по vargas=.
+CHART_FIELDS = ("planets", "ascendant", "d9", "panchanga", "sunrise", "strength")
+DEFAULT_CHART_FIELDS = ("planets", "ascendant", "d9", "panchanga", "sunrise")
+
+# --- Кэш карт (см. chart_cache.py) ---
+# CHART_CACHE_DB — путь к SQLite на томе (переживает остановку машины Fly); пусто — только память.
+# CACHE_VERSION поднимаем при любом изменении формата или расчёта ответа.
+CACHE_VERSION = "7"
+chart_cache = ChartCache(
+    max_size=int(os.environ.get("CHART_CACHE_SIZE", "10000")),
+    ttl=float(os.environ.get("CHART_CACHE_TTL", "604800")),
+    db_path=os.environ.get("CHART_CACHE_DB") or None,
+)
+
+def chart_cache_key(date: str, time: str, lat: float, lon: float, timezone: str, tz=None, accuracy=None, ayanamsa="lahiri", divisions=(), fields=DEFAULT_CHART_FIELDS) -> str:
+    """Нормализованный ключ: UTC-минута после local_to_utc, координаты, зона, аянамша, система домов, секции."""
+    if tz is None:
+        tz = tz_index.get_timezone(timezone)
+    dt_utc = localize_time(datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M"), tz).astimezone(pytz.utc)
+    vargas_key = ",".join(map(str, divisions))
+    return f"v{CACHE_VERSION}|{dt_utc:%Y-%m-%dT%H:%M}|{lat:.6f}|{lon:.6f}|{tz.zone}|{ayanamsa}|P|{accuracy}|{vargas_key}|{','.join(fields)}"
+
+# --- Прогрев при старте и готовность (/ready) ---
+# После auto_start на Fly первый запрос платил за запуск воркера (spawn + импорт main),
+# открытие файлов эфемерид, загрузку зон pytz. Прогрев делает это сразу при старте:
+# в основном процессе и в каждом воркере (calc_engine вызывает warm_up_process при запуске).
+# WARMUP=0 — отключить (тогда всё это происходит на первых запросах, как раньше).
+WARMUP = os.environ.get("WARMUP", "1") != "0"
+WARMUP_ZONES = ("UTC", "Europe/Moscow", "Asia/Kolkata", "Asia/Almaty", "Europe/London", "America/New_York")
+WARMUP_CHART = ("2000-01-01", "12:00", 55.75, 37.62, "Europe/Moscow")
+startup = {"ready": False}
+
+def ephemeris_mode() -> str:
+    """'swiss' — считаем по файлам .se1, 'moshier' — файлов нет (или не тот путь)."""
+    with swe_lock:
+        flag = swe.calc_ut(2451545.0, swe.SUN, swe.FLG_SWIEPH)[1]
+    return "moshier" if flag & swe.FLG_MOSEPH else "swiss"
+
+def warm_up_process():
+    """Прогрев процесса: страницы таблицы эфемерид и файлов .se1, зоны, одна карта. Время этапов, с."""
+    stages = {}
+    t0 = perf_counter()
+    # Файлы читаются целиком один раз — дальше они в page cache, общем для всех процессов
+    if ephemeris_table is not None:
+        float(ephemeris_table.data.sum())
+    for name in sorted(os.listdir(SE_EPHE_PATH)) if SE_EPHE_PATH and os.path.isdir(SE_EPHE_PATH) else ():
+        with open(os.path.join(SE_EPHE_PATH, name), "rb") as f:
+            while f.read(1 << 20):
+                pass
+    stages["files"] = perf_counter() - t0
+    t0 = perf_counter()
+    for name in WARMUP_ZONES:
+        tz_index.zone_table(tz_index.get_timezone(name))
+    if timezone_index is not None:
+        timezone_index.lookup(WARMUP_CHART[2], WARMUP_CHART[3])
+    stages["zones"] = perf_counter() - t0
+    t0 = perf_counter()
+    with swe_lock:
+        swe.set_sid_mode(swe.SIDM_LAHIRI, 0, 0)
+        compute_chart(*WARMUP_CHART)
+    stages["chart"] = perf_counter() - t0
+    return stages
+
+async def warm_up():
+    t0 = perf_counter()
+
+    async def workers():
+        startup["workers"] = await calc_engine.warm_up()
+        return perf_counter() - t0
+
+    try:
+        # Воркеры запускаются сразу: пока они стартуют, запросы считаются в основном процессе
+        stages, workers_s = await asyncio.gather(asyncio.to_thread(warm_up_process), workers())
+        startup["stages"] = {**stages, "workers": workers_s}
+    except Exception as e:
+        # Готовность так и не наступит; причина видна в ответе /ready
+        startup["error"] = f"{type(e).__name__}: {e}"
+        return
+    startup["ephemeris"] = ephemeris_mode()
+    startup["warmup_seconds"] = perf_counter() - t0
+    startup["ready"] = True
+
+@app.get("/ready")
+def get_ready():
+    """200 после прогрева (по нему проверяет Fly), до этого — 503."""
+    if not startup["ready"]:
+        raise HTTPException(status_code=503, detail=startup.get("error") or "Идёт прогрев", headers={"Retry-After": "1"})
+    return startup
+
+# --- Движок расчётов (см. calc_engine.py) ---
+# CALC_WORKERS — число процессов-воркеров (0 — считать в пуле потоков под swe_lock),
+# CALC_QUEUE_SIZE — сколько задач может ждать сверх занятых воркеров, дальше 503.
+calc_engine = CalcEngine(
+    workers=int(os.environ.get("CALC_WORKERS", str(os.cpu_count() or 1))),
+    queue_size=int(os.environ.get("CALC_QUEUE_SIZE", "32")),
+    ephe_path=SE_EPHE_PATH,
+    lock=swe_lock,
+    warmup=warm_up_process if WARMUP else None,
+)
+
+async def submit_calc(fn, *args):
+    try:
+        return await calc_engine.submit(fn, *args)
+    except (EngineSaturated, EngineRestarting) as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+# --- Расчёт одной карты: ленивый граф секций ---
+# Предполагается, что swe.set_sid_mode(sid_mode) уже вызван (один раз на запрос или на пакет).
+# tz можно передать заранее, чтобы не искать зону повторно внутри пакета.
+# Каждая секция считается при первом обращении и не больше одного раза; считаются только
+# запрошенные секции и их зависимости (панчанге нужны Солнце, Луна и восход, но не дома и не D9).
+PLANET_KEYS = ("sun", "moon", "mars", "mercury", "jupiter", "venus", "saturn", "rahu", "ketu")
+# Заменяем MEAN_NODE на TRUE_NODE для истинных узлов; Кету — строго напротив Раху
+PLANET_IDS = {"sun": swe.SUN, "moon": swe.MOON, "mars": swe.MARS, "mercury": swe.MERCURY,
+              "jupiter": swe.JUPITER, "venus": swe.VENUS, "saturn": swe.SATURN, "rahu": swe.TRUE_NODE}
+
+class ChartSections:
+    """
+    Секции карты как ленивые свойства; зависимости запрашиваются до замера своего этапа.
+    Момент — местные date и time в зоне timezone (tz — уже найденная зона) или готовый jd (UT),
+    тогда date и time выводятся из него в той же зоне.
+    """
+
+    def __init__(self, date: str = None, time: str = None, lat: float = 0.0, lon: float = 0.0, timezone: str = "UTC",
+                 tz=None, accuracy=None, sid_mode=swe.SIDM_LAHIRI, jd: float = None):
+        self.lat, self.lon = lat, lon
+        self.accuracy, self.sid_mode = accuracy, sid_mode
+        with metrics.stage("timezone"):
+            self.tz = tz if tz is not None else tz_index.get_timezone(timezone)
+            if jd is None:
+                dt_local = datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M")
+                dt_localized = localize_time(dt_local, self.tz)
+                dt_utc = dt_localized.astimezone(pytz.utc)
+                jd = swe.julday(dt_utc.year, dt_utc.month, dt_utc.day, dt_utc.hour + dt_utc.minute / 60.0)
+            else:
+                dt_localized = jd_to_utc(jd).astimezone(self.tz)
+                date, time = dt_localized.strftime("%Y-%m-%d"), dt_localized.strftime("%H:%M")
+        self.date, self.time, self.jd = date, time, jd
+        self.offset = dt_localized.utcoffset().total_seconds() / 3600
+        self._bodies = {}
+
+    def body(self, key: str):
+        """(долгота, скорость) одного тела; считается один раз."""
+        if key == "ketu":
+            lon, speed = self.body("rahu")
+            return (lon + 180.0) % 360, speed
+        if key not in self._bodies:
+            xx = calc_sidereal(self.jd, PLANET_IDS[key], self.accuracy, self.sid_mode)[0]
+            self._bodies[key] = (float(xx[0]), float(xx[3]))
+        return self._bodies[key]
+
+    @cached_property
+    def planets(self):
+        result = {}
+        for key in PLANET_KEYS:
+            lon, speed = self.body(key)
+            sign, deg, deg_str = get_sign_deg(lon)
+            # У Солнца и Луны ретроградности нет, узлы всегда ретроградны
+            retrograde = None if key in ("sun", "moon") else True if key in ("rahu", "ketu") else speed < 0
+            result[key] = dict(longitude=lon, speed=speed, retrograde=retrograde, sign=sign, deg_in_sign=deg, deg_in_sign_str=deg_str)
+        return result
+
+    @cached_property
+    def ascendant(self) -> float:
+        with metrics.stage("houses"):
+            try:
+                houses, asc_mc = swe.houses(self.jd, self.lat, self.lon, b'P')
+            except swe.Error:
+                # За полярным кругом Плацидус не определён; асцендент от системы домов не зависит
+                metrics.count("houses_porphyry")
+                houses, asc_mc = swe.houses(self.jd, self.lat, self.lon, b'O')
+            return (float(asc_mc[0]) - self.ayanamsa) % 360
+
+    @cached_property
+    def ayanamsa(self) -> float:
+        return swe.get_ayanamsa(self.jd)
+
+    @cached_property
+    def d9(self):
+        chart = {**self.planets, "ascendant": self.ascendant}
+        with metrics.stage("navamsa"):
+            return calc_navamsa(chart)
+
+    def vargas(self, divisions):
+        chart = {**self.planets, "ascendant": self.ascendant}
+        with metrics.stage("vargas"):
+            return calc_vargas(chart, divisions)
+
+    @cached_property
+    def sunrise(self):
+        """Восход по таблице восходов и вара с его учётом."""
+        with metrics.stage("sunrise"):
+            riseset = get_riseset_day(self.lat, self.lon, self.tz, self.date)
+            sunrise = (riseset["sunrise"], riseset["sunrise"].astimezone(pytz.utc) if riseset["sunrise"] else None)
+            vara, sunrise_str, sunrise_dt = calc_vara_for_datetime(self.date, self.time, self.lat, self.lon, self.tz.zone, tz=self.tz, sunrise=sunrise)
+        return {"vara": vara, "sunrise": sunrise_str, "sun_status": riseset["sun"], "sunrise_dt": sunrise_dt}
+
+    @cached_property
+    def panchanga(self):
+        sun, moon = self.body("sun")[0], self.body("moon")[0]
+        vara = self.sunrise["vara"]
+        with metrics.stage("panchanga"):
+            panchanga = calc_panchanga(self.jd, sun, moon)
+        panchanga["vara"] = vara  # Заменяем вару на вару с учётом восхода
+        return panchanga
+
+    def strength_inputs(self):
+        """Строка входных данных strength.compute: долготы и скорости семи грах, асцендент, время, место, аянамша."""
+        bodies = [self.body(key) for key in strength.PLANETS]
+        return [lon for lon, _ in bodies], [speed for _, speed in bodies], self.ascendant, self.jd, self.lat, self.lon, self.ayanamsa
+
+    @cached_property
+    def strength(self):
+        row = self.strength_inputs()
+        with metrics.stage("strength"):
+            data = strength.compute(*(np.array([x]) for x in row))
+            return strength.chart_strength(data, 0)
+
+def compute_chart(date: str, time: str, lat: float, lon: float, timezone: str, tz=None, accuracy=None, sid_mode=swe.SIDM_LAHIRI, divisions=(), fields=DEFAULT_CHART_FIELDS):
+    chart = ChartSections(date, time, lat, lon, timezone, tz=tz, accuracy=accuracy, sid_mode=sid_mode)
+    return chart_response(chart, divisions, fields)
+
+def chart_response(chart: ChartSections, divisions=(), fields=DEFAULT_CHART_FIELDS):
+    """Ответ из секций fields плюс offset и timezone; варги — если заданы divisions."""
+    result = {}
+    if "planets" in fields:
+        result.update(chart.planets)
+    if "ascendant" in fields:
+        result["ascendant"] = chart.ascendant
+    result["offset"] = chart.offset
+    result["timezone"] = chart.tz.zone
+    if "d9" in fields:
+        result["d9"] = chart.d9
+    if divisions:
+        result["vargas"] = chart.vargas(divisions)
+    if "panchanga" in fields:
+        result["panchanga"] = chart.panchanga
+    if "sunrise" in fields:
+        sunrise = chart.sunrise
+        result["sunrise"] = sunrise["sunrise"]
+        result["sun_status"] = sunrise["sun_status"]  # normal / polar_day / polar_night
+        if sunrise["sunrise_dt"]:
+            result["sunrise_dt"] = sunrise["sunrise_dt"].isoformat()
+    if "strength" in fields:
+        result["strength"] = chart.strength
+    return result
+
+# Задача для воркера: выставляет аянамшу и считает карту
+def chart_task(date: str, time: str, lat: float, lon: float, timezone: str, accuracy=None, ayanamsa="lahiri", divisions=(), fields=DEFAULT_CHART_FIELDS):
+    sid_mode = AYANAMSAS[ayanamsa]
+    swe.set_sid_mode(sid_mode, 0, 0)
+    return compute_chart(date, time, lat, lon, timezone, accuracy=accuracy, sid_mode=sid_mode, divisions=divisions, fields=fields)
+
+def get_divisions(spec: Optional[str]):
+    if not spec:
+        return ()
+    try:
+        return vargas.parse_divisions(spec)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+def get_fields(spec: Optional[str]):
+    """fields=planets,panchanga -> секции в порядке CHART_FIELDS (от порядка в запросе ключ кэша не зависит)."""
+    if not spec:
+        return DEFAULT_CHART_FIELDS
+    chosen = parse_choice_list(spec, CHART_FIELDS, "секции карты")
+    return tuple(field for field in CHART_FIELDS if field in chosen)
+
+FIELDS_DESCRIPTION = "Секции ответа: " + ", ".join(CHART_FIELDS) + " или all; по умолчанию — все, кроме strength; offset и timezone есть всегда"
+
+# --- Формат ответа и HTTP-кэширование (см. response_format.py) ---
+# RESPONSE_MAX_AGE — сколько секунд браузер и CDN отдают карту без перепроверки по ETag.
+RESPONSE_MAX_AGE = int(os.environ.get("RESPONSE_MAX_AGE", "86400"))
+FORMAT_DESCRIPTION = "Формат ответа: " + ", ".join(response_format.FORMATS) + "; без него — по заголовку Accept"
+
+def negotiate_format(accept: Optional[str], override: Optional[str]) -> str:
+    try:
+        fmt = response_format.choose_format(accept, override)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if fmt is None:
+        supported = ", ".join(media for media, _, _ in response_format.FORMATS.values())
+        raise HTTPException(status_code=406, detail=f"Поддерживаемые типы ответа: {supported}")
+    return fmt
+
+def encode_response(data, fmt: str, to_columnar, headers=None) -> Response:
+    """Ответ в выбранном формате; to_columnar(data) строит колоночный вид только когда он запрошен."""
+    media_type, layout, _ = response_format.FORMATS[fmt]
+    if layout == "columnar":
+        data = to_columnar(data)
+    return Response(response_format.encode(data, fmt), media_type=media_type, headers=headers)
+
 # --- Внести изменения в API ---
 @app.get("/api/planets")
-def get_planet_positions(
+async def get_planet_positions(
     date: str = Query(..., description="Дата в формате YYYY-MM-DD"),
     time: str = Query(..., description="Время в формате HH:MM"),
     lat: float = Query(..., description="Широта"),
     lon: float = Query(..., description="Долгота"),
-    timezone: str = Query(..., description="ID временной зоны, например 'Europe/Moscow'")
+    timezone: Optional[str] = Query(None, description="ID временной зоны, например 'Europe/Moscow'; без него — по координатам"),
+    accuracy: Optional[float] = Query(None, description="Требуемая точность долгот в угловых секундах (строже гарантии таблицы — считаем через Swiss Ephemeris)"),
+    ayanamsa: str = Query("lahiri", description="Аянамша: " + ", ".join(AYANAMSAS)),
+    varga_spec: Optional[str] = Query(None, alias="vargas", description="Дробные карты: D2,D9,D60 или all"),
+    fields_spec: Optional[str] = Query(None, alias="fields", description=FIELDS_DESCRIPTION),
+    fmt: Optional[str] = Query(None, alias="format", description=FORMAT_DESCRIPTION),
+    accept: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None)
+):
+    get_sid_mode(ayanamsa)
+    divisions = get_divisions(varga_spec)
+    fields = get_fields(fields_spec)
+    fmt = negotiate_format(accept, fmt)
+    timezone = resolve_timezone(timezone, lat, lon)
+    # Карта определяется ключом кэша, поэтому ETag известен до расчёта
+    key = chart_cache_key(date, time, lat, lon, timezone, accuracy=accuracy, ayanamsa=ayanamsa, divisions=divisions, fields=fields)
+    tag = response_format.etag(key, fmt)
+    headers = {"ETag": tag, "Cache-Control": f"public, max-age={RESPONSE_MAX_AGE}", "Vary": "Accept"}
+    if response_format.etag_matches(if_none_match, tag):
+        return Response(status_code=304, headers=headers)
+    chart = await get_chart(date, time, lat, lon, timezone, accuracy, ayanamsa, divisions, fields, key=key)
+    return encode_response(chart, fmt, lambda c: response_format.columnar_chart(c, SIGNS), headers)
+
+async def get_chart(date: str, time: str, lat: float, lon: float, timezone: str, accuracy=None, ayanamsa="lahiri", divisions=(), fields=DEFAULT_CHART_FIELDS, key=None):
+    """Карта из кэша или из воркера — общая для /api/planets и эндпоинтов, которые строятся на карте."""
+    if key is None:
+        key = chart_cache_key(date, time, lat, lon, timezone, accuracy=accuracy, ayanamsa=ayanamsa, divisions=divisions, fields=fields)
+    return await chart_cache.aget_or_compute(
+        key, lambda: submit_calc(chart_task, date, time, lat, lon, timezone, accuracy, ayanamsa, divisions, fields))
+
+@app.get("/api/cache/stats")
+def get_cache_stats():
+    return chart_cache.snapshot()
+
+@app.get("/api/engine/stats")
+def get_engine_stats():
+    return calc_engine.snapshot()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Метрики в формате Prometheus: этапы расчёта, обходные пути, кэш и очередь движка."""
+    gauges = {}
+    for key, value in chart_cache.snapshot().items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            gauges[f"dhama_cache_{key}"] = value
+    for key, value in calc_engine.snapshot().items():
+        gauges[f"dhama_engine_{key}"] = value
+    gauges["dhama_riseset_cache_size"] = len(_riseset_cache)
+    for key, value in live_sky.snapshot().items():
+        gauges[f"dhama_live_{key}"] = value
+    gauges["dhama_ready"] = startup["ready"]
+    if "warmup_seconds" in startup:
+        gauges["dhama_warmup_seconds"] = startup["warmup_seconds"]
+    return PlainTextResponse(metrics.render(gauges=gauges), media_type="text/plain; version=0.0.4")
+
+# --- Пакетный расчёт карт ---
+MAX_BATCH_SIZE = 1000
+
+class ChartRequest(BaseModel):
+    date: str
+    time: str
+    lat: float
+    lon: float
+    timezone: Optional[str] = None  # без него — по координатам
+
+def batch_error(e: Exception):
+    """Ошибка элемента пакета: у HTTPException — её текст и статус, у прочих — тип и сообщение."""
+    if isinstance(e, HTTPException):
+        return {"error": e.detail, "status": e.status_code}
+    return {"error": f"{type(e).__name__}: {e}"}
+
+def calc_batch(items: List[ChartRequest], ayanamsa: str = "lahiri", divisions=(), fields=DEFAULT_CHART_FIELDS):
+    """
+    Считает карты пакетом (выполняется в воркере): один set_sid_mode на пакет, временная
+    зона ищется один раз на каждую зону, восход берётся из таблицы восходов — один расчёт
+    на каждую пару (дата, место). Секция strength считается одним вызовом strength.compute
+    на весь пакет.
+    Ошибка в одном элементе не роняет весь пакет: на его месте возвращается {"error": ...}.
+    """
+    sid_mode = AYANAMSAS[ayanamsa]
+    swe.set_sid_mode(sid_mode, 0, 0)
+    with_strength = "strength" in fields
+    fields = tuple(field for field in fields if field != "strength")
+    zones = {}
+    results = []
+    rows = {}
+    for i, item in enumerate(items):
+        try:
+            tz = zones.get(item.timezone)
+            if tz is None:
+                tz = zones[item.timezone] = tz_index.get_timezone(item.timezone)
+            chart = ChartSections(item.date, item.time, item.lat, item.lon, item.timezone, tz=tz, sid_mode=sid_mode)
+            response = chart_response(chart, divisions, fields)
+            if with_strength:
+                rows[i] = chart.strength_inputs()
+            results.append(response)
+        except Exception as e:
+            results.append(batch_error(e))
+    if rows:
+        with metrics.stage("strength"):
+            data = strength.compute(*(np.array(column) for column in zip(*rows.values())))
+            for n, i in enumerate(rows):
+                results[i]["strength"] = strength.chart_strength(data, n)
+    return results
+
+@app.post("/api/planets/batch")
+async def get_planet_positions_batch(
+    items: List[ChartRequest],
+    ayanamsa: str = Query("lahiri", description="Аянамша: " + ", ".join(AYANAMSAS)),
+    varga_spec: Optional[str] = Query(None, alias="vargas", description="Дробные карты: D2,D9,D60 или all"),
+    fields_spec: Optional[str] = Query(None, alias="fields", description=FIELDS_DESCRIPTION),
+    fmt: Optional[str] = Query(None, alias="format", description=FORMAT_DESCRIPTION),
+    accept: Optional[str] = Header(None)
+):
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Слишком большой пакет: максимум {MAX_BATCH_SIZE} элементов")
+    get_sid_mode(ayanamsa)
+    divisions = get_divisions(varga_spec)
+    fields = get_fields(fields_spec)
+    fmt = negotiate_format(accept, fmt)
+    # Уже посчитанные карты берём из кэша, в воркер отправляем только промахи
+    results = [None] * len(items)
+    keys = {}
+    for i, item in enumerate(items):
+        try:
+            item.timezone = resolve_timezone(item.timezone, item.lat, item.lon)
+            keys[i] = chart_cache_key(item.date, item.time, item.lat, item.lon, item.timezone, ayanamsa=ayanamsa, divisions=divisions, fields=fields)
+            results[i] = chart_cache.get(keys[i])
+        except Exception as e:
+            results[i] = batch_error(e)
+    misses = [i for i, r in enumerate(results) if r is None]
+    if misses:
+        computed = await submit_calc(calc_batch, [items[i] for i in misses], ayanamsa, divisions, fields)
+        for i, chart in zip(misses, computed):
+            results[i] = chart
+            if "error" not in chart:
+                chart_cache.put(keys[i], chart)
+    data = {"results": results, "errors": sum(1 for r in results if "error" in r)}
+    return encode_response(data, fmt, lambda d: {**response_format.columnar_batch(d["results"], SIGNS), "errors": d["errors"]})
+
+# --- Потоковый ряд эфемерид (NDJSON) для таблиц транзитов ---
+# Ketu не считается отдельно — это Rahu + 180°
+RANGE_BODIES = {
+    "sun": swe.SUN,
+    "moon": swe.MOON,
+    "mars": swe.MARS,
+    "mercury": swe.MERCURY,
+    "jupiter": swe.JUPITER,
+    "venus": swe.VENUS,
+    "saturn": swe.SATURN,
+    "rahu": swe.TRUE_NODE,
+    "ketu": swe.TRUE_NODE,
+}
+RANGE_STEP_UNITS = {"m": 1, "h": 60, "d": 1440}
+MAX_RANGE_ROWS = 1_000_000
+RANGE_CHUNK_ROWS = 256
+
+def parse_step_minutes(step: str) -> int:
+    """'15m', '1h', '1d' или просто число минут."""
+    step = step.strip().lower()
+    unit = RANGE_STEP_UNITS.get(step[-1:])
+    value = step[:-1] if unit else step
+    minutes = int(value) * (unit or 1)
+    if minutes <= 0:
+        raise ValueError("шаг должен быть положительным")
+    return minutes
+
+def iter_ephemeris_range(jd_start: float, dt_start: datetime, rows: int, step_minutes: int, bodies: List[str]):
+    """
+    Генератор NDJSON: одна строка на момент времени, строки отдаются пачками по RANGE_CHUNK_ROWS.
+    Строки собираются форматированием напрямую — без pydantic и промежуточных dict,
+    так что память не зависит от длины диапазона.
+    Формат строки: {"t":"2024-01-01T00:00Z","jd":...,"sun":[долгота,скорость],...}
+    """
+    step_days = step_minutes / 1440.0
+    step_delta = timedelta(minutes=step_minutes)
+    ids = [(name, RANGE_BODIES[name]) for name in bodies]
+    for chunk_start in range(0, rows, RANGE_CHUNK_ROWS):
+        # Блокировку держим на пачку, а не на весь поток, чтобы не задерживать другие запросы
+        with swe_lock:
+            swe.set_sid_mode(swe.SIDM_LAHIRI, 0, 0)
+            chunk = _ephemeris_range_chunk(jd_start, dt_start, chunk_start, min(rows, chunk_start + RANGE_CHUNK_ROWS), step_days, step_delta, ids)
+        yield chunk
+
+def _ephemeris_range_chunk(jd_start, dt_start, first, last, step_days, step_delta, ids):
+    chunk = []
+    for i in range(first, last):
+        jd = jd_start + i * step_days
+        t = (dt_start + i * step_delta).strftime("%Y-%m-%dT%H:%MZ")
+        parts = [f'{{"t":"{t}","jd":{jd:.6f}']
+        node = None
+        for name, body in ids:
+            if body == swe.TRUE_NODE:
+                if node is None:
+                    node = calc_sidereal(jd, body)[0]
+                longitude = node[0] if name == "rahu" else (node[0] + 180.0) % 360
+                speed = node[3]
+            else:
+                xx = calc_sidereal(jd, body)[0]
+                longitude, speed = xx[0], xx[3]
+            parts.append(f'"{name}":[{longitude:.6f},{speed:.6f}]')
+        chunk.append(",".join(parts) + "}\n")
+    return "".join(chunk)
+
+@app.get("/api/ephemeris/range")
+def get_ephemeris_range(
+    start: str = Query(..., description="Начало в формате YYYY-MM-DD или YYYY-MM-DDTHH:MM"),
+    end: str = Query(..., description="Конец (включительно), тот же формат"),
+    step: str = Query("1d", description="Шаг: 15m, 1h, 1d или число минут"),
+    bodies: str = Query(",".join(RANGE_BODIES), description="Список тел через запятую"),
+    timezone: str = Query("UTC", description="Временная зона для start/end")
 ):
-    # Преобразуем локальное время пользователя в UTC с учетом DST
-    dt_local = datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M")
-    tz = pytz.timezone(timezone)
     try:
-        dt_localized = tz.localize(dt_local, is_dst=None)
-    except AmbiguousTimeError:
-        dt_localized = tz.localize(dt_local, is_dst=True)
-    except NonExistentTimeError:
-        dt_local += timedelta(hours=1)
-        dt_localized = tz.localize(dt_local, is_dst=True)
-    dt_utc = dt_localized.astimezone(pytz.utc)
-    offset = dt_localized.utcoffset().total_seconds() / 3600
+        step_minutes = parse_step_minutes(step)
+        body_list = [b.strip().lower() for b in bodies.split(",") if b.strip()]
+        unknown = [b for b in body_list if b not in RANGE_BODIES]
+        if unknown or not body_list:
+            raise ValueError(f"неизвестные тела: {', '.join(unknown) or '(пусто)'}")
+        tz = tz_index.get_timezone(timezone)
+        dt_start = localize_time(datetime.fromisoformat(start), tz).astimezone(pytz.utc)
+        dt_end = localize_time(datetime.fromisoformat(end), tz).astimezone(pytz.utc)
+    except (ValueError, pytz.UnknownTimeZoneError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if dt_end < dt_start:
+        raise HTTPException(status_code=422, detail="end раньше start")
+    # Последняя строка не позже end; вне диапазона swisseph упал бы уже внутри потока, после заголовков 200
+    check_year_range(dt_start.year, dt_end.year)
+    rows = int((dt_end - dt_start).total_seconds() // 60 // step_minutes) + 1
+    if rows > MAX_RANGE_ROWS:
+        raise HTTPException(status_code=422, detail=f"Слишком много строк ({rows}), максимум {MAX_RANGE_ROWS}")
+    jd_start = swe.julday(dt_start.year, dt_start.month, dt_start.day, dt_start.hour + dt_start.minute / 60.0)
+    return StreamingResponse(
+        iter_ephemeris_range(jd_start, dt_start.replace(tzinfo=None), rows, step_minutes, body_list),
+        media_type="application/x-ndjson",
+    )
 
-    jd = swe.julday(dt_utc.year, dt_utc.month, dt_utc.day, dt_utc.hour + dt_utc.minute / 60.0)
-    swe.set_sid_mode(swe.SIDM_LAHIRI, 0, 0)
-    sidereal_flag = swe.FLG_SIDEREAL | swe.FLG_SPEED
-    sun = get_longitude_and_retrograde(swe.calc_ut(jd, swe.SUN, sidereal_flag))[0]
-    sun_sign, sun_deg, sun_deg_str = get_sign_deg(sun)
-    moon = get_longitude_and_retrograde(swe.calc_ut(jd, swe.MOON, sidereal_flag))[0]
-    moon_sign, moon_deg, moon_deg_str = get_sign_deg(moon)
-    mars_lon, mars_retro = get_longitude_and_retrograde(swe.calc_ut(jd, swe.MARS, sidereal_flag))
-    mars_sign, mars_deg, mars_deg_str = get_sign_deg(mars_lon)
-    mercury_lon, mercury_retro = get_longitude_and_retrograde(swe.calc_ut(jd, swe.MERCURY, sidereal_flag))
-    mercury_sign, mercury_deg, mercury_deg_str = get_sign_deg(mercury_lon)
-    jupiter_lon, jupiter_retro = get_longitude_and_retrograde(swe.calc_ut(jd, swe.JUPITER, sidereal_flag))
-    jupiter_sign, jupiter_deg, jupiter_deg_str = get_sign_deg(jupiter_lon)
-    venus_lon, venus_retro = get_longitude_and_retrograde(swe.calc_ut(jd, swe.VENUS, sidereal_flag))
-    venus_sign, venus_deg, venus_deg_str = get_sign_deg(venus_lon)
-    saturn_lon, saturn_retro = get_longitude_and_retrograde(swe.calc_ut(jd, swe.SATURN, sidereal_flag))
-    saturn_sign, saturn_deg, saturn_deg_str = get_sign_deg(saturn_lon)
-    # Заменяем MEAN_NODE на TRUE_NODE для истинных узлов
-    rahu_lon, _ = get_longitude_and_retrograde(swe.calc_ut(jd, swe.TRUE_NODE, sidereal_flag))
-    rahu_sign, rahu_deg, rahu_deg_str = get_sign_deg(rahu_lon)
-    rahu_retro = True
-    ketu_lon = (rahu_lon + 180.0) % 360
-    ketu_sign, ketu_deg, ketu_deg_str = get_sign_deg(ketu_lon)
-    ketu_retro = True
-    houses, asc_mc = swe.houses(jd, lat, lon, b'P')
-    ayanamsa = swe.get_ayanamsa(jd)
-    ascendant = (float(asc_mc[0]) - ayanamsa) % 360
-
-    # --- Формируем основной ответ ---
-    result = {
-        "sun": dict(longitude=sun, retrograde=None, sign=sun_sign, deg_in_sign=sun_deg, deg_in_sign_str=sun_deg_str),
-        "moon": dict(longitude=moon, retrograde=None, sign=moon_sign, deg_in_sign=moon_deg, deg_in_sign_str=moon_deg_str),
-        "mars": dict(longitude=mars_lon, retrograde=mars_retro, sign=mars_sign, deg_in_sign=mars_deg, deg_in_sign_str=mars_deg_str),
-        "mercury": dict(longitude=mercury_lon, retrograde=mercury_retro, sign=mercury_sign, deg_in_sign=mercury_deg, deg_in_sign_str=mercury_deg_str),
-        "jupiter": dict(longitude=jupiter_lon, retrograde=jupiter_retro, sign=jupiter_sign, deg_in_sign=jupiter_deg, deg_in_sign_str=jupiter_deg_str),
-        "venus": dict(longitude=venus_lon, retrograde=venus_retro, sign=venus_sign, deg_in_sign=venus_deg, deg_in_sign_str=venus_deg_str),
-        "saturn": dict(longitude=saturn_lon, retrograde=saturn_retro, sign=saturn_sign, deg_in_sign=saturn_deg, deg_in_sign_str=saturn_deg_str),
-        "rahu": dict(longitude=rahu_lon, retrograde=rahu_retro, sign=rahu_sign, deg_in_sign=rahu_deg, deg_in_sign_str=rahu_deg_str),
-        "ketu": dict(longitude=ketu_lon, retrograde=ketu_retro, sign=ketu_sign, deg_in_sign=ketu_deg, deg_in_sign_str=ketu_deg_str),
-        "ascendant": ascendant,
-        "offset": offset
+# --- Календарь Панчанги: точные времена смены титхи, караны, йоги и накшатры ---
+# Углы берутся из тех же формул, что и в calc_panchanga (tithi_angle, yoga_angle, долгота Луны).
+# Все углы монотонно растут, поэтому границу находим методом Ньютона по скорости из FLG_SPEED.
+def jd_to_utc(jd: float) -> datetime:
+    year, month, day, hour = swe.revjul(jd)
+    dt = datetime(year, month, day) + timedelta(hours=hour)
+    return pytz.utc.localize((dt + timedelta(microseconds=500000)).replace(microsecond=0))
+
+def utc_to_jd(dt_utc: datetime) -> float:
+    return swe.julday(dt_utc.year, dt_utc.month, dt_utc.day,
+                      dt_utc.hour + dt_utc.minute / 60.0 + dt_utc.second / 3600.0)
+
+def _sun_moon(jd: float, sid_mode: int):
+    sun = calc_sidereal(jd, swe.SUN, sid_mode=sid_mode)[0]
+    moon = calc_sidereal(jd, swe.MOON, sid_mode=sid_mode)[0]
+    return sun[0], sun[3], moon[0], moon[3]
+
+# Каждая функция возвращает (угол элемента, скорость изменения угла в град/сутки)
+def _tithi_state(sun_lon, sun_speed, moon_lon, moon_speed):
+    return tithi_angle(sun_lon, moon_lon), moon_speed - sun_speed
+
+def _yoga_state(sun_lon, sun_speed, moon_lon, moon_speed):
+    return yoga_angle(sun_lon, moon_lon), sun_speed + moon_speed
+
+def _nakshatra_state(sun_lon, sun_speed, moon_lon, moon_speed):
+    return moon_lon % 360, moon_speed
+
+# (ключ как в calc_panchanga, размер элемента в градусах, угол, название по индексу)
+PANCHANGA_ELEMENTS = [
+    ("tithi", TITHI_SPAN, _tithi_state, tithi_name),
+    ("karana", KARANA_SPAN, _tithi_state, lambda i: KARANAS[i]),
+    ("nitya_yoga", YOGA_SPAN, _yoga_state, lambda i: YOGAS[i]),
+    ("nakshatra", NAKSHATRA_SPAN, _nakshatra_state, lambda i: NAKSHATRAS[i][0]),
+]
+MAX_CALENDAR_DAYS = 366
+
+def find_angle_crossing(jd: float, target: float, state, sid_mode: int) -> float:
+    """Момент около jd, когда угол state проходит target (град). Точность ~0.1 с."""
+    for _ in range(20):
+        angle, rate = state(*_sun_moon(jd, sid_mode))
+        step = ((target - angle + 180) % 360 - 180) / rate
+        jd += step
+        if abs(step) < 1e-6:
+            break
+    return jd
+
+def element_intervals(jd_start: float, jd_end: float, span: float, state, sid_mode: int):
+    """Список (индекс, начало, конец) всех элементов, пересекающих [jd_start, jd_end)."""
+    count = round(360 / span)
+    angle, _ = state(*_sun_moon(jd_start, sid_mode))
+    index = int(angle // span) % count
+    begin = find_angle_crossing(jd_start, index * span, state, sid_mode)
+    intervals = []
+    while begin < jd_end:
+        next_index = (index + 1) % count
+        end = find_angle_crossing(begin, next_index * span, state, sid_mode)
+        intervals.append((index, begin, end))
+        index, begin = next_index, end
+    return intervals
+
+def calc_panchanga_calendar(year: int, month: Optional[int], tz_name: str, sid_mode: int = swe.SIDM_LAHIRI):
+    """
+    Все титхи, караны, йоги и накшатры за месяц (или за год, если month не задан)
+    с точным местным временем начала и конца, плюс разбивка по дням.
+    """
+    tz = tz_index.get_timezone(tz_name)
+    first_day = datetime(year, month or 1, 1)
+    if month:
+        last_day = datetime(year + (month == 12), month % 12 + 1, 1)
+    else:
+        last_day = datetime(year + 1, 1, 1)
+    day_bounds = []
+    day = first_day
+    while day <= last_day:
+        day_bounds.append((day, utc_to_jd(localize_time(day, tz).astimezone(pytz.utc))))
+        day += timedelta(days=1)
+    jd_start, jd_end = day_bounds[0][1], day_bounds[-1][1]
+
+    def fmt(jd):
+        return jd_to_utc(jd).astimezone(tz).isoformat()
+
+    result = {"timezone": tz.zone, "start": fmt(jd_start), "end": fmt(jd_end)}
+    element_lists = {}
+    for key, span, state, name in PANCHANGA_ELEMENTS:
+        intervals = element_intervals(jd_start, jd_end, span, state, sid_mode)
+        element_lists[key] = intervals
+        result[key] = [
+            {"index": index, "name": name(index), "start": fmt(begin), "end": fmt(end)}
+            for index, begin, end in intervals
+        ]
+    days = []
+    for (day, day_jd), (_, next_jd) in zip(day_bounds, day_bounds[1:]):
+        entry = {"date": day.strftime("%Y-%m-%d")}
+        for key, _, _, _ in PANCHANGA_ELEMENTS:
+            # Ссылки на элементы result[key], которые идут в этот день
+            entry[key] = [i for i, (_, begin, end) in enumerate(element_lists[key]) if begin < next_jd and end > day_jd]
+        days.append(entry)
+    result["days"] = days
+    return result
+
+def panchanga_calendar_task(year: int, month: Optional[int], tz_name: str, ayanamsa: str = "lahiri"):
+    sid_mode = AYANAMSAS[ayanamsa]
+    swe.set_sid_mode(sid_mode, 0, 0)
+    return calc_panchanga_calendar(year, month, tz_name, sid_mode)
+
+@app.get("/api/panchanga/calendar")
+async def get_panchanga_calendar(
+    year: int = Query(..., ge=MIN_YEAR, le=MAX_YEAR, description=f"Год {MIN_YEAR}–{MAX_YEAR}"),
+    month: Optional[int] = Query(None, ge=1, le=12, description="Месяц 1–12; без него — весь год"),
+    timezone: str = Query("UTC", description="ID временной зоны, например 'Europe/Moscow'"),
+    ayanamsa: str = Query("lahiri", description="Аянамша: " + ", ".join(AYANAMSAS))
+):
+    get_sid_mode(ayanamsa)
+    try:
+        tz = tz_index.get_timezone(timezone)
+    except pytz.UnknownTimeZoneError:
+        raise HTTPException(status_code=422, detail=f"Неизвестная временная зона '{timezone}'")
+    key = f"v{CACHE_VERSION}|calendar|{year}|{month}|{tz.zone}|{ayanamsa}"
+    return await chart_cache.aget_or_compute(
+        key, lambda: submit_calc(panchanga_calendar_task, year, month, tz.zone, ayanamsa))
+
+# --- Восход, заход и кульминация Солнца, восход и заход Луны по месту и дате ---
+# Координаты округляются до RISESET_ROUND знаков (~1 км, разница во времени — секунды),
+# результат по каждому (месту, дате) кэшируется в процессе. Для диапазона дат события
+# ищутся одним проходом от местной полуночи каждого дня.
+RISESET_ROUND = 2
+RISESET_CACHE_SIZE = 100_000
+RISESET_EVENTS = [
+    ("sunrise", swe.SUN, swe.CALC_RISE),
+    ("sunset", swe.SUN, swe.CALC_SET),
+    ("noon", swe.SUN, swe.CALC_MTRANSIT),
+    ("moonrise", swe.MOON, swe.CALC_RISE),
+    ("moonset", swe.MOON, swe.CALC_SET),
+]
+_riseset_cache = OrderedDict()
+_riseset_lock = threading.Lock()
+
+def _next_event(jd: float, body: int, flag: int, geopos, jd_end: float):
+    """JD события в [jd, jd_end) или None (не происходит в этот день или тело незаходящее/невосходящее)."""
+    try:
+        res, tret = swe.rise_trans(jd, body, flag, geopos)
+    except swe.Error:
+        metrics.count("rise_trans_error")
+        return None
+    if res == -2:
+        metrics.count("rise_trans_circumpolar")
+    if res == 0 and tret[0] < jd_end:
+        return tret[0]
+    return None
+
+def _sun_altitude(jd: float, geopos) -> float:
+    xx = swe.calc_ut(jd, swe.SUN)[0]
+    return swe.azalt(jd, swe.ECL2HOR, geopos, 0, 0, xx[:3])[2]
+
+def calc_riseset_range(lat: float, lon: float, tz, start: datetime, days: int):
+    """
+    События для days местных дней начиная со start. sun: normal, polar_day или polar_night —
+    последние два, когда в этот день Солнце не восходит и не заходит.
+    """
+    geopos = (lon, lat, 0.0)
+    day = datetime(start.year, start.month, start.day)
+    jd_day = utc_to_jd(localize_time(day, tz).astimezone(pytz.utc))
+    table = []
+    for _ in range(days):
+        next_day = day + timedelta(days=1)
+        jd_next = utc_to_jd(localize_time(next_day, tz).astimezone(pytz.utc))
+        entry = {"date": day.strftime("%Y-%m-%d")}
+        events = {}
+        for key, body, flag in RISESET_EVENTS:
+            events[key] = _next_event(jd_day, body, flag, geopos, jd_next)
+            entry[key] = jd_to_utc(events[key]).astimezone(tz) if events[key] is not None else None
+        if events["sunrise"] is None and events["sunset"] is None:
+            noon = events["noon"] if events["noon"] is not None else (jd_day + jd_next) / 2
+            entry["sun"] = "polar_day" if _sun_altitude(noon, geopos) > 0 else "polar_night"
+        else:
+            entry["sun"] = "normal"
+        table.append(entry)
+        day, jd_day = next_day, jd_next
+    return table
+
+def get_riseset_range(lat: float, lon: float, tz, start: datetime, days: int):
+    """Таблица за диапазон с кэшем по (округлённое место, дата); недостающие дни считаются одним проходом."""
+    lat, lon = round(lat, RISESET_ROUND), round(lon, RISESET_ROUND)
+    dates = [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days)]
+    keys = [(lat, lon, tz.zone, d) for d in dates]
+    with _riseset_lock:
+        cached = [_riseset_cache.get(k) for k in keys]
+    if all(e is not None for e in cached):
+        return cached
+    first = next(i for i, e in enumerate(cached) if e is None)
+    last = max(i for i, e in enumerate(cached) if e is None)
+    computed = calc_riseset_range(lat, lon, tz, start + timedelta(days=first), last - first + 1)
+    with _riseset_lock:
+        for i, entry in enumerate(computed, start=first):
+            cached[i] = entry
+            _riseset_cache[keys[i]] = entry
+            _riseset_cache.move_to_end(keys[i])
+        while len(_riseset_cache) > RISESET_CACHE_SIZE:
+            _riseset_cache.popitem(last=False)
+    return cached
+
+def get_riseset_day(lat: float, lon: float, tz, date: str):
+    return get_riseset_range(lat, lon, tz, datetime.strptime(date, "%Y-%m-%d"), 1)[0]
+
+def riseset_year_task(lat: float, lon: float, tz_name: str, year: int, month: Optional[int]):
+    tz = tz_index.get_timezone(tz_name)
+    start = datetime(year, month or 1, 1)
+    if month:
+        end = datetime(year + (month == 12), month % 12 + 1, 1)
+    else:
+        end = datetime(year + 1, 1, 1)
+    table = get_riseset_range(lat, lon, tz, start, (end - start).days)
+    return [
+        {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in entry.items()}
+        for entry in table
+    ]
+
+@app.get("/api/riseset")
+async def get_riseset(
+    lat: float = Query(..., ge=-90, le=90, description="Широта"),
+    lon: float = Query(..., ge=-180, le=180, description="Долгота"),
+    timezone: Optional[str] = Query(None, description="ID временной зоны, например 'Europe/Moscow'; без него — по координатам"),
+    year: int = Query(..., ge=MIN_YEAR, le=MAX_YEAR, description=f"Год {MIN_YEAR}–{MAX_YEAR}"),
+    month: Optional[int] = Query(None, ge=1, le=12, description="Месяц 1–12; без него — весь год")
+):
+    tz = tz_index.get_timezone(resolve_timezone(timezone, lat, lon))
+    lat, lon = round(lat, RISESET_ROUND), round(lon, RISESET_ROUND)
+    key = f"v{CACHE_VERSION}|riseset|{lat}|{lon}|{tz.zone}|{year}|{month}"
+    days = await chart_cache.aget_or_compute(
+        key, lambda: submit_calc(riseset_year_task, lat, lon, tz.zone, year, month))
+    return {"lat": lat, "lon": lon, "timezone": tz.zone, "days": days}
+
+# --- Вимшоттари-даша от долготы Луны из карты (см. dasha.py) ---
+# Периоды генерируются лениво: в ответ попадают только те, что пересекают окно [start, end).
+MAX_DASHA_PERIODS = 20000
+
+def parse_local_datetime(value: str, tz) -> datetime:
+    """'YYYY-MM-DD' или 'YYYY-MM-DDTHH:MM' в зоне tz -> aware UTC datetime."""
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"Неверная дата '{value}', нужен формат YYYY-MM-DD или YYYY-MM-DDTHH:MM")
+    if dt.tzinfo is None:
+        dt = localize_time(dt, tz)
+    return dt.astimezone(pytz.utc)
+
+async def get_vimshottari(date: str, time: str, lat: float, lon: float, timezone: Optional[str], ayanamsa: str):
+    get_sid_mode(ayanamsa)
+    try:
+        birth_local = datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M")
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"Неверные дата и время рождения '{date} {time}', нужен формат YYYY-MM-DD и HH:MM")
+    timezone = resolve_timezone(timezone, lat, lon)
+    tz = tz_index.get_timezone(timezone)
+    # Для даш нужна только Луна: дома, D9, панчанга и восход не считаются
+    chart = await get_chart(date, time, lat, lon, timezone, ayanamsa=ayanamsa, fields=("planets",))
+    birth_utc = localize_time(birth_local, tz).astimezone(pytz.utc)
+    return tz, dasha.Vimshottari(chart["moon"]["longitude"], utc_to_jd(birth_utc))
+
+def dasha_summary(vim: dasha.Vimshottari, fmt):
+    return {
+        "moon_nakshatra": NAKSHATRAS[vim.nakshatra][0],
+        "birth_lord": dasha.LORDS[vim.first_lord],
+        "balance_years": vim.balance_years,
+        "cycle_start": fmt(vim.start),
     }
-    # --- Добавляем расчёт дробной карты D9 (Навамша) ---
-    result["d9"] = calc_navamsa(result)
-    # --- Добавляем расчёт Панчанги ---
-    result["panchanga"] = calc_panchanga(jd, sun, moon)
-    
-    # --- Добавляем корректный расчёт вары с учётом восхода солнца ---
-    vara, sunrise_str, sunrise_dt = calc_vara_for_datetime(date, time, lat, lon, timezone)
-    result["panchanga"]["vara"] = vara  # Заменяем вару в panchanga
-    result["sunrise"] = sunrise_str
-    if sunrise_dt:
-        result["sunrise_dt"] = sunrise_dt.isoformat()
-    
-    return result
\ No newline at end of file
+
+@app.get("/api/dasha")
+async def get_dasha(
+    date: str = Query(..., description="Дата рождения в формате YYYY-MM-DD"),
+    time: str = Query(..., description="Время рождения в формате HH:MM"),
+    lat: float = Query(..., description="Широта"),
+    lon: float = Query(..., description="Долгота"),
+    timezone: Optional[str] = Query(None, description="ID временной зоны, например 'Europe/Moscow'; без него — по координатам"),
+    ayanamsa: str = Query("lahiri", description="Аянамша: " + ", ".join(AYANAMSAS)),
+    depth: int = Query(2, ge=1, le=dasha.MAX_LEVEL, description="Глубина: 1 — маха, 2 — антар, ... 5 — прана"),
+    start: Optional[str] = Query(None, description="Начало окна (YYYY-MM-DD[THH:MM], местное время); по умолчанию — рождение"),
+    end: Optional[str] = Query(None, description="Конец окна; по умолчанию — 120 лет от рождения")
+):
+    tz, vim = await get_vimshottari(date, time, lat, lon, timezone, ayanamsa)
+    jd_start = utc_to_jd(parse_local_datetime(start, tz)) if start else vim.birth_jd
+    jd_end = utc_to_jd(parse_local_datetime(end, tz)) if end else vim.birth_jd + vim.cycle_days
+    if jd_end <= jd_start:
+        raise HTTPException(status_code=422, detail="Конец окна должен быть позже начала")
+
+    def fmt(jd):
+        return jd_to_utc(jd).astimezone(tz).isoformat()
+
+    periods = []
+    for level, path, begin, finish in vim.periods(jd_start, jd_end, depth):
+        if len(periods) == MAX_DASHA_PERIODS:
+            raise HTTPException(status_code=422, detail=f"Больше {MAX_DASHA_PERIODS} периодов: сузьте окно или уменьшите depth")
+        periods.append({"level": level, "lords": [dasha.LORDS[i] for i in path], "start": fmt(begin), "end": fmt(finish)})
+    return {**dasha_summary(vim, fmt), "depth": depth, "periods": periods}
+
+@app.get("/api/dasha/current")
+async def get_dasha_current(
+    date: str = Query(..., description="Дата рождения в формате YYYY-MM-DD"),
+    time: str = Query(..., description="Время рождения в формате HH:MM"),
+    lat: float = Query(..., description="Широта"),
+    lon: float = Query(..., description="Долгота"),
+    timezone: Optional[str] = Query(None, description="ID временной зоны, например 'Europe/Moscow'; без него — по координатам"),
+    ayanamsa: str = Query("lahiri", description="Аянамша: " + ", ".join(AYANAMSAS)),
+    at: Optional[str] = Query(None, description="Момент (YYYY-MM-DD[THH:MM], местное время); по умолчанию — сейчас"),
+    depth: int = Query(dasha.MAX_LEVEL, ge=1, le=dasha.MAX_LEVEL, description="Глубина: 1 — маха, ... 5 — прана")
+):
+    """Компактный ответ: только текущие периоды по уровням."""
+    tz, vim = await get_vimshottari(date, time, lat, lon, timezone, ayanamsa)
+    at_utc = parse_local_datetime(at, tz) if at else datetime.now(pytz.utc)
+    jd = max(utc_to_jd(at_utc), vim.birth_jd)
+
+    def fmt(jd):
+        return jd_to_utc(jd).astimezone(tz).isoformat()
+
+    current = {
+        dasha.LEVELS[level]: {"lord": dasha.LORDS[lord], "start": fmt(begin), "end": fmt(finish)}
+        for level, (lord, begin, finish) in enumerate(vim.current(jd, depth))
+    }
+    return {"at": fmt(jd), "lords": "/".join(p["lord"] for p in current.values()), **current}
+
+# --- Поиск событий: вход в знак, смена накшатры, станции (см. events.py) ---
+# EVENT_INDEX_DB — SQLite с уже найденными событиями (на томе Fly переживает рестарты);
+# пусто — индекс только в памяти процесса. Недостающие годы считаются в воркерах, по задаче на тело.
+MAX_EVENT_YEARS = 200
+STATION_NAMES = {events.DIRECT: "direct", events.RETROGRADE: "retrograde"}
+event_index = events.EventIndex(os.environ.get("EVENT_INDEX_DB") or None)
+
+def events_task(body: str, years: List[int], ayanamsa: str = "lahiri"):
+    sid_mode = AYANAMSAS[ayanamsa]
+    swe.set_sid_mode(sid_mode, 0, 0)
+    return {year: events.year_events(body, year, sid_mode, ephemeris_table) for year in years}
+
+def parse_choice_list(spec: str, allowed, what: str):
+    """'all' или список через запятую -> список значений из allowed; иначе 422."""
+    if spec.strip().lower() == "all":
+        return list(allowed)
+    items = [item.strip().lower() for item in spec.split(",") if item.strip()]
+    unknown = [item for item in items if item not in allowed]
+    if unknown or not items:
+        bad = ", ".join(unknown) or repr(spec)
+        raise HTTPException(status_code=422, detail=f"Неизвестные {what}: {bad}, доступны: {', '.join(allowed)}")
+    return list(dict.fromkeys(items))
+
+def event_names(kind: str, from_idx: int, to_idx: int):
+    if kind == "station":
+        return STATION_NAMES[from_idx], STATION_NAMES[to_idx]
+    if kind == "sign":
+        return SIGNS[from_idx], SIGNS[to_idx]
+    return NAKSHATRAS[from_idx][0], NAKSHATRAS[to_idx][0]
+
+@app.get("/api/events")
+async def get_events(
+    start: str = Query(..., description="Начало диапазона (YYYY-MM-DD[THH:MM], местное время)"),
+    end: str = Query(..., description="Конец диапазона (не включая)"),
+    bodies: str = Query("all", description="Тела через запятую: " + ", ".join(events.BODIES)),
+    types: str = Query("all", description="Типы событий через запятую: " + ", ".join(events.EVENT_TYPES)),
+    timezone: str = Query("UTC", description="ID временной зоны, например 'Europe/Moscow'"),
+    ayanamsa: str = Query("lahiri", description="Аянамша: " + ", ".join(AYANAMSAS))
+):
+    get_sid_mode(ayanamsa)
+    try:
+        tz = tz_index.get_timezone(timezone)
+    except pytz.UnknownTimeZoneError:
+        raise HTTPException(status_code=422, detail=f"Неизвестная временная зона '{timezone}'")
+    body_list = parse_choice_list(bodies, tuple(events.BODIES), "тела")
+    type_list = parse_choice_list(types, events.EVENT_TYPES, "типы событий")
+    start_utc, end_utc = parse_local_datetime(start, tz), parse_local_datetime(end, tz)
+    if end_utc <= start_utc:
+        raise HTTPException(status_code=422, detail="Конец диапазона должен быть позже начала")
+    check_year_range(start_utc.year, end_utc.year)
+    years = list(range(start_utc.year, end_utc.year + 1))
+    if len(years) > MAX_EVENT_YEARS:
+        raise HTTPException(status_code=422, detail=f"Слишком большой диапазон: максимум {MAX_EVENT_YEARS} лет")
+
+    # Недостающие в индексе годы досчитываем — по одной задаче на тело, параллельно
+    missing = {body: event_index.missing_years(ayanamsa, body, years) for body in body_list}
+    missing = {body: body_years for body, body_years in missing.items() if body_years}
+    if missing:
+        computed = await asyncio.gather(*(submit_calc(events_task, body, body_years, ayanamsa)
+                                          for body, body_years in missing.items()))
+        for body, by_year in zip(missing, computed):
+            for year, found in by_year.items():
+                event_index.add_year(ayanamsa, body, year, found)
+
+    rows = event_index.query(ayanamsa, body_list, utc_to_jd(start_utc), utc_to_jd(end_utc), type_list)
+    result = []
+    for jd, body, kind, from_idx, to_idx in rows:
+        from_name, to_name = event_names(kind, from_idx, to_idx)
+        result.append({"time": jd_to_utc(jd).astimezone(tz).isoformat(), "body": body, "type": kind,
+                       "from": from_name, "to": to_name})
+    return {"timezone": tz.zone, "computed_years": sum(map(len, missing.values())), "events": result}
+
+# --- Совместимость Ашта-кута (Гуна Милан) для наборов невест и женихов (см. kuta.py) ---
+# Луна каждого — из переданной долготы или из данных рождения. Полная матрица N × M не строится:
+# group=pairs — K лучших пар всего, bride/groom — K лучших для каждой невесты/жениха.
+MAX_KUTA_PEOPLE = 100_000
+MAX_KUTA_RESULTS = 100_000
+KUTA_GROUPS = ("pairs", "bride", "groom")
+
+class KutaPerson(BaseModel):
+    moon: Optional[float] = None  # сидерическая долгота Луны в выбранной аянамше
+    date: Optional[str] = None
+    time: Optional[str] = None
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+    timezone: Optional[str] = None  # без него — по координатам
+
+class KutaRequest(BaseModel):
+    # Число — сразу долгота Луны, объект — долгота или данные рождения
+    brides: List[Union[float, KutaPerson]]
+    grooms: List[Union[float, KutaPerson]]
+
+def prepare_kuta_people(people, role: str):
+    """Долгота Луны или (дата, время, зона) для расчёта в воркере; 422 с номером человека, если данных не хватает."""
+    prepared = []
+    for i, person in enumerate(people):
+        if isinstance(person, float):
+            prepared.append(person)
+        elif person.moon is not None:
+            prepared.append(person.moon)
+        elif person.date and person.time and (person.timezone or (person.lat is not None and person.lon is not None)):
+            try:
+                zone = resolve_timezone(person.timezone, person.lat, person.lon)
+            except HTTPException as e:
+                raise HTTPException(status_code=422, detail=f"{role}[{i}]: {e.detail}")
+            prepared.append((person.date, person.time, zone))
+        else:
+            raise HTTPException(status_code=422, detail=f"{role}[{i}]: нужна moon или date, time и timezone либо lat, lon")
+    return prepared
+
+def kuta_moons(people, sid_mode: int, role: str):
+    """Сидерические долготы Луны; данные рождения пересчитываются через таблицу эфемерид или swisseph."""
+    moons = []
+    zones = {}
+    for i, person in enumerate(people):
+        if not isinstance(person, tuple):
+            moons.append(person)
+            continue
+        date, time, zone = person
+        try:
+            tz = zones.get(zone)
+            if tz is None:
+                tz = zones[zone] = tz_index.get_timezone(zone)
+            dt_utc = localize_time(datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M"), tz).astimezone(pytz.utc)
+        except ValueError as e:
+            raise ValueError(f"{role}[{i}]: {e}")
+        moons.append(calc_sidereal(utc_to_jd(dt_utc), swe.MOON, None, sid_mode)[0][0])
+    return moons
+
+def kuta_matches(brides, grooms, bride_idx, groom_idx, scores):
+    """Список {bride, groom, score, kootas} для найденных пар."""
+    kootas = kuta.breakdown(brides[bride_idx], grooms[groom_idx]).tolist()
+    return [
+        {"bride": i, "groom": j, "score": score, "kootas": dict(zip(kuta.KOOTAS, points))}
+        for i, j, score, points in zip(bride_idx.tolist(), groom_idx.tolist(), scores.tolist(), kootas)
+    ]
+
+def kuta_task(brides, grooms, top: int, group: str, ayanamsa: str = "lahiri"):
+    sid_mode = AYANAMSAS[ayanamsa]
+    swe.set_sid_mode(sid_mode, 0, 0)
+    b = kuta.units(kuta_moons(brides, sid_mode, "brides"))
+    g = kuta.units(kuta_moons(grooms, sid_mode, "grooms"))
+    if group == "pairs":
+        return {"pairs": kuta_matches(b, g, *kuta.top_pairs(b, g, top))}
+    # Для каждой невесты (жениха) — top лучших с другой стороны, матрица (строки, top)
+    if group == "bride":
+        found, scores = kuta.top_per_bride(b, g, top)
+        owners = np.repeat(np.arange(len(b)), found.shape[1])
+        matches = kuta_matches(b, g, owners, found.ravel(), scores.ravel())
+    else:
+        found, scores = kuta.top_per_groom(b, g, top)
+        owners = np.repeat(np.arange(len(g)), found.shape[1])
+        matches = kuta_matches(b, g, found.ravel(), owners, scores.ravel())
+    width = found.shape[1]
+    results = []
+    for n in range(found.shape[0]):
+        chunk = matches[n * width:(n + 1) * width]
+        for match in chunk:
+            del match[group]
+        results.append({group: n, "matches": chunk})
+    return {"results": results}
+
+@app.post("/api/kuta")
+async def get_kuta(
+    request: KutaRequest,
+    top: int = Query(10, ge=1, le=1000, description="Сколько лучших пар (или лучших на человека) вернуть"),
+    group: str = Query("pairs", description="pairs — лучшие пары всего; bride / groom — лучшие для каждой невесты / жениха"),
+    ayanamsa: str = Query("lahiri", description="Аянамша: " + ", ".join(AYANAMSAS))
+):
+    get_sid_mode(ayanamsa)
+    if group not in KUTA_GROUPS:
+        raise HTTPException(status_code=422, detail=f"Неизвестная группировка '{group}', доступны: {', '.join(KUTA_GROUPS)}")
+    n, m = len(request.brides), len(request.grooms)
+    if not n or not m:
+        raise HTTPException(status_code=422, detail="Нужны хотя бы одна невеста и один жених")
+    if max(n, m) > MAX_KUTA_PEOPLE:
+        raise HTTPException(status_code=413, detail=f"Слишком много людей: максимум {MAX_KUTA_PEOPLE} с каждой стороны")
+    rows = {"pairs": 1, "bride": n, "groom": m}[group]
+    if rows * top > MAX_KUTA_RESULTS:
+        raise HTTPException(status_code=422, detail=f"Слишком большой ответ: {rows} × top={top} > {MAX_KUTA_RESULTS}")
+    brides = prepare_kuta_people(request.brides, "brides")
+    grooms = prepare_kuta_people(request.grooms, "grooms")
+    try:
+        result = await submit_calc(kuta_task, brides, grooms, top, group, ayanamsa)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"max_score": kuta.MAX_SCORE, "brides": n, "grooms": m, **result}
+
+# --- Сила планет: Аштакаварга и Шадбала (см. strength.py) ---
+# Та же карта и тот же кэш, что у /api/planets?fields=strength; пакетом — /api/planets/batch?fields=strength.
+@app.get("/api/strength")
+async def get_strength(
+    date: str = Query(..., description="Дата рождения в формате YYYY-MM-DD"),
+    time: str = Query(..., description="Время рождения в формате HH:MM"),
+    lat: float = Query(..., description="Широта"),
+    lon: float = Query(..., description="Долгота"),
+    timezone: Optional[str] = Query(None, description="ID временной зоны, например 'Europe/Moscow'; без него — по координатам"),
+    ayanamsa: str = Query("lahiri", description="Аянамша: " + ", ".join(AYANAMSAS))
+):
+    get_sid_mode(ayanamsa)
+    timezone = resolve_timezone(timezone, lat, lon)
+    chart = await get_chart(date, time, lat, lon, timezone, ayanamsa=ayanamsa, fields=("strength",))
+    return {"timezone": chart["timezone"], **chart["strength"]}
+
+# --- Живое небо: поток Server-Sent Events (см. live.py) ---
+# Вместо опроса /api/planets из каждой вкладки: положения, титхи и накшатра считаются
+# раз в LIVE_INTERVAL секунд в движке и раздаются всем подписчикам готовыми байтами.
+# С lat и lon — ещё и асцендент места; место округляется до LIVE_ROUND знаков (~1 км),
+# асцендент считается один раз на место за тик, а не на подписчика.
+LIVE_INTERVAL = float(os.environ.get("LIVE_INTERVAL", "5"))
+LIVE_QUEUE_SIZE = int(os.environ.get("LIVE_QUEUE_SIZE", "2"))
+LIVE_MAX_SUBSCRIBERS = int(os.environ.get("LIVE_MAX_SUBSCRIBERS", "12000"))
+LIVE_ROUND = 2
+
+def live_task(jd: float, places):
+    """Кадры SSE на момент jd: небо и панчанга — один раз, асцендент — на каждое место."""
+    swe.set_sid_mode(swe.SIDM_LAHIRI, 0, 0)
+    planets = ChartSections(jd=jd).planets
+    with metrics.stage("panchanga"):
+        panchanga = calc_panchanga(jd, planets["sun"]["longitude"], planets["moon"]["longitude"])
+    # Вара зависит от местного восхода, а кадр без места общий для всех — её не отдаём
+    del panchanga["vara"]
+    sky = {"utc": jd_to_utc(jd).isoformat(), "jd": jd, "planets": planets, "panchanga": panchanga}
+    frames = {}
+    for place in places:
+        data = sky if place is None else {**sky, "lat": place[0], "lon": place[1], "ascendant": ChartSections(lat=place[0], lon=place[1], jd=jd).ascendant}
+        frames[place] = b"event: sky\ndata: " + response_format.encode(data, "json") + b"\n\n"
+    return frames
+
+async def live_frames(places):
+    return await calc_engine.submit(live_task, utc_to_jd(datetime.now(pytz.utc)), places)
+
+live_sky = live.LiveBroadcaster(live_frames, LIVE_INTERVAL, LIVE_QUEUE_SIZE, LIVE_MAX_SUBSCRIBERS)
+
+@app.get("/api/live")
+async def get_live(
+    lat: Optional[float] = Query(None, ge=-90, le=90, description="Широта — для асцендента места"),
+    lon: Optional[float] = Query(None, ge=-180, le=180, description="Долгота — для асцендента места")
+):
+    """Поток text/event-stream: событие sky каждые LIVE_INTERVAL секунд, первое — сразу."""
+    if (lat is None) != (lon is None):
+        raise HTTPException(status_code=422, detail="lat и lon задаются вместе")
+    place = None if lat is None else (round(lat, LIVE_ROUND), round(lon, LIVE_ROUND))
+    try:
+        sub = live_sky.subscribe(place)
+    except live.LiveFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+
+    async def stream():
+        try:
+            # При обрыве браузер переподключится сам через retry мс
+            yield f"retry: {int(LIVE_INTERVAL * 1000)}\n\n".encode()
+            while True:
+                yield await sub.queue.get()
+        finally:
+            live_sky.unsubscribe(sub)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
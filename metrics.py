@@ -0,0 +1,221 @@
+"""
+Метрики расчётов: гистограммы времени по этапам и счётчики обходных путей, вывод в формате Prometheus.
+
+Этапы размечаются в коде через `with metrics.stage("houses"):`, обходные пути — metrics.count("...").
+Запись идёт в текущий сборщик (contextvar): в воркере это сборщик задачи из collect(),
+его снимок возвращается в основной процесс вместе с результатом и там сливается
+в REGISTRY и в тайминги текущего запроса (заголовок Server-Timing).
+Вне collect() — сразу в REGISTRY.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Границы корзин гистограммы, секунды
+BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class Metrics:
+    """Гистограммы {имя: {метка: [корзины..., +Inf, сумма]}} и счётчики {имя: {метка: n}}."""
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, label: str, seconds: float):
+        with self._lock:
+            series = self.histograms.setdefault(name, {}).get(label)
+            if series is None:
+                series = self.histograms[name][label] = [0] * (len(BUCKETS) + 1) + [0.0]
+            series[bisect.bisect_left(BUCKETS, seconds)] += 1
+            series[-1] += seconds
+
+    def inc(self, name: str, label: str, n: int = 1):
+        with self._lock:
+            counter = self.counters.setdefault(name, {})
+            counter[label] = counter.get(label, 0) + n
+
+    def snapshot(self):
+        """Копия данных в виде простых dict/list (передаётся из воркера через pickle)."""
+        with self._lock:
+            return {
+                "histograms": {name: {label: list(s) for label, s in series.items()} for name, series in self.histograms.items()},
+                "counters": {name: dict(counter) for name, counter in self.counters.items()},
+            }
+
+    def merge(self, snapshot):
+        with self._lock:
+            for name, series in snapshot["histograms"].items():
+                mine = self.histograms.setdefault(name, {})
+                for label, values in series.items():
+                    target = mine.get(label)
+                    if target is None:
+                        mine[label] = list(values)
+                    else:
+                        for i, v in enumerate(values):
+                            target[i] += v
+            for name, counter in snapshot["counters"].items():
+                mine = self.counters.setdefault(name, {})
+                for label, n in counter.items():
+                    mine[label] = mine.get(label, 0) + n
+
+
+REGISTRY = Metrics()
+_collector = ContextVar("metrics_collector", default=None)
+_request_timing = ContextVar("request_timing", default=None)
+
+STAGE_METRIC = "dhama_stage_seconds"
+FALLBACK_METRIC = "dhama_fallback_total"
+
+
+def _targets():
+    collector = _collector.get()
+    if collector is not None:
+        return (collector,)
+    timing = _request_timing.get()
+    return (REGISTRY,) if timing is None else (REGISTRY, timing)
+
+
+@contextmanager
+def stage(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        for target in _targets():
+            target.observe(STAGE_METRIC, name, elapsed)
+
+
+def observe(name: str, seconds: float):
+    """То же, что stage(), для уже измеренного времени (в горячих функциях без contextmanager)."""
+    for target in _targets():
+        target.observe(STAGE_METRIC, name, seconds)
+
+
+def count(kind: str, n: int = 1):
+    for target in _targets():
+        target.inc(FALLBACK_METRIC, kind, n)
+
+
+@contextmanager
+def collect():
+    """Собирает метрики блока в отдельный Metrics (для воркера); на выходе — в .snapshot()."""
+    metrics = Metrics()
+    token = _collector.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _collector.reset(token)
+
+
+def measured(fn, *args):
+    """Выполняет fn(*args) со сборщиком; возвращает (результат, снимок метрик). Для отправки в воркер."""
+    with collect() as metrics:
+        result = fn(*args)
+    return result, metrics.snapshot()
+
+
+# --- Тайминги текущего запроса для Server-Timing ---
+def start_request_timing():
+    """Включает сбор таймингов для текущего запроса; возвращает (Metrics, токен для reset)."""
+    metrics = Metrics()
+    return metrics, _request_timing.set(metrics)
+
+
+def stop_request_timing(token):
+    _request_timing.reset(token)
+
+
+def record(snapshot):
+    """Снимок из воркера: в общий реестр и, если включено, в тайминги текущего запроса."""
+    REGISTRY.merge(snapshot)
+    timing = _request_timing.get()
+    if timing is not None:
+        timing.merge(snapshot)
+
+
+def server_timing_header(timing: Metrics, total: float) -> str:
+    """Значение заголовка Server-Timing: суммарное время каждого этапа (мс) и число вызовов."""
+    parts = []
+    for label, series in sorted(timing.histograms.get(STAGE_METRIC, {}).items()):
+        calls = sum(series[:-1])
+        parts.append(f'{label};dur={series[-1] * 1000:.3f};desc="x{calls}"')
+    for label, n in sorted(timing.counters.get(FALLBACK_METRIC, {}).items()):
+        parts.append(f'fallback_{label};desc="x{n}"')
+    parts.append(f"total;dur={total * 1000:.3f}")
+    return ", ".join(parts)
+
+
+class TimingMiddleware:
+    """
+    ASGI-middleware: время каждого запроса в гистограмму dhama_request_seconds
+    и, если клиент прислал X-Server-Timing: 1, заголовок Server-Timing с этапами этого запроса.
+    """
+
+    def __init__(self, app, header: bytes = b"x-server-timing"):
+        self.app = app
+        self.header = header
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+        timing = token = None
+        if any(name == self.header and value == b"1" for name, value in scope["headers"]):
+            timing, token = start_request_timing()
+
+        async def send_with_timing(message):
+            if timing is not None and message["type"] == "http.response.start":
+                value = server_timing_header(timing, time.perf_counter() - t0)
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", value.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            if token is not None:
+                stop_request_timing(token)
+            # Метка — путь маршрута; несовпавшие пути не плодят серии
+            path = scope["path"] if "endpoint" in scope else "unmatched"
+            REGISTRY.observe("dhama_request_seconds", path, time.perf_counter() - t0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Имя метрики -> (имя метки, описание)
+HELP = {
+    STAGE_METRIC: ("stage", "Время этапов расчёта, секунды"),
+    "dhama_request_seconds": ("path", "Время обработки запроса, секунды"),
+    FALLBACK_METRIC: ("kind", "Срабатывания обходных путей"),
+}
+
+
+def render(metrics: Metrics = None, gauges=None) -> str:
+    """Текстовый формат Prometheus 0.0.4. gauges — {имя: значение} для текущих состояний."""
+    data = (metrics or REGISTRY).snapshot()
+    lines = []
+    for name, series in sorted(data["histograms"].items()):
+        label_name, text = HELP.get(name, ("label", name))
+        lines += [f"# HELP {name} {text}", f"# TYPE {name} histogram"]
+        for label, values in sorted(series.items()):
+            label_str = f'{label_name}="{_escape(label)}"'
+            cumulative = 0
+            for le, n in zip(BUCKETS + ("+Inf",), values[:-1]):
+                cumulative += n
+                lines.append(f'{name}_bucket{{{label_str},le="{le}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{label_str}}} {values[-1]:.9f}")
+            lines.append(f"{name}_count{{{label_str}}} {cumulative}")
+    for name, counter in sorted(data["counters"].items()):
+        label_name, text = HELP.get(name, ("label", name))
+        lines += [f"# HELP {name} {text}", f"# TYPE {name} counter"]
+        for label, n in sorted(counter.items()):
+            lines.append(f'{name}{{{label_name}="{_escape(label)}"}} {n}')
+    for name, value in sorted((gauges or {}).items()):
+        lines += [f"# TYPE {name} gauge", f"{name} {float(value)}"]
+    return "\n".join(lines) + "\n"
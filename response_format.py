@@ -0,0 +1,139 @@
+"""
+Форматы ответа карты и HTTP-кэширование.
+
+Формат выбирается параметром format= или, если его нет, заголовком Accept:
+    json              application/json                        — вложенный JSON, как раньше (orjson)
+    msgpack           application/msgpack                     — то же в MessagePack
+    columnar          application/vnd.dhama.columnar+json     — колоночный вид
+    columnar-msgpack  application/vnd.dhama.columnar+msgpack  — колоночный вид в MessagePack
+
+Колоночный вид: параллельные массивы долгот, скоростей, индексов знаков и ретроградности
+в порядке "bodies", таблицы имён ("bodies", "varga_bodies", "signs") — один раз на ответ.
+Подписи вроде "Телец" и "12°33'" клиент собирает сам из индексов и долгот.
+
+Ответ детерминирован входными параметрами, поэтому ETag считается из ключа кэша карты
+и формата ещё до расчёта: запрос с If-None-Match получает 304 без обращения к движку.
+"""
+import hashlib
+from typing import Optional
+
+import msgpack
+import orjson
+
+# Имя формата -> (media type, раскладка, кодирование)
+FORMATS = {
+    "json": ("application/json", "nested", "json"),
+    "msgpack": ("application/msgpack", "nested", "msgpack"),
+    "columnar": ("application/vnd.dhama.columnar+json", "columnar", "json"),
+    "columnar-msgpack": ("application/vnd.dhama.columnar+msgpack", "columnar", "msgpack"),
+}
+MEDIA_TYPES = {media: name for name, (media, _, _) in FORMATS.items()}
+MEDIA_TYPES.update({"application/x-msgpack": "msgpack", "application/*": "json", "*/*": "json"})
+
+# Порядок тел в колонках; в varga_bodies первой идёт лагна (как в calc_vargas)
+BODIES = ("sun", "moon", "mars", "mercury", "jupiter", "venus", "saturn", "rahu", "ketu")
+VARGA_BODIES = ("ascendant",) + BODIES
+
+
+def choose_format(accept: Optional[str], override: Optional[str] = None) -> Optional[str]:
+    """
+    Имя формата по параметру format= (ValueError, если он неизвестен) или по Accept
+    с учётом q; None — ни один из предложенных клиентом типов не поддерживается (406).
+    """
+    if override:
+        if override not in FORMATS:
+            raise ValueError(f"Неизвестный формат '{override}': допустимы {', '.join(FORMATS)}")
+        return override
+    if not accept:
+        return "json"
+    offers = []
+    for position, part in enumerate(accept.split(",")):
+        media, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if q > 0 and media.lower() in MEDIA_TYPES:
+            offers.append((-q, position, MEDIA_TYPES[media.lower()]))
+    return min(offers)[2] if offers else None
+
+
+def etag(key: str, fmt: str) -> str:
+    """Сильный ETag представления: ключ кэша карты (в нём уже CACHE_VERSION) плюс формат."""
+    return '"' + hashlib.blake2b(f"{key}|{fmt}".encode(), digest_size=12).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], tag: str) -> bool:
+    """If-None-Match: список тегов или "*"; сравнение слабое (W/ игнорируется), как требует RFC 9110."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == tag:
+            return True
+    return False
+
+
+# --- Колоночный вид ---
+def tables(signs):
+    return {"bodies": list(BODIES), "varga_bodies": list(VARGA_BODIES), "signs": list(signs)}
+
+
+def _chart_columns(chart):
+    """
+    Колонки одной карты без таблиц имён; остальные поля карты переносятся как есть.
+    Секций, не запрошенных через fields=, нет и в колонках.
+    """
+    columns = {}
+    if "sun" in chart:
+        lons = [chart[b]["longitude"] for b in BODIES]
+        columns["longitude"] = lons
+        columns["speed"] = [chart[b].get("speed") for b in BODIES]
+        columns["sign_idx"] = [int(lon // 30) % 12 for lon in lons]
+        columns["retrograde"] = [chart[b]["retrograde"] for b in BODIES]
+    if "ascendant" in chart:
+        columns["ascendant"] = chart["ascendant"]
+        columns["ascendant_sign_idx"] = int(chart["ascendant"] // 30) % 12
+    for key, value in chart.items():
+        if key in columns or key in BODIES:
+            continue
+        if key == "d9":
+            columns["d9"] = {
+                "sign_idx": [value[b]["navamsa_sign_idx"] for b in VARGA_BODIES],
+                "navamsa_num": [value[b]["navamsa_num"] for b in VARGA_BODIES],
+            }
+        elif key == "vargas":
+            columns["vargas"] = {name: [varga[b]["sign_idx"] for b in VARGA_BODIES] for name, varga in value.items()}
+        else:
+            columns[key] = value
+    return columns
+
+
+def columnar_chart(chart, signs):
+    return {**tables(signs), **_chart_columns(chart)}
+
+
+def columnar_batch(results, signs):
+    """Пакет: каждое поле — массив по картам (None на месте ошибки), ошибки — в "error" и "status"."""
+    rows = [None if "error" in r else _chart_columns(r) for r in results]
+    keys = []
+    for row in rows:
+        for key in row or ():
+            if key not in keys:
+                keys.append(key)
+    out = tables(signs)
+    out["count"] = len(results)
+    for key in keys:
+        out[key] = [row.get(key) if row else None for row in rows]
+    out["error"] = [r.get("error") for r in results]
+    out["status"] = [r.get("status") for r in results]
+    return out
+
+
+def encode(data, fmt: str) -> bytes:
+    if FORMATS[fmt][2] == "msgpack":
+        return msgpack.packb(data, use_bin_type=True)
+    return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
@@ -0,0 +1,256 @@
+"""
+Сила планет: Аштакаварга (бхинна и сарва) и Шадбала.
+
+Всё считается сразу для N карт массивами (N, 7), без циклов по картам и планетам:
+Аштакаварга — индексация заранее построенной таблицы биндов BINDUS[планета, опора, дом от опоры],
+Шадбала — арифметика NumPy над долготами, скоростями, асцендентом и временем.
+
+Планеты — семь грах от Солнца до Сатурна (узлы не участвуют), опоры Аштакаварги — они же
+и лагна. Знаки — индексы 0 (Овен) .. 11 (Рыбы). Шадбала — в вирупах (60 вирупа = 1 рупа).
+
+Упрощения относительно полного расчёта по BPHS:
+  - дома для Дигбалы и Кендрадибалы — от асцендента (равные дома / целые знаки), без куспидов;
+  - восход, заход и полдень для Кала-балы — из часового угла и склонения Солнца
+    (точность — минуты), а не из swe.rise_trans;
+  - Чешта-бала Марса–Сатурна — линейно по суточной скорости: 0 при наибольшей прямой,
+    60 при наибольшей попятной (вместо чешта-кендры по средним долготам);
+  - Юддха-бала (планетная война) не считается.
+"""
+import numpy as np
+
+import vargas
+from kuta import FRIENDSHIP, SIGN_LORD
+
+PLANETS = ("sun", "moon", "mars", "mercury", "jupiter", "venus", "saturn")
+SUN, MOON, MARS, MERCURY, JUPITER, VENUS, SATURN = range(7)
+SHADBALA = ("sthana", "dig", "kala", "cheshta", "naisargika", "drik")
+
+# --- Аштакаварга ---
+# Для каждой планеты: дома 1..12 от каждой опоры (Солнце, Луна, Марс, Меркурий, Юпитер, Венера, Сатурн, лагна),
+# в которые планета даёт бинду. Суммы: 48, 49, 39, 54, 56, 52, 39 — всего 337.
+_BINDU_HOUSES = (
+    ((1, 2, 4, 7, 8, 9, 10, 11), (3, 6, 10, 11), (1, 2, 4, 7, 8, 9, 10, 11), (3, 5, 6, 9, 10, 11, 12),
+     (5, 6, 9, 11), (6, 7, 12), (1, 2, 4, 7, 8, 9, 10, 11), (3, 4, 6, 10, 11, 12)),
+    ((3, 6, 7, 8, 10, 11), (1, 3, 6, 7, 10, 11), (2, 3, 5, 6, 9, 10, 11), (1, 3, 4, 5, 7, 8, 10, 11),
+     (1, 4, 7, 8, 10, 11, 12), (3, 4, 5, 7, 9, 10, 11), (3, 5, 6, 11), (3, 6, 10, 11)),
+    ((3, 5, 6, 10, 11), (3, 6, 11), (1, 2, 4, 7, 8, 10, 11), (3, 5, 6, 11),
+     (6, 10, 11, 12), (6, 8, 11, 12), (1, 4, 7, 8, 9, 10, 11), (1, 3, 6, 10, 11)),
+    ((5, 6, 9, 11, 12), (2, 4, 6, 8, 10, 11), (1, 2, 4, 7, 8, 9, 10, 11), (1, 3, 5, 6, 9, 10, 11, 12),
+     (6, 8, 11, 12), (1, 2, 3, 4, 5, 8, 9, 11), (1, 2, 4, 7, 8, 9, 10, 11), (1, 2, 4, 6, 8, 10, 11)),
+    ((1, 2, 3, 4, 7, 8, 9, 10, 11), (2, 5, 7, 9, 11), (1, 2, 4, 7, 8, 10, 11), (1, 2, 4, 5, 6, 9, 10, 11),
+     (1, 2, 3, 4, 7, 8, 10, 11), (2, 5, 6, 9, 10, 11), (3, 5, 6, 12), (1, 2, 4, 5, 6, 7, 9, 10, 11)),
+    ((8, 11, 12), (1, 2, 3, 4, 5, 8, 9, 11, 12), (3, 5, 6, 9, 11, 12), (3, 5, 6, 9, 11),
+     (5, 8, 9, 10, 11), (1, 2, 3, 4, 5, 8, 9, 10, 11), (3, 4, 5, 8, 9, 10, 11), (1, 2, 3, 4, 5, 8, 9, 11)),
+    ((1, 2, 4, 7, 8, 10, 11), (3, 6, 11), (3, 5, 6, 10, 11, 12), (6, 8, 9, 10, 11, 12),
+     (5, 6, 11, 12), (6, 11, 12), (3, 5, 6, 11), (1, 3, 4, 6, 10, 11)),
+)
+
+
+def _build_bindus():
+    """(7, 8, 12) uint8: [планета, опора, дом от опоры 0..11] -> 1, если бинду есть."""
+    table = np.zeros((7, 8, 12), dtype=np.uint8)
+    for planet, refs in enumerate(_BINDU_HOUSES):
+        for ref, houses in enumerate(refs):
+            table[planet, ref, np.array(houses) - 1] = 1
+    return table
+
+
+BINDUS = _build_bindus()
+
+
+def ashtakavarga(signs):
+    """signs — знаки (N, 8): семь планет и лагна. -> (бхинна (N, 7, 12), сарва (N, 12))."""
+    signs = np.asarray(signs, dtype=np.intp)
+    # Дом знака s от каждой опоры: (s - знак опоры) mod 12
+    houses = (np.arange(12)[None, None, :] - signs[:, :, None]) % 12
+    bhinna = BINDUS[np.arange(7)[None, :, None, None], np.arange(8)[None, None, :, None], houses[:, None]].sum(axis=2, dtype=np.uint8)
+    return bhinna, bhinna.sum(axis=1, dtype=np.uint16)
+
+
+# --- Шадбала: постоянные ---
+EXALTATION = np.array((10, 33, 298, 165, 95, 357, 200), dtype=np.float64)  # глубокая экзальтация, градусы
+# Мулатрикона в раши: знак и градусы [от, до)
+_MT_SIGN = np.array((4, 1, 0, 5, 8, 6, 10))
+_MT_FROM = np.array((0, 3, 0, 15, 0, 0, 0))
+_MT_TO = np.array((20, 30, 12, 20, 10, 15, 20))
+SAPTAVARGA = (1, 2, 3, 7, 9, 12, 30)
+# Баллы Саптаварджа по составному отношению -2..2 (заклятый враг .. большой друг); свой знак 30, мулатрикона 45
+_RELATION_POINTS = np.array((1.875, 3.75, 7.5, 15, 22.5))
+_NATURAL = np.array(FRIENDSHIP)
+_LORD = np.array(SIGN_LORD)
+# Временная дружба: управитель во 2, 3, 4, 10, 11, 12 доме от планеты
+_TEMPORAL = np.array([1 if house in (2, 3, 4, 10, 11, 12) else -1 for house in range(1, 13)])
+_EVEN_SIGN_PLANETS = np.array((False, True, False, False, False, True, False))  # Луна и Венера
+_KENDRADI = np.array((60, 30, 15))  # кендра, панапхара, апоклима
+_DREKKANA = np.array((0, 2, 0, 1, 0, 2, 1))  # мужские — первый деканат, средние — второй, женские — третий
+# Точка наибольшей Дигбалы от асцендента: 10-й дом, 4-й, 10-й, 1-й, 1-й, 4-й, 7-й
+_DIG_POINT = np.array((270, 90, 270, 0, 0, 90, 180), dtype=np.float64)
+NAISARGIKA = np.array((7, 6, 2, 3, 4, 5, 1)) * 60 / 7
+REQUIRED_RUPAS = np.array((5, 6, 5, 7, 6.5, 5.5, 5))
+# Пакша-бала: благие (Луна, Меркурий, Юпитер, Венера) сильнее к полнолунию, злые — к новолунию
+_PAKSHA_BENEFIC = np.array((False, True, False, True, True, True, False))
+# Натоннатха: +1 — сильны в полдень, -1 — в полночь, 0 — всегда (Меркурий)
+_NATHONNATA = np.array((1, -1, -1, 0, 1, 1, -1))
+_DAY_THIRDS = np.array((MERCURY, SUN, SATURN))
+_NIGHT_THIRDS = np.array((MOON, VENUS, MARS))
+# Айана-бала: знак склонения, с которым планета сильнее; 0 — Меркурий, по модулю
+_AYANA_SIGN = np.array((1, -1, 1, 0, 1, 1, -1))
+_CHALDEAN = np.array((SUN, VENUS, MERCURY, MOON, SATURN, JUPITER, MARS))
+_CHALDEAN_POS = np.argsort(_CHALDEAN)
+# Наибольшая прямая и попятная суточная скорость, °/сутки (для Солнца и Луны не используется)
+_SPEED_MAX = np.array((1, 1, 0.79, 2.20, 0.25, 1.26, 0.13))
+_SPEED_MIN = np.array((0, 0, -0.40, -1.38, -0.14, -0.64, -0.08))
+# Дришти (аспект) по углу от смотрящей планеты до планеты-цели, вирупа; особые аспекты — добавкой
+_DRISHTI_X = (0, 30, 60, 90, 120, 150, 180, 300, 360)
+_DRISHTI_Y = (0, 0, 15, 45, 30, 0, 60, 0, 0)
+_SPECIAL_DRISHTI = ((MARS, 15, ((90, 120), (210, 240))), (JUPITER, 30, ((120, 150), (240, 270))), (SATURN, 45, ((60, 90), (270, 300))))
+# Знак вклада в Дрик-балу: благие +, злые -; Луна — по пакше
+_DRIK_SIGN = np.array((-1, 1, -1, 1, 1, 1, -1))
+
+OBLIQUITY = 23.44          # наклон эклиптики; его изменение на вирупах не сказывается
+SUNRISE_ALTITUDE = -0.833  # высота центра Солнца на восходе с учётом рефракции и радиуса диска
+KALI_EPOCH_JDN = 588466    # 18.02.3102 до н. э., пятница — начало Кали-юги для ахарганы
+
+
+def _arc(a, b):
+    """Угловое расстояние 0..180."""
+    d = (a - b) % 360
+    return np.minimum(d, 360 - d)
+
+
+def _sthana(lons, asc):
+    n = len(lons)
+    signs = (lons // 30).astype(np.intp) % 12
+    deg = lons % 30
+    planets = np.arange(7)[None, :]
+    uchcha = _arc(lons, EXALTATION + 180) / 3
+    # Саптаварджа: достоинство в семи варгах по составной (природной + временной) дружбе с управителем
+    varga, _ = vargas.varga_signs(lons.ravel(), SAPTAVARGA)
+    varga = varga.reshape(n, 7, len(SAPTAVARGA))
+    lord = _LORD[varga]
+    lord_sign = np.take_along_axis(signs, lord.reshape(n, -1), axis=1).reshape(lord.shape)
+    relation = _NATURAL[planets[:, :, None], lord] + _TEMPORAL[(lord_sign - signs[:, :, None]) % 12]
+    points = np.where(lord == planets[:, :, None], 30.0, _RELATION_POINTS[relation + 2])
+    mulatrikona = (signs == _MT_SIGN) & (deg >= _MT_FROM) & (deg < _MT_TO)
+    points[:, :, 0] = np.where(mulatrikona, 45.0, points[:, :, 0])
+    # Оджа-югма: Луна и Венера сильны в чётных знаке и навамше, остальные — в нечётных
+    want_odd = ~_EVEN_SIGN_PLANETS[None, :]
+    navamsa = varga[:, :, SAPTAVARGA.index(9)]
+    ojha = 15 * ((signs % 2 == 0) == want_odd) + 15 * ((navamsa % 2 == 0) == want_odd)
+    house = (signs - (asc // 30).astype(np.intp)[:, None] % 12) % 12
+    kendradi = _KENDRADI[house % 3]
+    drekkana = 15 * ((deg // 10).astype(np.intp) == _DREKKANA)
+    return uchcha + points.sum(axis=2) + ojha + kendradi + drekkana
+
+
+def _sun_hour_angle(jd, lat, lon, sun_tropical):
+    """Часовой угол Солнца (-180..180) и полудуга дня (0 — полярная ночь, 180 — полярный день), градусы."""
+    eps = np.radians(OBLIQUITY)
+    lam = np.radians(sun_tropical)
+    ra = np.degrees(np.arctan2(np.cos(eps) * np.sin(lam), np.cos(lam)))
+    dec = np.arcsin(np.sin(eps) * np.sin(lam))
+    gmst = 280.46061837 + 360.98564736629 * (jd - 2451545.0)
+    hour_angle = (gmst + lon - ra + 180) % 360 - 180
+    phi = np.radians(lat)
+    cos_h0 = (np.sin(np.radians(SUNRISE_ALTITUDE)) - np.sin(phi) * np.sin(dec)) / (np.cos(phi) * np.cos(dec))
+    return hour_angle, np.degrees(np.arccos(np.clip(cos_h0, -1, 1)))
+
+
+def _kala(jd, lat, lon, tropical, paksha, ayana):
+    planets = np.arange(7)[None, :]
+    hour_angle, half_day = _sun_hour_angle(jd, lat, lon, tropical[:, SUN])
+    # Натоннатха: 60 в полдень для дневных планет, в полночь — для ночных
+    noon = (60 * (1 - np.abs(hour_angle) / 180))[:, None]
+    nathonnata = np.where(_NATHONNATA > 0, noon, np.where(_NATHONNATA < 0, 60 - noon, 60.0))
+    # Трибхага: управитель текущей трети дня или ночи; Юпитер — всегда
+    since_sunrise = (hour_angle + half_day) % 360
+    day = np.abs(hour_angle) < half_day
+    part = np.where(day, since_sunrise / np.maximum(2 * half_day, 1e-9),
+                    ((hour_angle - half_day) % 360) / np.maximum(360 - 2 * half_day, 1e-9))
+    third = np.minimum((part * 3).astype(np.intp), 2)
+    lord = np.where(day, _DAY_THIRDS[third], _NIGHT_THIRDS[third])
+    tribhaga = 60 * ((planets == lord[:, None]) | (planets == JUPITER))
+    # Управители года, месяца (360- и 30-дневных от эпохи Кали), дня и часа; день начинается с восхода
+    jdn = np.floor(jd - since_sunrise / 360 + lon / 360 + 0.5).astype(np.int64)
+    days = jdn - KALI_EPOCH_JDN
+    vara = (jdn + 1) % 7  # 0 — воскресенье (Солнце), порядок дней совпадает с PLANETS
+    abda = (jdn - days % 360 + 1) % 7
+    masa = (jdn - days % 30 + 1) % 7
+    hora = _CHALDEAN[(_CHALDEAN_POS[vara] + (since_sunrise // 15).astype(np.intp)) % 7]
+    lords = (15 * (planets == abda[:, None]) + 30 * (planets == masa[:, None])
+             + 45 * (planets == vara[:, None]) + 60 * (planets == hora[:, None]))
+    # Пакша Луны и Айана Солнца удваиваются
+    paksha = paksha * np.where(planets == MOON, 2, 1)
+    ayana = ayana * np.where(planets == SUN, 2, 1)
+    return nathonnata + tribhaga + lords + paksha + ayana
+
+
+def _drik(lons, waxing):
+    # angle[n, i, j] — от смотрящей планеты i до цели j
+    angle = (lons[:, None, :] - lons[:, :, None]) % 360
+    value = np.interp(angle, _DRISHTI_X, _DRISHTI_Y)
+    for planet, bonus, ranges in _SPECIAL_DRISHTI:
+        a = angle[:, planet]
+        value[:, planet] += bonus * np.logical_or.reduce([(a >= lo) & (a <= hi) for lo, hi in ranges])
+    sign = np.broadcast_to(_DRIK_SIGN, lons.shape).copy()
+    sign[:, MOON] = np.where(waxing, 1, -1)
+    return (value * sign[:, :, None]).sum(axis=1) / 4
+
+
+def compute(longitudes, speeds, ascendant, jd, lat, lon, ayanamsa):
+    """
+    longitudes, speeds — (N, 7) сидерические долготы и суточные скорости в порядке PLANETS;
+    ascendant (сидерический), jd (UT), lat, lon, ayanamsa (градусы) — (N,).
+    -> {"bhinna": (N, 7, 12), "sarva": (N, 12), компоненты SHADBALA и "total": (N, 7) вирупа}.
+    """
+    lons = np.asarray(longitudes, dtype=np.float64) % 360
+    speeds = np.asarray(speeds, dtype=np.float64)
+    asc = np.asarray(ascendant, dtype=np.float64) % 360
+    jd, lat, lon = (np.asarray(x, dtype=np.float64) for x in (jd, lat, lon))
+    tropical = lons + np.asarray(ayanamsa, dtype=np.float64)[:, None]
+
+    signs = np.concatenate([(lons // 30).astype(np.intp), (asc // 30).astype(np.intp)[:, None]], axis=1) % 12
+    bhinna, sarva = ashtakavarga(signs)
+
+    elongation = (lons[:, MOON] - lons[:, SUN]) % 360
+    moon_phase = _arc(lons[:, MOON], lons[:, SUN])[:, None] / 3
+    paksha = np.where(_PAKSHA_BENEFIC, moon_phase, 60 - moon_phase)
+    declination = np.degrees(np.arcsin(np.sin(np.radians(OBLIQUITY)) * np.sin(np.radians(tropical))))
+    ayana = (24 + np.where(_AYANA_SIGN == 0, np.abs(declination), _AYANA_SIGN * declination)) / 48 * 60
+    # Чешта: Солнца — его Айана-бала, Луны — Пакша-бала, остальных — по скорости
+    cheshta = np.clip(60 * (_SPEED_MAX - speeds) / (_SPEED_MAX - _SPEED_MIN), 0, 60)
+    cheshta[:, SUN] = ayana[:, SUN]
+    cheshta[:, MOON] = paksha[:, MOON]
+
+    result = {
+        "bhinna": bhinna,
+        "sarva": sarva,
+        "sthana": _sthana(lons, asc),
+        "dig": (180 - _arc(lons, asc[:, None] + _DIG_POINT)) / 3,
+        "kala": _kala(jd, lat, lon, tropical, paksha, ayana),
+        "cheshta": cheshta,
+        "naisargika": np.broadcast_to(NAISARGIKA, lons.shape),
+        "drik": _drik(lons, elongation < 180),
+    }
+    result["total"] = sum(result[name] for name in SHADBALA)
+    return result
+
+
+def chart_strength(data, n: int):
+    """JSON-секция strength для карты n из результата compute()."""
+    total = data["total"][n]
+    shadbala = {}
+    for p, planet in enumerate(PLANETS):
+        entry = {name: float(data[name][n, p]) for name in SHADBALA}
+        entry["total"] = float(total[p])
+        entry["rupas"] = float(total[p] / 60)
+        entry["required_rupas"] = float(REQUIRED_RUPAS[p])
+        entry["ratio"] = float(total[p] / 60 / REQUIRED_RUPAS[p])
+        shadbala[planet] = entry
+    return {
+        "ashtakavarga": {
+            "bhinna": dict(zip(PLANETS, data["bhinna"][n].tolist())),
+            "sarva": data["sarva"][n].tolist(),
+        },
+        "shadbala": shadbala,
+    }
@@ -0,0 +1,290 @@
+"""
+Временные зоны без внешних сервисов: IANA-зона по координатам и быстрая локализация времени.
+
+1. TimezoneIndex — сетка ячеек cell° по полигонам timezone-boundary-builder.
+   Ячейка, целиком лежащая в одной зоне, хранит номер зоны; граничная — список зон-кандидатов.
+   Для граничной ячейки точка проверяется лучом вдоль широты (чёт-нечет) только по рёбрам
+   кандидата в этой строке сетки — рёбра заранее разложены по (строка, зона).
+   Индекс собирается один раз офлайн и загружается при старте:
+       python tz_index.py build --geojson timezones-with-oceans.geojson.zip --out data/tz_index.npz
+       python tz_index.py lookup --index data/tz_index.npz 55.75 37.62
+
+2. ZoneTable — таблица переходов UTC-смещения зоны pytz (кэшируется на зону).
+   Местное время -> UTC — бинарный поиск по местным началам периодов; неоднозначное
+   и несуществующее время таблица не решает (возвращает None), его разбирает вызывающий код.
+"""
+import argparse
+import bisect
+import io
+import json
+import threading
+import time
+import zipfile
+from datetime import datetime
+
+import numpy as np
+import pytz
+
+EPOCH = datetime(1970, 1, 1)
+
+
+# --- Таблицы переходов ---
+class ZoneTable:
+    def __init__(self, tz):
+        self.tz = tz
+        transitions = getattr(tz, "_utc_transition_times", None)
+        if not transitions:
+            # UTC и постоянные смещения: переходов нет
+            self.fixed = tz
+            return
+        self.fixed = None
+        self.utc_starts = [(t - EPOCH).total_seconds() for t in transitions]
+        self.offsets = [info[0].total_seconds() for info in tz._transition_info]
+        self.local_starts = [u + o for u, o in zip(self.utc_starts, self.offsets)]
+        self.tzinfos = [tz._tzinfos[info] for info in tz._transition_info]
+
+    def localize(self, dt_local: datetime):
+        """Локализованный datetime (как tz.localize) или None для неоднозначного/несуществующего времени."""
+        if self.fixed is not None:
+            return self.fixed.localize(dt_local)
+        seconds = (dt_local - EPOCH).total_seconds()
+        i = bisect.bisect_right(self.local_starts, seconds) - 1
+        found = None
+        for k in (i - 1, i):
+            if k < 0:
+                continue
+            utc = seconds - self.offsets[k]
+            if self.utc_starts[k] <= utc and (k + 1 == len(self.utc_starts) or utc < self.utc_starts[k + 1]):
+                if found is not None:
+                    return None
+                found = k
+        if found is None:
+            return None
+        return dt_local.replace(tzinfo=self.tzinfos[found])
+
+
+_zone_tables = {}
+_zone_lock = threading.Lock()
+
+
+def zone_table(tz) -> ZoneTable:
+    table = _zone_tables.get(tz.zone)
+    if table is None:
+        with _zone_lock:
+            table = _zone_tables.get(tz.zone)
+            if table is None:
+                table = _zone_tables[tz.zone] = ZoneTable(tz)
+    return table
+
+
+def get_timezone(name: str):
+    """pytz.timezone с кэшем по точному имени (без нормализации строки на каждый вызов)."""
+    table = _zone_tables.get(name)
+    if table is not None:
+        return table.tz
+    tz = pytz.timezone(name)
+    with _zone_lock:
+        _zone_tables.setdefault(tz.zone, ZoneTable(tz))
+        _zone_tables.setdefault(name, _zone_tables[tz.zone])
+    return tz
+
+
+# --- Пространственный индекс ---
+class TimezoneIndex:
+    def __init__(self, path: str):
+        with np.load(path, allow_pickle=False) as data:
+            self.cell = float(data["cell"])
+            self.zones = [str(z) for z in data["zones"]]
+            self.grid = data["grid"]
+            self.cand_ptr = data["cand_ptr"]
+            self.cand_zone = data["cand_zone"]
+            self.bucket_ptr = data["bucket_ptr"]
+            self.edges = data["edges"]
+        self.path = path
+        self.rows, self.cols = self.grid.shape
+        self.n_zones = len(self.zones)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.grid, self.cand_ptr, self.cand_zone, self.bucket_ptr, self.edges))
+
+    def _inside(self, zone: int, row: int, lat: float, lon: float) -> bool:
+        k = row * self.n_zones + zone
+        e = self.edges[self.bucket_ptr[k]:self.bucket_ptr[k + 1]]
+        x0, y0, x1, y1 = e[:, 0], e[:, 1], e[:, 2], e[:, 3]
+        spans = (y0 > lat) != (y1 > lat)
+        x0, y0, x1, y1 = x0[spans], y0[spans], x1[spans], y1[spans]
+        x_cross = x0 + (lat - y0) * (x1 - x0) / (y1 - y0)
+        return bool(np.count_nonzero(x_cross > lon) % 2)
+
+    def lookup(self, lat: float, lon: float):
+        """Имя IANA-зоны для точки или None, если точка вне всех полигонов."""
+        row = min(max(int((lat + 90.0) / self.cell), 0), self.rows - 1)
+        col = min(max(int(((lon + 180.0) % 360.0) / self.cell), 0), self.cols - 1)
+        lon = (lon + 180.0) % 360.0 - 180.0
+        g = int(self.grid[row, col])
+        if g >= 0:
+            return self.zones[g]
+        if g == -1:
+            return None
+        k = -g - 2
+        candidates = self.cand_zone[self.cand_ptr[k]:self.cand_ptr[k + 1]]
+        for zone in candidates:
+            if self._inside(int(zone), row, lat, lon):
+                return self.zones[zone]
+        # Точка в щели между полигонами (погрешность упрощения) — первый кандидат
+        return self.zones[candidates[0]] if len(candidates) else None
+
+
+# --- Сборка индекса из GeoJSON ---
+def _read_geojson(path: str):
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path) as z:
+            name = next(n for n in z.namelist() if n.endswith("json"))
+            with z.open(name) as f:
+                return json.load(io.TextIOWrapper(f, encoding="utf-8"))
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _rings(geometry):
+    if geometry["type"] == "Polygon":
+        yield from geometry["coordinates"]
+    elif geometry["type"] == "MultiPolygon":
+        for polygon in geometry["coordinates"]:
+            yield from polygon
+
+
+def build(geojson_path: str, out: str, cell: float = 0.25, precision: float = 0.001):
+    """
+    precision — шаг округления вершин в градусах (0.001° ≈ 100 м): соседние совпавшие
+    вершины выкидываются, это сокращает береговые линии в разы.
+    """
+    t0 = time.perf_counter()
+    features = _read_geojson(geojson_path)["features"]
+    zones = sorted({f["properties"]["tzid"] for f in features})
+    zone_ids = {z: i for i, z in enumerate(zones)}
+    nz = len(zones)
+    rows, cols = int(round(180 / cell)), int(round(360 / cell))
+
+    parts = []
+    for feature in features:
+        zone = zone_ids[feature["properties"]["tzid"]]
+        for ring in _rings(feature["geometry"]):
+            pts = np.round(np.asarray(ring, dtype=np.float64)[:, :2] / precision) * precision
+            keep = np.ones(len(pts), dtype=bool)
+            keep[1:] = np.any(pts[1:] != pts[:-1], axis=1)
+            pts = pts[keep]
+            if len(pts) < 3:
+                continue
+            if np.any(pts[0] != pts[-1]):
+                pts = np.vstack([pts, pts[:1]])
+            seg = np.empty((len(pts) - 1, 5))
+            seg[:, 0:2], seg[:, 2:4], seg[:, 4] = pts[:-1], pts[1:], zone
+            parts.append(seg)
+    seg = np.concatenate(parts)
+    print(f"зон: {nz}, рёбер: {len(seg)}, {time.perf_counter() - t0:.1f} c")
+
+    # Рёбра по строкам сетки: ребро попадает во все строки, которые пересекает по широте
+    y_lo = np.minimum(seg[:, 1], seg[:, 3])
+    y_hi = np.maximum(seg[:, 1], seg[:, 3])
+    r0 = np.clip(((y_lo + 90) / cell).astype(np.int64), 0, rows - 1)
+    r1 = np.clip(((y_hi + 90) / cell).astype(np.int64), 0, rows - 1)
+    counts = r1 - r0 + 1
+    edge_of = np.repeat(np.arange(len(seg)), counts)
+    row_of = r0[edge_of] + (np.arange(len(edge_of)) - np.repeat(np.cumsum(counts) - counts, counts))
+    zone_of = seg[edge_of, 4].astype(np.int64)
+    bucket = row_of * nz + zone_of
+    order = np.argsort(bucket, kind="stable")
+    edge_of, row_of, zone_of, bucket = edge_of[order], row_of[order], zone_of[order], bucket[order]
+    bucket_ptr = np.zeros(rows * nz + 1, dtype=np.int64)
+    np.cumsum(np.bincount(bucket, minlength=rows * nz), out=bucket_ptr[1:])
+    edges = seg[edge_of, :4].astype(np.float32)
+
+    # Граничные ячейки: все, через которые проходит ребро (часть ребра внутри полосы строки)
+    band_lo = row_of * cell - 90
+    band_hi = band_lo + cell
+    x0, y0, x1, y1 = (seg[edge_of, i] for i in range(4))
+    dy = np.where(y1 == y0, 1.0, y1 - y0)
+    t_lo = np.clip((band_lo - y0) / dy, 0, 1)
+    t_hi = np.clip((band_hi - y0) / dy, 0, 1)
+    t_lo = np.where(y1 == y0, 0.0, t_lo)
+    t_hi = np.where(y1 == y0, 1.0, t_hi)
+    xa, xb = x0 + t_lo * (x1 - x0), x0 + t_hi * (x1 - x0)
+    c0 = np.clip(((np.minimum(xa, xb) + 180) / cell).astype(np.int64), 0, cols - 1)
+    c1 = np.clip(((np.maximum(xa, xb) + 180) / cell).astype(np.int64), 0, cols - 1)
+    counts = c1 - c0 + 1
+    pair = np.repeat(np.arange(len(c0)), counts)
+    col_of = c0[pair] + (np.arange(len(pair)) - np.repeat(np.cumsum(counts) - counts, counts))
+    edge_pairs = (row_of[pair] * cols + col_of) * nz + zone_of[pair]
+    boundary = np.unique(edge_pairs // nz)
+
+    grid = np.full((rows, cols), -1, dtype=np.int32)
+    grid.flat[boundary] = -2
+    # Внутренние ячейки: между граничными в строке зона не меняется — проверяем одну точку на отрезок.
+    # Для граничных ячеек зоны, в которых лежит центр, тоже кандидаты (если полигоны перекрываются,
+    # у нижнего в ячейке может не быть рёбер).
+    center_pairs = []
+    for row in range(rows):
+        lo, hi = bucket_ptr[row * nz], bucket_ptr[(row + 1) * nz]
+        if lo == hi:
+            continue
+        lat = row * cell - 90 + cell / 2
+        e = edges[lo:hi].astype(np.float64)
+        z = zone_of[lo:hi]
+        spans = (e[:, 1] > lat) != (e[:, 3] > lat)
+        e, z = e[spans], z[spans]
+        x_cross = e[:, 0] + (lat - e[:, 1]) * (e[:, 2] - e[:, 0]) / (e[:, 3] - e[:, 1])
+        free = np.flatnonzero(grid[row] == -1)
+        if len(free):
+            starts = free[np.concatenate(([True], np.diff(free) > 1))]
+            ends = free[np.concatenate((np.diff(free) > 1, [True]))]
+            for start, end in zip(starts, ends):
+                odd = np.flatnonzero(np.bincount(z[x_cross > start * cell - 180 + cell / 2], minlength=nz) % 2)
+                if len(odd):
+                    grid[row, start:end + 1] = odd[0]
+        for col in np.flatnonzero(grid[row] == -2):
+            odd = np.flatnonzero(np.bincount(z[x_cross > col * cell - 180 + cell / 2], minlength=nz) % 2)
+            center_pairs.append((row * cols + col) * nz + odd)
+
+    cell_zone = np.unique(np.concatenate([edge_pairs] + center_pairs))
+    cell_of, cand_zone = cell_zone // nz, cell_zone % nz
+    boundary, first = np.unique(cell_of, return_index=True)
+    cand_ptr = np.append(first, len(cell_of))
+    grid.flat[boundary] = -(np.arange(len(boundary)) + 2)
+
+    np.savez_compressed(
+        out,
+        cell=np.float64(cell),
+        zones=np.array(zones),
+        grid=grid,
+        cand_ptr=cand_ptr.astype(np.int32),
+        cand_zone=cand_zone.astype(np.int16),
+        bucket_ptr=bucket_ptr.astype(np.int32),
+        edges=edges,
+    )
+    print(f"сетка {rows}x{cols}, граничных ячеек: {len(boundary)}, рёбер в индексе: {len(edges)}, "
+          f"{time.perf_counter() - t0:.1f} c -> {out}")
+
+
+def _main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_build = sub.add_parser("build")
+    p_build.add_argument("--geojson", required=True, help="timezones(-with-oceans).geojson или .zip из timezone-boundary-builder")
+    p_build.add_argument("--out", default="data/tz_index.npz")
+    p_build.add_argument("--cell", type=float, default=0.25)
+    p_build.add_argument("--precision", type=float, default=0.001)
+    p_lookup = sub.add_parser("lookup")
+    p_lookup.add_argument("--index", default="data/tz_index.npz")
+    p_lookup.add_argument("lat", type=float)
+    p_lookup.add_argument("lon", type=float)
+    args = parser.parse_args()
+    if args.cmd == "build":
+        build(args.geojson, args.out, args.cell, args.precision)
+    else:
+        print(TimezoneIndex(args.index).lookup(args.lat, args.lon))
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,120 @@
+"""
+Движок дробных карт (варг) D1–D60.
+
+Для каждой варги заранее строится таблица: (знак 0..11, номер части) -> знак варги.
+Расчёт для всех тел и всех запрошенных варг — одна индексация NumPy по сетке
+тела × варги, без циклов по планетам.
+
+Номер части считается как deg_in_sign // (30 / D) — так же, как в calc_navamsa.
+Кету считается по своей долготе (Раху + 180°), как и все тела: в D9 он сам выходит
+напротив Раху, а в D2 и D30 знак противоположный Раху получиться и не может.
+"""
+import numpy as np
+
+# Шодашаварга (16 варг) в порядке возрастания
+SHODASHAVARGA = (1, 2, 3, 4, 7, 9, 10, 12, 16, 20, 24, 27, 30, 40, 45, 60)
+MAX_PARTS = 60
+
+# Тримшамша (D30): границы в градусах и знаки для нечётных и чётных знаков
+_D30_ODD = ((5, 0), (10, 10), (18, 8), (25, 2), (30, 6))   # Овен, Водолей, Стрелец, Близнецы, Весы
+_D30_EVEN = ((5, 1), (12, 5), (20, 11), (25, 9), (30, 7))  # Телец, Дева, Рыбы, Козерог, Скорпион
+
+
+def _varga_sign(division: int, sign: int, part: int) -> int:
+    odd = sign % 2 == 0          # Овен (0) — нечётный знак
+    quality = sign % 3           # 0 — подвижный, 1 — фиксированный, 2 — двойственный
+    if division == 1:
+        return sign
+    if division == 2:
+        # Хора: в нечётных знаках первая половина — Лев, вторая — Рак; в чётных наоборот
+        return (4, 3)[part] if odd else (3, 4)[part]
+    if division == 3:
+        return (sign + 4 * part) % 12
+    if division == 4:
+        return (sign + 3 * part) % 12
+    if division == 7:
+        return (sign + part + (0 if odd else 6)) % 12
+    if division == 9:
+        return (sign * 9 + part) % 12
+    if division == 10:
+        return (sign + part + (0 if odd else 8)) % 12
+    if division == 12:
+        return (sign + part) % 12
+    if division == 16:
+        return ((0, 4, 8)[quality] + part) % 12
+    if division == 20:
+        return ((0, 8, 4)[quality] + part) % 12
+    if division == 24:
+        return ((4 if odd else 3) + part) % 12
+    if division == 27:
+        return (sign * 27 + part) % 12
+    if division == 30:
+        # part здесь — целый градус 0..29
+        for limit, varga in (_D30_ODD if odd else _D30_EVEN):
+            if part < limit:
+                return varga
+    if division == 40:
+        return ((0 if odd else 6) + part) % 12
+    if division == 45:
+        return ((0, 4, 8)[quality] + part) % 12
+    if division == 60:
+        return (sign + part) % 12
+    raise ValueError(f"Неподдерживаемая варга D{division}")
+
+
+def _build_tables():
+    tables = np.zeros((len(SHODASHAVARGA), 12, MAX_PARTS), dtype=np.int8)
+    for k, division in enumerate(SHODASHAVARGA):
+        for sign in range(12):
+            for part in range(division):
+                tables[k, sign, part] = _varga_sign(division, sign, part)
+    return tables
+
+
+def _check_tables(tables):
+    # Хора даёт только Рак или Лев, Тримшамша — никогда их (у Луны и Солнца нет долей D30)
+    d2 = tables[_INDEX[2], :, :2]
+    d30 = tables[_INDEX[30], :, :30]
+    if not np.isin(d2, (3, 4)).all():
+        raise RuntimeError("таблица D2: знак вне Рака и Льва")
+    if np.isin(d30, (3, 4)).any():
+        raise RuntimeError("таблица D30: знак Рак или Лев")
+
+
+_INDEX = {division: k for k, division in enumerate(SHODASHAVARGA)}
+_TABLES = _build_tables()
+_check_tables(_TABLES)
+_DIVISIONS = np.array(SHODASHAVARGA, dtype=np.float64)
+
+
+def parse_divisions(spec: str):
+    """'D2,D9', '2,9' или 'all' -> кортеж делителей в порядке SHODASHAVARGA."""
+    spec = spec.strip().lower()
+    if spec in ("all", "shodashavarga"):
+        return SHODASHAVARGA
+    divisions = set()
+    for item in spec.split(","):
+        item = item.strip().lstrip("d")
+        if not item:
+            continue
+        division = int(item)
+        if division not in _INDEX:
+            raise ValueError(f"Неподдерживаемая варга D{division}, доступны: {', '.join(f'D{d}' for d in SHODASHAVARGA)}")
+        divisions.add(division)
+    return tuple(d for d in SHODASHAVARGA if d in divisions)
+
+
+def varga_signs(longitudes, divisions):
+    """
+    longitudes — долготы тел (N,), divisions — делители (K,).
+    Возвращает (знаки варг (N, K), номера частей (N, K)).
+    """
+    lon = np.asarray(longitudes, dtype=np.float64)
+    k = np.array([_INDEX[d] for d in divisions], dtype=np.intp)
+    sign = (lon // 30).astype(np.intp) % 12
+    deg = lon % 30
+    # Для D30 части — целые градусы, поэтому шаг 30/30 = 1° подходит и ему
+    parts = np.floor_divide(deg[:, None], 30.0 / _DIVISIONS[k][None, :]).astype(np.intp)
+    parts = np.minimum(parts, _DIVISIONS[k].astype(np.intp)[None, :] - 1)
+    signs = _TABLES[k[None, :], sign[:, None], parts].astype(np.intp)
+    return signs, parts